@@ -0,0 +1,86 @@
+"""
+Direct authoritative resolution of the pub.3gppnetwork.org realms.
+
+Every NAPTR name of the sweep lives in one zone. Instead of asking public
+recursive resolvers, which add a recursion hop and rate-limit thousands of
+near-identical queries, find that zone's authoritative servers once and
+send the NAPTR queries straight to them. The delegation itself (the SOA
+walk, the NS set and the server addresses) is looked up through the
+recursive resolvers and lands in the shared persistent cache, so later runs
+reuse it until its TTL runs out.
+
+The SRV targets that the NAPTR records point to live in other zones, so the
+SRV step still goes through the recursive resolvers. Scores and metrics
+are shared between both sets of servers.
+
+A realm delegated to nameservers of its own gets a referral (NS records in
+the authority section, no AA flag) rather than an answer. That is not
+NODATA: the NAPTR lookup of such a realm is passed on to the recursive
+resolvers, which follow the delegation.
+"""
+
+import logging
+
+import dns.exception
+import dns.name
+import dns.resolver
+
+from lookup_engine import LookupEngine
+from realms import REALM_SUFFIX
+
+log = logging.getLogger(__name__)
+
+
+def find_authoritative_servers(resolvers, name=REALM_SUFFIX):
+    """
+    Find the zone that contains *name* and the IPv4 addresses of its authoritative servers.
+
+    Args:
+        resolvers (list): Recursive resolvers to look the delegation up with, tried in order.
+        name (str, optional): Name whose zone to find.
+
+    Returns:
+        tuple: Zone name, and a sorted list of server addresses (empty if the lookup failed).
+    """
+    for resolver in resolvers:
+        try:
+            zone = dns.resolver.zone_for_name(name, resolver=resolver)
+            nameservers = resolver.resolve(zone, 'NS')
+            addresses = set()
+            for rdata in nameservers:
+                try:
+                    addresses.update(a.address for a in resolver.resolve(rdata.target, 'A'))
+                except dns.exception.DNSException as e:
+                    log.warning("Could not resolve nameserver %s: %s", rdata.target, e)
+            if addresses:
+                zone = zone.to_text(omit_final_dot=True)
+                log.info("Authoritative servers for %s (zone %s): %s", name, zone, ', '.join(sorted(addresses)))
+                return zone, sorted(addresses)
+        except dns.exception.DNSException as e:
+            log.warning("Could not find the authoritative servers of %s via %s: %s",
+                        name, resolver.nameservers[0], e)
+    return None, []
+
+
+def authoritative_engine(servers=None, port=53, **engine_args):
+    """
+    Build a lookup engine that sends NAPTR queries straight to the authoritative servers.
+
+    Args:
+        servers (list, optional): Authoritative server addresses; discovered with
+            find_authoritative_servers() if not given, e.g. to point at a local stand-in.
+        port (int, optional): Port the authoritative servers listen on.
+        **engine_args: Further LookupEngine arguments (qps, per_server_limit, hedge, metrics, ...).
+
+    Returns:
+        LookupEngine: Engine over the authoritative servers, resolving SRV targets through a
+        recursive engine, or the recursive engine itself if no authoritative server was found.
+    """
+    recursive = LookupEngine(**engine_args)
+    if not servers:
+        _, servers = find_authoritative_servers(recursive.scores.order(recursive.resolvers))
+    if not servers:
+        log.warning("No authoritative servers found, falling back to the recursive resolvers.")
+        return recursive
+    engine_args.update(metrics=recursive.metrics, scores=recursive.scores)
+    return LookupEngine(servers=servers, port=port, srv_engine=recursive, **engine_args)
@@ -0,0 +1,503 @@
+"""
+Offline throughput benchmark against a local stand-in for the realm nameservers.
+
+The sweeps normally talk to public recursive resolvers, so their speed
+depends on the network and on other people's rate limits. This script
+starts a local nameserver that answers for synthetic zones instead and
+runs the sweep entry points against it through a regular LookupEngine:
+
+- check_realm_existence: main.py's one-realm-at-a-time synchronous path (test.py uses the same)
+- sweep: main.py's asyncio sweep, sweep_mcc_mnc_async()
+- domains: domains.py's create_json_dict_for_domains()
+
+A configurable share of the realms exists, with a NAPTR record pointing at
+one of a few shared identity providers (so SRV and address deduplication
+is exercised like in the real data). The others get NXDOMAIN. Every answer
+can be delayed, and a share of queries can be dropped (UDP only) or
+answered with SERVFAIL. Hits are chosen by a hash of the name, so every
+run probes the same realms. Drops and SERVFAILs are random, seeded with
+--seed. Each benchmark gets a fresh engine with an empty, throwaway cache,
+so results are never served from the persistent cache, and the resolver
+scores of the real sweeps are left alone.
+
+For each benchmark the report gives the wall time, queries per second and
+exact p50/p99 query latency. --min-qps turns it into a regression guard
+that exits with status 1 when a benchmark gets slower than that.
+
+Usage:
+    python bench.py [--realms 2000] [--hit-ratio 0.01] [--latency 0.005] [--loss 0.01] [--servfail 0.01]
+                    [--benchmark sweep --benchmark domains] [--transport tcp] [--min-qps 500]
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import math
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import dns.flags
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+from checkpoint import write_json_atomic
+from dns_cache import PersistentCache
+from domains import create_json_dict_for_domains
+from logconfig import add_logging_arguments, setup_logging_from_args
+from lookup_engine import DEFAULT_CONCURRENCY, DEFAULT_LIFETIME, DEFAULT_PER_SERVER_LIMIT, LookupEngine
+from main import check_realm_existence, sweep_mcc_mnc_async
+from metrics import SweepMetrics
+from realms import build_realms, candidate_pairs
+from scoring import ResolverScores
+from transport import TRANSPORTS
+
+log = logging.getLogger(__name__)
+
+# Reserved domain (RFC 2606) the synthetic identity providers live under
+IDP_DOMAIN = dns.name.from_text('radsec.example.')
+RADSEC_PORT = 2083
+# TTLs of the synthetic answers and of negative answers (SOA minimum)
+ANSWER_TTL = 300
+NEGATIVE_TTL = 3600
+# Percentiles in the report
+REPORT_PERCENTILES = (0.5, 0.99)
+
+
+class SyntheticZone:
+    """
+    Answers for the synthetic realms and identity providers, with injected faults.
+    """
+
+    def __init__(self, hit_ratio=0.01, servfail_ratio=0.0, loss_ratio=0.0, latency=0.0, jitter=0.0,
+                 idps=16, seed=None):
+        """
+        Args:
+            hit_ratio (float, optional): Share of the names that have a RadSec NAPTR record.
+            servfail_ratio (float, optional): Share of the queries answered with SERVFAIL.
+            loss_ratio (float, optional): Share of the UDP queries left unanswered.
+            latency (float, optional): Seconds every answer is delayed by.
+            jitter (float, optional): Up to this many seconds are added to the delay at random.
+            idps (int, optional): Number of identity providers the existing realms share.
+            seed (int, optional): Seed for the random faults and jitter.
+        """
+        self.hit_ratio = hit_ratio
+        self.servfail_ratio = servfail_ratio
+        self.loss_ratio = loss_ratio
+        self.latency = latency
+        self.jitter = jitter
+        self.idps = idps
+        self.random = random.Random(seed)
+        self.queries = 0
+        self.dropped = 0
+        self.servfails = 0
+
+    def is_hit(self, name):
+        """
+        Args:
+            name (dns.name.Name): Queried name.
+
+        Returns:
+            bool: True if the name is one of the existing realms, the same for every run.
+        """
+        return zlib.crc32(name.to_text().lower().encode('utf-8')) < self.hit_ratio * 2 ** 32
+
+    def idp(self, name):
+        """
+        Returns:
+            dns.name.Name: Identity provider a hit realm's NAPTR record points at.
+        """
+        index = zlib.crc32(name.to_text().lower().encode('utf-8')[::-1]) % self.idps
+        return dns.name.Name((f"idp{index}".encode('ascii'),)) + IDP_DOMAIN
+
+    def _negative(self, response, qname, rcode):
+        # Negative answers carry the SOA of an enclosing zone, so they can be cached (RFC 2308)
+        zone = IDP_DOMAIN if qname.is_subdomain(IDP_DOMAIN) else dns.name.Name(qname.labels[-3:])
+        response.set_rcode(rcode)
+        response.authority.append(dns.rrset.from_text(
+            zone, NEGATIVE_TTL, 'IN', 'SOA', f"ns.{zone} hostmaster.{zone} 1 3600 600 86400 {NEGATIVE_TTL}"))
+
+    def answer(self, request):
+        """
+        Build the answer to one query, without faults.
+
+        Args:
+            request (dns.message.Message): Query.
+
+        Returns:
+            dns.message.Message: Authoritative response.
+        """
+        response = dns.message.make_response(request)
+        response.flags |= dns.flags.AA
+        if not request.question:
+            response.set_rcode(dns.rcode.FORMERR)
+            return response
+        qname, rdtype = request.question[0].name, request.question[0].rdtype
+        if qname.is_subdomain(IDP_DOMAIN):
+            labels = qname.relativize(IDP_DOMAIN).labels
+            if not labels or not labels[-1].startswith(b'idp'):
+                self._negative(response, qname, dns.rcode.NXDOMAIN)
+            elif labels[:-1] == (b'_radsec', b'_tcp') and rdtype == dns.rdatatype.SRV:
+                host = dns.name.Name(labels[-1:]) + IDP_DOMAIN
+                response.answer.append(dns.rrset.from_text(qname, ANSWER_TTL, 'IN', 'SRV',
+                                                           f"0 0 {RADSEC_PORT} {host}"))
+            elif len(labels) == 1 and rdtype in (dns.rdatatype.A, dns.rdatatype.AAAA):
+                index = int(labels[0][3:] or 0) % 250 + 1
+                address = f"192.0.2.{index}" if rdtype == dns.rdatatype.A else f"2001:db8::{index:x}"
+                response.answer.append(dns.rrset.from_text(qname, ANSWER_TTL, 'IN', rdtype, address))
+            else:
+                self._negative(response, qname, dns.rcode.NOERROR)
+        elif self.is_hit(qname):
+            if rdtype == dns.rdatatype.NAPTR:
+                target = dns.name.from_text('_radsec._tcp', self.idp(qname))
+                response.answer.append(dns.rrset.from_text(
+                    qname, ANSWER_TTL, 'IN', 'NAPTR', f'50 50 "s" "aaa+auth:radius.tls.tcp" "" {target}'))
+            else:
+                self._negative(response, qname, dns.rcode.NOERROR)
+        else:
+            self._negative(response, qname, dns.rcode.NXDOMAIN)
+        return response
+
+    def respond(self, wire, lossy=True):
+        """
+        Answer one query in wire format, injecting the configured faults.
+
+        Args:
+            wire (bytes): Query.
+            lossy (bool, optional): Whether the query may be dropped; False for TCP.
+
+        Returns:
+            tuple: Response in wire format (None if the query is dropped) and the seconds to
+            wait before sending it.
+        """
+        self.queries += 1
+        try:
+            request = dns.message.from_wire(wire)
+        except Exception:
+            return None, 0
+        if lossy and self.random.random() < self.loss_ratio:
+            self.dropped += 1
+            return None, 0
+        if self.random.random() < self.servfail_ratio:
+            self.servfails += 1
+            response = dns.message.make_response(request)
+            response.set_rcode(dns.rcode.SERVFAIL)
+        else:
+            response = self.answer(request)
+        return response.to_wire(), self.latency + self.random.random() * self.jitter
+
+    def counters(self):
+        """
+        Returns:
+            dict: Queries received, dropped and answered with SERVFAIL so far.
+        """
+        return {'queries': self.queries, 'dropped': self.dropped, 'servfail': self.servfails}
+
+
+class MockNameserver:
+    """
+    Serves a SyntheticZone over UDP and TCP from an event loop in a background thread.
+    """
+
+    def __init__(self, zone, host='127.0.0.1', port=0):
+        """
+        Args:
+            zone (SyntheticZone): Answers to serve.
+            host (str, optional): Address to listen on.
+            port (int, optional): Port for both UDP and TCP, a free one if 0.
+        """
+        self.zone = zone
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        """
+        Start serving.
+
+        Returns:
+            int: Port the server listens on.
+
+        Raises:
+            OSError: The address or port is not available.
+        """
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(ready,), name=f"mockdns-{self.host}", daemon=True)
+        self.thread.start()
+        ready.wait()
+        if self.error:
+            raise self.error
+        return self.port
+
+    def stop(self):
+        """Stop serving and wait for the background thread."""
+        if self.loop and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def _run(self, ready):
+        self.loop = asyncio.new_event_loop()
+        try:
+            udp, tcp = self.loop.run_until_complete(self._listen())
+        except OSError as e:
+            self.error = e
+            ready.set()
+            self.loop.close()
+            return
+        ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            udp.close()
+            tcp.close()
+            self.loop.close()
+
+    async def _listen(self):
+        udp, _ = await self.loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=(self.host, self.port))
+        self.port = udp.get_extra_info('sockname')[1]
+        try:
+            tcp = await asyncio.start_server(self._serve_stream, self.host, self.port)
+        except OSError:
+            udp.close()
+            raise
+        return udp, tcp
+
+    def reply(self, wire, send, lossy=True):
+        """
+        Answer one query through *send*, after the zone's latency.
+
+        Args:
+            wire (bytes): Query.
+            send (callable): Called with the response in wire format.
+            lossy (bool, optional): Whether the query may be dropped.
+        """
+        response, delay = self.zone.respond(wire, lossy)
+        if response is None:
+            return
+        if delay:
+            self.loop.call_later(delay, send, response)
+        else:
+            send(response)
+
+    async def _serve_stream(self, reader, writer):
+        # Pipelined like a real server: answers go out as they are ready, in any order
+        def send(response):
+            if not writer.is_closing():
+                writer.write(struct.pack('!H', len(response)) + response)
+
+        try:
+            while True:
+                length, = struct.unpack('!H', await reader.readexactly(2))
+                self.reply(await reader.readexactly(length), send, lossy=False)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.server.reply(data, lambda response: self.transport.sendto(response, addr))
+
+
+class SampledMetrics(SweepMetrics):
+    """
+    SweepMetrics that also keeps every latency sample, for exact percentiles.
+    """
+
+    def __init__(self, name='bench'):
+        super().__init__(name)
+        self.samples = []
+
+    def observe(self, server, rdtype, status, seconds):
+        super().observe(server, rdtype, status, seconds)
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, pct):
+        """
+        Args:
+            pct (float): Percentile between 0 and 1.
+
+        Returns:
+            float: Nearest-rank percentile of the query latencies in seconds, or None without samples.
+        """
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        return samples[max(0, math.ceil(pct * len(samples)) - 1)]
+
+
+def synthetic_entries(count):
+    """
+    Build MCC-MNC entries for the first *count* candidate PLMNs.
+
+    Args:
+        count (int): Number of entries.
+
+    Returns:
+        dict: Entries keyed by PLMN ID, shaped like those of data/mccmnc.json.
+    """
+    return {f"{mcc:03d}{mnc:03d}": {'MCC': f"{mcc:03d}", 'MNC': f"{mnc:03d}"}
+            for mcc, mnc in itertools.islice(candidate_pairs(), count)}
+
+
+def bench_check_realm_existence(entries, engine, concurrency):
+    for value in entries.values():
+        check_realm_existence(int(value['MCC']), int(value['MNC']), engine)
+
+
+def bench_sweep(entries, engine, concurrency):
+    asyncio.run(sweep_mcc_mnc_async(entries, engine, concurrency=concurrency))
+
+
+def bench_domains(entries, engine, concurrency):
+    domains = build_realms([int(value['MCC']) for value in entries.values()],
+                           [int(value['MNC']) for value in entries.values()], use_pub=True)
+    create_json_dict_for_domains(domains, engine, {}, concurrency=concurrency)
+
+
+# Entry points under test, each called as benchmark(entries, engine, concurrency)
+BENCHMARKS = {
+    'check_realm_existence': bench_check_realm_existence,
+    'sweep': bench_sweep,
+    'domains': bench_domains,
+}
+
+
+def run_benchmark(name, entries, zone, servers, port, concurrency=DEFAULT_CONCURRENCY, **engine_options):
+    """
+    Run one benchmark with a fresh engine and an empty, throwaway cache.
+
+    Args:
+        name (str): Key of BENCHMARKS.
+        entries (dict): MCC-MNC entries to resolve, see synthetic_entries().
+        zone (SyntheticZone): Zone the mock nameservers serve, for its fault counters.
+        servers (list): Addresses of the mock nameservers.
+        port (int): Port the mock nameservers listen on.
+        concurrency (int, optional): Global limit on realms being resolved at once.
+        **engine_options: Passed on to LookupEngine, e.g. qps or transport.
+
+    Returns:
+        dict: Wall time, query count, queries per second, latency percentiles and outcomes.
+    """
+    metrics = SampledMetrics(f"bench_{name}")
+    before = zone.counters()
+    with tempfile.TemporaryDirectory() as directory:
+        cache = PersistentCache(os.path.join(directory, 'dns_cache.sqlite'))
+        engine = LookupEngine(servers=servers, port=port, metrics=metrics, scores=ResolverScores(),
+                              cache=cache, **engine_options)
+        start = time.monotonic()
+        BENCHMARKS[name](entries, engine, concurrency)
+        metrics.finish(entries=len(entries))
+        engine.close()
+        cache.close()
+    wall_time = time.monotonic() - start
+    queries = metrics.queries()
+    latency = {f"p{round(pct * 100)}": metrics.percentile(pct) for pct in REPORT_PERCENTILES}
+    return {
+        'benchmark': name,
+        'entries': len(entries),
+        'wall_time_seconds': round(wall_time, 3),
+        'queries': queries,
+        'queries_per_second': round(queries / wall_time, 1) if wall_time else None,
+        'latency_seconds': {key: round(value, 5) if value is not None else None for key, value in latency.items()},
+        'outcomes': metrics.outcome_counts(),
+        'server': {key: value - before[key] for key, value in zone.counters().items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sweeps against a local mock nameserver.")
+    parser.add_argument('--benchmark', choices=sorted(BENCHMARKS), action='append',
+                        help="benchmark to run (repeatable); all of them by default")
+    parser.add_argument('--realms', type=int, default=2000, help="number of realms each benchmark resolves")
+    parser.add_argument('--hit-ratio', type=float, default=0.01, help="share of the realms that exist")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds every answer is delayed by")
+    parser.add_argument('--jitter', type=float, default=0.005, help="random extra delay of up to this many seconds")
+    parser.add_argument('--loss', type=float, default=0.0, help="share of the UDP queries that go unanswered")
+    parser.add_argument('--servfail', type=float, default=0.0, help="share of the queries answered with SERVFAIL")
+    parser.add_argument('--idps', type=int, default=16, help="identity providers the existing realms share")
+    parser.add_argument('--nameservers', type=int, default=1,
+                        help="number of mock nameservers, on 127.0.0.1, 127.0.0.2, ... (Linux)")
+    parser.add_argument('--port', type=int, default=0, help="port of the mock nameservers, a free one by default")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the injected faults")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of realms resolved at once")
+    parser.add_argument('--per-server-limit', type=int, default=DEFAULT_PER_SERVER_LIMIT,
+                        help="maximum number of concurrent lookups per DNS server")
+    parser.add_argument('--qps', type=float, default=100000,
+                        help="maximum queries per second sent to each DNS server")
+    parser.add_argument('--lifetime', type=float, default=DEFAULT_LIFETIME, help="seconds a single query may take")
+    parser.add_argument('--no-hedge', action='store_true', help="try the nameservers one after the other")
+    parser.add_argument('--transport', choices=TRANSPORTS, default='udp',
+                        help="transport for the asyncio lookups")
+    parser.add_argument('--min-qps', type=float,
+                        help="exit with status 1 if a benchmark makes fewer queries per second than this")
+    parser.add_argument('--output', help="also write the report as JSON to this file")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+
+    zone = SyntheticZone(hit_ratio=args.hit_ratio, servfail_ratio=args.servfail, loss_ratio=args.loss,
+                         latency=args.latency, jitter=args.jitter, idps=args.idps, seed=args.seed)
+    nameservers = []
+    port = args.port
+    try:
+        for index in range(args.nameservers):
+            nameserver = MockNameserver(zone, f"127.0.0.{index + 1}", port)
+            port = nameserver.start()
+            nameservers.append(nameserver)
+        servers = [nameserver.host for nameserver in nameservers]
+        log.info("Mock nameservers listening on %s, port %d", ', '.join(servers), port)
+
+        entries = synthetic_entries(args.realms)
+        reports = []
+        for name in args.benchmark or list(BENCHMARKS):
+            report = run_benchmark(name, entries, zone, servers, port, concurrency=args.concurrency,
+                                   qps=args.qps, per_server_limit=args.per_server_limit,
+                                   hedge=not args.no_hedge, lifetime=args.lifetime, transport=args.transport)
+            reports.append(report)
+            print(f"{name}: {report['entries']} realms in {report['wall_time_seconds']:.2f} s, "
+                  f"{report['queries']} queries, {report['queries_per_second']} queries/s, "
+                  f"p50 {report['latency_seconds']['p50']} s, p99 {report['latency_seconds']['p99']} s")
+    finally:
+        for nameserver in nameservers:
+            nameserver.stop()
+
+    if args.output:
+        write_json_atomic({'settings': {key: value for key, value in vars(args).items()
+                                        if key not in ('output', 'log_level', 'log_json', 'trace')},
+                           'benchmarks': reports}, args.output, indent=4)
+        log.info("Benchmark report written to %s", args.output)
+    if args.min_qps is not None:
+        slow = [report['benchmark'] for report in reports
+                if (report['queries_per_second'] or 0) < args.min_qps]
+        if slow:
+            log.error("Below %s queries/s: %s", args.min_qps, ', '.join(slow))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Change detection between sweeps and the change feed built from it.
+
+Every sweep replaces data/mccmnc.json wholesale, so anyone interested in
+which carriers gained or lost OpenRoaming support had to diff the whole
+file themselves. After the results are published, record_changes()
+compares the entries the sweep touched with the previous run and appends
+what changed to data/changes.jsonl, one JSON object per line:
+
+    {"time": 1700000000, "event": "added", "plmn": "310280", "MCC": "310", "MNC": "280",
+     "NETWORK": "AT&T", "host": "idp.example.net", "port": 2083}
+
+'added' means the PLMN's realm is newly supported, 'removed' means it no
+longer is, and 'changed' means its RadSec host or port moved. 'removed' and
+'changed' events also carry the previous host and port under 'previous'.
+
+The previous state is the small index data/change_index.json. It holds a
+content hash of (host, port) for each supported PLMN, plus that host and
+port. Only the entries a sweep actually looked up can have changed, so the
+comparison costs one hash per touched entry, not a pass over the dataset.
+Without an index, the first run only builds it and emits nothing, so the
+feed does not start with every supported carrier listed as 'added'. Events
+older than the retention period are dropped from the feed as new ones are
+appended.
+
+Usage:
+    python changes.py  # compare all of data/mccmnc.json with the index
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+from checkpoint import write_json_atomic, write_text_atomic
+from logconfig import add_logging_arguments, setup_logging_from_args
+from plmn_store import DATA_DIR, DEFAULT_JSON_PATH, DEFAULT_STORE_PATH, load_plmn_data
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.join(DATA_DIR, 'change_index.json')
+DEFAULT_FEED_PATH = os.path.join(DATA_DIR, 'changes.jsonl')
+# Seconds an event stays in the feed
+DEFAULT_RETENTION = 180 * 24 * 3600
+# Feed fields that identify the carrier of an event
+CARRIER_FIELDS = ('MCC', 'MNC', 'NETWORK')
+
+
+def entry_hash(entry):
+    """
+    Hash the part of an entry the change feed reports on.
+
+    Args:
+        entry (dict): Entry as in data/mccmnc.json, or None.
+
+    Returns:
+        str: Hex digest of the RadSec host and port, or None if the realm is not supported.
+    """
+    if not entry or not entry.get('lookup_success'):
+        return None
+    content = json.dumps([entry.get('host'), entry.get('port')], sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def index_entry(entry):
+    """
+    Args:
+        entry (dict): Supported entry as in data/mccmnc.json.
+
+    Returns:
+        dict: The entry's record in the change index.
+    """
+    return {'hash': entry_hash(entry), 'host': entry.get('host'), 'port': entry.get('port')}
+
+
+def diff_entries(index, data, keys, now):
+    """
+    Compare entries with the change index and bring the index up to date.
+
+    Args:
+        index (dict): Change index keyed by PLMN ID, updated in place.
+        data (dict): Current entries keyed by PLMN ID.
+        keys (iterable): PLMN IDs to compare, e.g. the ones a sweep looked up.
+        now (int): Timestamp of the events.
+
+    Returns:
+        list: Events, sorted by PLMN ID.
+    """
+    events = []
+    for key in sorted(set(keys)):
+        entry = data.get(key)
+        new_hash = entry_hash(entry)
+        previous = index.get(key)
+        if new_hash == (previous or {}).get('hash'):
+            continue
+        if new_hash is None:
+            event = 'removed'
+            del index[key]
+        else:
+            event = 'changed' if previous else 'added'
+            index[key] = index_entry(entry)
+        record = {'time': now, 'event': event, 'plmn': key}
+        record.update({field: entry[field] for field in CARRIER_FIELDS if entry and field in entry})
+        if new_hash is not None:
+            record.update(host=entry.get('host'), port=entry.get('port'))
+        if previous:
+            record['previous'] = {'host': previous['host'], 'port': previous['port']}
+        events.append(record)
+    return events
+
+
+def append_feed(events, path=DEFAULT_FEED_PATH, retention=DEFAULT_RETENTION, now=None):
+    """
+    Append events to the change feed, dropping the expired ones, and replace the file atomically.
+
+    Args:
+        events (list): Events from diff_entries().
+        path (str, optional): Location of the feed.
+        retention (int, optional): Seconds an event stays in the feed.
+        now (int, optional): Current time as a Unix timestamp.
+    """
+    now = int(time.time()) if now is None else now
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            lines = [line for line in file if line.strip()]
+    kept = [line for line in lines if json.loads(line).get('time', 0) >= now - retention]
+    if not events and len(kept) == len(lines):
+        return
+    kept += [json.dumps(event, ensure_ascii=False) + '\n' for event in events]
+    write_text_atomic(''.join(kept), path)
+
+
+def record_changes(data, keys=None, index_path=DEFAULT_INDEX_PATH, feed_path=DEFAULT_FEED_PATH,
+                   retention=DEFAULT_RETENTION):
+    """
+    Detect what changed since the previous run and append it to the change feed.
+
+    Args:
+        data (dict): Current entries keyed by PLMN ID, as just published.
+        keys (iterable, optional): PLMN IDs that may have changed, every entry of *data* by default.
+        index_path (str, optional): Location of the change index.
+        feed_path (str, optional): Location of the change feed.
+        retention (int, optional): Seconds an event stays in the feed.
+
+    Returns:
+        list: Events appended to the feed.
+    """
+    now = int(time.time())
+    if not os.path.exists(index_path):
+        index = {key: index_entry(entry) for key, entry in data.items() if entry_hash(entry)}
+        write_json_atomic(dict(sorted(index.items())), index_path, indent=1)
+        log.info("No change index yet, indexed %d supported PLMNs in %s.", len(index), index_path)
+        return []
+
+    with open(index_path, 'r', encoding='utf-8') as file:
+        index = json.load(file)
+    # PLMNs that left the dataset altogether are no longer supported either
+    keys = set(data if keys is None else keys) | {key for key in index if key not in data}
+    events = diff_entries(index, data, keys, now)
+    # The feed first: a crash in between repeats events rather than losing them
+    append_feed(events, feed_path, retention, now)
+    if events:
+        write_json_atomic(dict(sorted(index.items())), index_path, indent=1)
+    log.info("Changes: %s", ', '.join(f"{event['event']} {event['plmn']}" for event in events) or 'none')
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append the changes in data/mccmnc.json to the change feed.")
+    parser.add_argument('--retention', type=int, default=DEFAULT_RETENTION,
+                        help="seconds an event stays in the feed")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+    record_changes(load_plmn_data(DEFAULT_STORE_PATH, DEFAULT_JSON_PATH), retention=args.retention)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Crash-safe checkpointing for long sweeps.
+
+Each finished entry is appended to a JSON Lines journal and flushed right
+away, so a crash, CI timeout or Ctrl-C only loses the lookups that were in
+flight. The next run loads the journal and skips everything it already
+holds. Once the sweep finishes, the results are compacted into the
+published files with write_json_atomic(), which writes a temporary file
+and renames it over the target, and the journal is removed.
+"""
+
+import json
+import logging
+import os
+import stat
+import tempfile
+import time
+
+log = logging.getLogger(__name__)
+
+# Journal records older than this are ignored when resuming, so a journal
+# left over from an abandoned run does not mask a fresh sweep
+DEFAULT_MAX_RESUME_AGE = 24 * 3600
+# Number of appended records between fsync() calls
+DEFAULT_FSYNC_INTERVAL = 100
+
+
+def file_mode(path):
+    """
+    Get the permissions a rewritten *path* should keep.
+
+    Args:
+        path (str): Destination file.
+
+    Returns:
+        int: Permission bits of the existing file, or 0o666 minus the umask for a new one,
+        as open() would create it.
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_text_atomic(text, path):
+    """
+    Write *text* to *path* so that readers see either the old or the new file, never a partial one.
+
+    mkstemp() creates the temporary file readable by the owner only, so it
+    gets the mode of the file it replaces, see file_mode(), before the rename.
+
+    Args:
+        text (str): File contents.
+        path (str): Destination file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(tmp_path, file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_json_atomic(data, path, **dump_args):
+    """
+    Write JSON to *path* atomically, see write_text_atomic().
+
+    Args:
+        data: JSON-serialisable data.
+        path (str): Destination file.
+        **dump_args: Extra arguments for json.dumps(), e.g. indent.
+    """
+    write_text_atomic(json.dumps(data, **dump_args), path)
+
+
+def load_json_file(json_path):
+    """
+    Load data from the specified JSON file.
+
+    Args:
+        json_path (str): Path to the JSON file.
+
+    Returns:
+        dict: Loaded JSON data.
+    """
+    if os.path.exists(json_path):
+        with open(json_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    else:
+        return {}
+
+
+def save_json_file(data, json_path):
+    """
+    Save data to the specified JSON file, atomically.
+
+    Args:
+        data (dict): Data to be saved.
+        json_path (str): Path to the JSON file.
+    """
+    write_json_atomic(data, json_path, indent=4)
+    log.info("JSON data updated in %s", json_path)
+
+
+class ResultJournal:
+    """
+    Append-only JSON Lines journal of finished sweep entries.
+    """
+
+    def __init__(self, path, fsync_interval=DEFAULT_FSYNC_INTERVAL):
+        """
+        Args:
+            path (str): Location of the journal file.
+            fsync_interval (int, optional): Number of records between fsync() calls.
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.file = None
+        self.unsynced = 0
+
+    def __enter__(self):
+        self.file = open(self.path, 'a', encoding='utf-8')
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, key, entry):
+        """
+        Record one finished entry and flush it to the operating system.
+
+        Args:
+            key (str): Entry key, e.g. the PLMN ID.
+            entry (dict): Result to record.
+        """
+        self.file.write(json.dumps({'key': key, 'time': int(time.time()), 'entry': entry}) + '\n')
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def close(self):
+        """Flush, sync and close the journal."""
+        if self.file:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+
+    def load(self, max_age=DEFAULT_MAX_RESUME_AGE):
+        """
+        Read back the entries recorded by an earlier, interrupted run.
+
+        A truncated last line from a crash mid-write is skipped.
+
+        Args:
+            max_age (int, optional): Ignore records older than this many seconds.
+
+        Returns:
+            dict: Latest recorded entry per key.
+        """
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        oldest = time.time() - max_age
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('time', 0) >= oldest:
+                    entries[record['key']] = record['entry']
+        return entries
+
+    def remove(self):
+        """Delete the journal once its entries have been compacted."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
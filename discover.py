@@ -0,0 +1,244 @@
+"""
+Discovery sweep for OpenRoaming realms of PLMNs missing from the mcc-mnc.com list.
+
+main.py only looks up the PLMNs mcc-mnc.com knows about, and that list is
+neither complete nor always right (see the 310:280 note in the README).
+This sweep probes the realm of every MNC from 000 to 999 under each MCC
+that exists under pub.3gppnetwork.org (see enumerate_plmn.py), except the
+PLMNs the list already covers. The realm always spells the MNC with three
+digits, so a 2-digit MNC such as 01 and the 3-digit 001 share one realm
+and one probe. Realms found this way go to data/discovered_plmns.json, not
+to the published data/mccmnc.json.
+
+Up to a million names per run are only practical with aggressive negative
+caching. Besides the per-answer DNS cache, the dataset keeps one record per
+probed MCC: when its MNCs were last probed, the shortest negative TTL among
+them and the MNCs that only failed transiently. An MCC is then skipped for
+at least the negative TTL floor (plus a stable per-MCC jitter, like main.py
+does for single PLMNs), apart from its discovered PLMNs, which are always
+re-checked, and its transient failures, which are retried.
+
+Usage:
+    python discover.py [--mcc 310 --mcc 311 ...] [--full]
+    python main.py --discover  # after the regular sweep, with the same engine
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import logging
+import os
+import time
+
+from tqdm import tqdm
+
+from checkpoint import load_json_file, write_json_atomic
+from enumerate_plmn import find_live_mccs
+from logconfig import add_logging_arguments, setup_logging_from_args
+from lookup_engine import DEFAULT_CONCURRENCY, DEFAULT_NEGATIVE_TTL_FLOOR, DEFAULT_PER_SERVER_LIMIT, LookupEngine
+from metrics import SweepMetrics
+from plmn_store import load_plmn_data
+from ratelimit import DEFAULT_QPS
+from realms import iter_realms
+
+log = logging.getLogger(__name__)
+
+DISCOVERY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'discovered_plmns.json')
+
+
+def plmn_id(mcc, mnc):
+    """
+    Args:
+        mcc (int): Mobile Country Code.
+        mnc (int): Mobile Network Code.
+
+    Returns:
+        str: Key of a discovered PLMN, MCC and MNC with three digits each, e.g. '310280'.
+    """
+    return f"{mcc:03d}{mnc:03d}"
+
+
+def known_pairs(entries):
+    """
+    Collect the MCC-MNC pairs of the mcc-mnc.com list.
+
+    Args:
+        entries (dict): Entries keyed by PLMN ID, as in data/mccmnc.json.
+
+    Returns:
+        set: (mcc, mnc) tuples of integers; '01' and '001' give the same pair.
+    """
+    return {(int(value['MCC']), int(value['MNC'])) for value in entries.values()
+            if str(value.get('MCC', '')).isdigit() and str(value.get('MNC', '')).isdigit()}
+
+
+def mcc_due(mcc, record, now, negative_ttl_floor=DEFAULT_NEGATIVE_TTL_FLOOR):
+    """
+    Decide whether the MNCs of an MCC have to be probed again.
+
+    Args:
+        mcc (int): Mobile Country Code.
+        record (dict): The MCC's record from the discovery dataset, or None.
+        now (int): Current time as a Unix timestamp.
+        negative_ttl_floor (int, optional): Minimum lifetime of a negative result in seconds.
+
+    Returns:
+        bool: True if the MCC was never probed or its negative results have expired.
+    """
+    if not record or not record.get('ttl'):
+        return True
+    lifetime = record['ttl']
+    if negative_ttl_floor:
+        jitter = int(hashlib.sha1(f"mcc{mcc:03d}".encode('utf-8')).hexdigest(), 16) % negative_ttl_floor
+        lifetime = max(lifetime, negative_ttl_floor + jitter)
+    return now >= record['last_checked'] + lifetime
+
+
+def load_discovery(path=DISCOVERY_PATH):
+    """
+    Load the discovery dataset.
+
+    Args:
+        path (str, optional): Location of the dataset.
+
+    Returns:
+        dict: 'plmns' (discovered realms keyed by plmn_id()) and 'mccs' (probe records
+        keyed by 3-digit MCC), both empty if there is no dataset yet.
+    """
+    data = load_json_file(path)
+    return {'plmns': data.get('plmns', {}), 'mccs': data.get('mccs', {})}
+
+
+def discover_plmns(engine, known, mccs=range(1000), mncs=range(1000), concurrency=DEFAULT_CONCURRENCY,
+                   full=False, negative_ttl_floor=DEFAULT_NEGATIVE_TTL_FLOOR, path=DISCOVERY_PATH):
+    """
+    Probe the realms of the PLMNs missing from the mcc-mnc.com list and update the discovery dataset.
+
+    Args:
+        engine (lookup_engine.LookupEngine): Engine to send the probes through.
+        known (dict): Entries of the mcc-mnc.com list keyed by PLMN ID; their PLMNs are skipped.
+        mccs (iterable, optional): Mobile Country Codes to cover, all 1000 by default.
+        mncs (iterable, optional): Mobile Network Codes to probe under each live MCC.
+        concurrency (int, optional): Global limit on realms being resolved at once.
+        full (bool, optional): Probe every MCC regardless of when it was last probed.
+        negative_ttl_floor (int, optional): Minimum lifetime of an MCC's negative results in seconds.
+        path (str, optional): Location of the discovery dataset.
+
+    Returns:
+        list: Keys of the PLMNs discovered in this run that were not in the dataset before.
+    """
+    dataset = load_discovery(path)
+    plmns, mcc_records = dataset['plmns'], dataset['mccs']
+    known = known_pairs(known)
+    mncs = sorted(set(mncs))
+    now = int(time.time())
+
+    # PLMNs that made it into the mcc-mnc.com list are the main sweep's business now
+    for key in [key for key, value in plmns.items() if (int(value['MCC']), int(value['MNC'])) in known]:
+        del plmns[key]
+
+    due = [mcc for mcc in sorted(set(mccs)) if full or mcc_due(mcc, mcc_records.get(f"{mcc:03d}"), now,
+                                                                negative_ttl_floor)]
+    live, pruned = find_live_mccs(due, engine, concurrency=concurrency) if due else ([], {})
+    # Never prune an MCC with discovered PLMNs, in case its servers wrongly answer
+    # NXDOMAIN for empty non-terminals
+    discovered_mccs = {int(value['MCC']) for value in plmns.values()}
+    live += [mcc for mcc in pruned if mcc in discovered_mccs]
+    for mcc, ttl in pruned.items():
+        if mcc not in discovered_mccs:
+            mcc_records[f"{mcc:03d}"] = {'last_checked': now, 'ttl': ttl or 0, 'retry': []}
+    log.info("Discovery: %d of %d MCCs due, %d of them exist.", len(due), len(set(mccs)), len(live))
+
+    # Every MNC under the live MCCs that are due...
+    full_mccs = sorted(set(live))
+    full_set, mnc_set = set(full_mccs), set(mncs)
+    # ...plus the discovered PLMNs and the transient failures of the other MCCs,
+    # unless they have joined the mcc-mnc.com list since
+    partial_mccs = {}
+    for value in plmns.values():
+        if int(value['MCC']) not in full_set:
+            partial_mccs.setdefault(int(value['MCC']), set()).add(int(value['MNC']))
+    for key, record in mcc_records.items():
+        if int(key) not in full_set and record.get('retry'):
+            partial_mccs.setdefault(int(key), set()).update(
+                mnc for mnc in record['retry'] if (int(key), mnc) not in known)
+    # Generated lazily, the resolver stage pulls them in batches
+    pairs = itertools.chain(
+        ((mcc, mnc) for mcc in full_mccs for mnc in mncs if (mcc, mnc) not in known),
+        ((mcc, mnc) for mcc in sorted(partial_mccs) for mnc in sorted(partial_mccs[mcc])))
+    total = len(full_mccs) * len(mncs) + sum(len(partial) for partial in partial_mccs.values())
+    total -= sum(1 for mcc, mnc in known if mcc in full_set and mnc in mnc_set)
+
+    min_ttl = {mcc: None for mcc in full_mccs}
+    retry = {mcc: [] for mcc in list(full_mccs) + list(partial_mccs)}
+    discovered = []
+
+    with tqdm(total=total, desc="Discovering PLMNs") as pbar:
+        def record_result(pair, result):
+            mcc, mnc = pair
+            found, host, port, ttl, endpoints = result
+            key = plmn_id(mcc, mnc)
+            if found:
+                if key not in plmns:
+                    discovered.append(key)
+                    log.info("Discovered: %s -> %s:%s", key, host, port)
+                plmns[key] = {'MCC': f"{mcc:03d}", 'MNC': f"{mnc:03d}",
+                              'first_seen': plmns.get(key, {}).get('first_seen', now), 'last_checked': now,
+                              'ttl': ttl, 'host': host, 'port': port, 'endpoints': endpoints}
+            elif ttl:
+                plmns.pop(key, None)
+                if mcc in min_ttl:
+                    min_ttl[mcc] = ttl if min_ttl[mcc] is None else min(min_ttl[mcc], ttl)
+            else:
+                # No definitive answer: keep what we had and try again next run
+                retry[mcc].append(mnc)
+            pbar.update(1)
+
+        asyncio.run(engine.resolve_many_async(iter_realms(pairs, use_pub=True), concurrency,
+                                              on_result=record_result))
+
+    for mcc in full_mccs:
+        mcc_records[f"{mcc:03d}"] = {'last_checked': now, 'ttl': min_ttl[mcc] or 0, 'retry': sorted(retry[mcc])}
+    for mcc in partial_mccs:
+        mcc_records.setdefault(f"{mcc:03d}", {'last_checked': now, 'ttl': 0})['retry'] = sorted(retry[mcc])
+
+    write_json_atomic({'plmns': dict(sorted(plmns.items())), 'mccs': dict(sorted(mcc_records.items()))},
+                      path, indent=4)
+    log.info("Discovery: probed %d realms, %d new PLMNs, %d discovered in total; saved to %s",
+             total, len(discovered), len(plmns), path)
+    return discovered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Probe the realms of PLMNs missing from the mcc-mnc.com list.")
+    parser.add_argument('--mcc', type=int, action='append',
+                        help="MCC to probe (repeatable); all 000-999 by default")
+    parser.add_argument('--full', action='store_true',
+                        help="probe every MCC instead of only those whose negative results have expired")
+    parser.add_argument('--negative-ttl-floor', type=int, default=DEFAULT_NEGATIVE_TTL_FLOOR,
+                        help="minimum seconds an MCC without discoveries is trusted before it is probed again")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of realms resolved at once")
+    parser.add_argument('--per-server-limit', type=int, default=DEFAULT_PER_SERVER_LIMIT,
+                        help="maximum number of concurrent lookups per DNS server")
+    parser.add_argument('--qps', type=float, default=DEFAULT_QPS,
+                        help="maximum queries per second sent to each DNS server")
+    parser.add_argument('--output', default=DISCOVERY_PATH, help="location of the discovery dataset")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+
+    engine = LookupEngine(qps=args.qps, per_server_limit=args.per_server_limit,
+                          metrics=SweepMetrics('discovery'))
+    discover_plmns(engine, load_plmn_data(), args.mcc or range(1000), concurrency=args.concurrency,
+                   full=args.full, negative_ttl_floor=args.negative_ttl_floor, path=args.output)
+    log.info("Lookups: %s", engine.outcome_summary() or 'none',
+             extra={'event': 'summary', 'outcomes': engine.outcome_counts()})
+    engine.close()
+    engine.metrics.finish()
+    log.info("Discovery metrics written to %s and %s", *engine.metrics.export())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Persistent on-disk DNS answer cache shared by main.py, domains.py and test.py.
+
+PersistentCache implements dnspython's cache interface (get/put/flush), so it
+can be assigned to ``resolver.cache`` on both dns.resolver.Resolver and
+dns.asyncresolver.Resolver objects and is consulted transparently by every
+NAPTR/SRV lookup. Answers are stored as wire-format responses in a SQLite
+file and expire with their TTL. NXDOMAIN and NODATA answers are cached for
+the TTL given by the SOA in the authority section (RFC 2308), capped at one
+day, and are not cached at all when no SOA is present. When the file grows
+past its size limit the least recently used answers are evicted.
+
+LookupEngine checks the cache with cached_answer() before it takes a
+rate-limit token, so a re-run within the TTLs neither waits for the rate
+limiter nor shows up in the query metrics and resolver scores.
+"""
+
+import os
+import sqlite3
+import time
+
+import dns.message
+import dns.name
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'dns_cache.sqlite')
+# Maximum number of answers kept on disk before LRU eviction kicks in
+DEFAULT_MAX_SIZE = 100000
+# RFC 2308 section 5 recommends a maximum of one day for negative caching
+MAX_NEGATIVE_TTL = 24 * 3600
+# Number of inserts between checks of the cache size
+EVICTION_INTERVAL = 100
+
+
+def has_soa(response):
+    """
+    Check whether a response carries an SOA record in its authority section.
+
+    Args:
+        response (dns.message.Message): DNS response.
+
+    Returns:
+        bool: True if an SOA record is present.
+    """
+    return any(rrset.rdtype == dns.rdatatype.SOA for rrset in response.authority)
+
+
+def negative_ttl(exc):
+    """
+    Get the negative-caching TTL of an NXDOMAIN or NODATA answer (RFC 2308).
+
+    Args:
+        exc (Exception): Exception raised by resolver.resolve().
+
+    Returns:
+        int: TTL in seconds taken from the SOA in the authority section, capped at
+        MAX_NEGATIVE_TTL, or None if the exception was not an authoritative negative answer.
+    """
+    if isinstance(exc, dns.resolver.NXDOMAIN):
+        responses = list(exc.responses().values())
+    elif isinstance(exc, dns.resolver.NoAnswer):
+        responses = [exc.response()]
+    else:
+        return None
+    if not responses or not all(has_soa(response) for response in responses):
+        return None
+    try:
+        # An SOA outside the queried name's zone leaves minimum_ttl at dnspython's maximum
+        return min([MAX_NEGATIVE_TTL] + [response.resolve_chaining().minimum_ttl for response in responses])
+    except Exception:
+        return None
+
+
+def cached_answer(cache, name, rdtype):
+    """
+    Look a query up in a resolver cache the way dnspython's resolvers do, without querying anyone.
+
+    Args:
+        cache (dns.resolver.CacheBase): Resolver cache, or None.
+        name (str or dns.name.Name): Name to look up.
+        rdtype (str or int): Record type, e.g. 'NAPTR'.
+
+    Returns:
+        dns.resolver.Answer: Cached answer, or None if the query is not cached.
+
+    Raises:
+        dns.resolver.NXDOMAIN: A cached answer says the name does not exist.
+        dns.resolver.NoAnswer: A cached answer says the name has no records of that type.
+    """
+    if not cache:
+        return None
+    qname = dns.name.from_text(name) if isinstance(name, str) else name
+    rdtype = dns.rdatatype.RdataType.make(rdtype)
+    rdclass = dns.rdataclass.IN
+    answer = cache.get((qname, rdtype, rdclass))
+    if answer is not None:
+        if answer.rrset is None:
+            raise dns.resolver.NoAnswer(response=answer.response)
+        return answer
+    # dnspython caches NXDOMAIN under the ANY type, for every type of the name
+    answer = cache.get((qname, dns.rdatatype.ANY, rdclass))
+    if answer is not None and answer.response.rcode() == dns.rcode.NXDOMAIN:
+        raise dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: answer.response})
+    return None
+
+
+class PersistentCache(dns.resolver.CacheBase):
+    """
+    Thread-safe, TTL-respecting, LRU-bounded DNS answer cache backed by SQLite.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size=DEFAULT_MAX_SIZE):
+        """
+        Args:
+            path (str, optional): Location of the SQLite file, created if missing.
+            max_size (int, optional): Maximum number of cached answers.
+        """
+        super().__init__()
+        self.path = path
+        self.max_size = max_size
+        self.puts = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " qname TEXT NOT NULL, rdtype INTEGER NOT NULL, rdclass INTEGER NOT NULL,"
+            " expiration REAL NOT NULL, last_used REAL NOT NULL,"
+            " nameserver TEXT, port INTEGER, response BLOB NOT NULL,"
+            " PRIMARY KEY (qname, rdtype, rdclass))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self.connection.execute("DELETE FROM answers WHERE expiration <= ?", (time.time(),))
+        self.connection.commit()
+
+    def get(self, key):
+        """
+        Get the answer associated with *key*.
+
+        Args:
+            key (tuple): (dns.name.Name, rdtype, rdclass) cache key.
+
+        Returns:
+            dns.resolver.Answer: Cached answer, or None if missing or expired.
+        """
+        qname, rdtype, rdclass = key
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT expiration, nameserver, port, response FROM answers"
+                " WHERE qname = ? AND rdtype = ? AND rdclass = ?",
+                (qname.to_text(), int(rdtype), int(rdclass))).fetchone()
+            if row is None or row[0] <= now:
+                if row is not None:
+                    self._delete(key)
+                self.statistics.misses += 1
+                return None
+            self.connection.execute(
+                "UPDATE answers SET last_used = ? WHERE qname = ? AND rdtype = ? AND rdclass = ?",
+                (now, qname.to_text(), int(rdtype), int(rdclass)))
+            self.connection.commit()
+            self.statistics.hits += 1
+        expiration, nameserver, port, wire = row
+        answer = dns.resolver.Answer(qname, rdtype, rdclass, dns.message.from_wire(wire), nameserver, port)
+        answer.expiration = expiration
+        return answer
+
+    def put(self, key, value):
+        """
+        Associate *key* with the answer *value*.
+
+        Negative answers without an SOA record are not cached (RFC 2308 section 5).
+
+        Args:
+            key (tuple): (dns.name.Name, rdtype, rdclass) cache key.
+            value (dns.resolver.Answer): Answer to cache.
+        """
+        qname, rdtype, rdclass = key
+        now = time.time()
+        expiration = value.expiration
+        if value.rrset is None:
+            if not has_soa(value.response):
+                return
+            expiration = min(expiration, now + MAX_NEGATIVE_TTL)
+        if expiration <= now:
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO answers"
+                " (qname, rdtype, rdclass, expiration, last_used, nameserver, port, response)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (qname.to_text(), int(rdtype), int(rdclass), expiration, now,
+                 value.nameserver, value.port, value.response.to_wire()))
+            self.puts += 1
+            if self.puts % EVICTION_INTERVAL == 0:
+                self._evict()
+            self.connection.commit()
+
+    def flush(self, key=None):
+        """
+        Flush the cache.
+
+        Args:
+            key (tuple, optional): If given, only this entry is flushed, otherwise the entire cache is.
+        """
+        with self.lock:
+            if key is not None:
+                self._delete(key)
+            else:
+                self.connection.execute("DELETE FROM answers")
+            self.connection.commit()
+
+    def close(self):
+        """Close the underlying SQLite connection."""
+        with self.lock:
+            self.connection.close()
+
+    def _delete(self, key):
+        qname, rdtype, rdclass = key
+        self.connection.execute(
+            "DELETE FROM answers WHERE qname = ? AND rdtype = ? AND rdclass = ?",
+            (qname.to_text(), int(rdtype), int(rdclass)))
+
+    def _evict(self):
+        # Drop expired answers first, then the least recently used ones
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count <= self.max_size:
+            return
+        self.connection.execute("DELETE FROM answers WHERE expiration <= ?", (time.time(),))
+        (count,) = self.connection.execute("SELECT COUNT(*) FROM answers").fetchone()
+        if count > self.max_size:
+            self.connection.execute(
+                "DELETE FROM answers WHERE rowid IN"
+                " (SELECT rowid FROM answers ORDER BY last_used LIMIT ?)",
+                (count - self.max_size,))
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """
+    Get the process-wide persistent cache, opening it on first use.
+
+    Returns:
+        PersistentCache: Cache stored at DEFAULT_CACHE_PATH.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PersistentCache()
+    return _default_cache
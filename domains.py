@@ -1,113 +1,107 @@
+import argparse
+import asyncio
 import json
+import logging
 import os
-import dns.resolver
-import time
 from tqdm import tqdm
+from checkpoint import write_json_atomic
+from logconfig import add_logging_arguments, setup_logging_from_args
+from lookup_engine import DEFAULT_CONCURRENCY, DEFAULT_PER_SERVER_LIMIT, LookupEngine, validate_host
+from metrics import SweepMetrics
+from ratelimit import DEFAULT_QPS
 
-def setup_resolvers():
-    """
-    Setup DNS resolvers with custom DNS servers, rotating through them.
+log = logging.getLogger(__name__)
 
-    Returns:
-        list: List of configured DNS resolvers.
-    """
-    resolver_list = []
-    dns_servers = ['1.1.1.1', '8.8.8.8', '9.9.9.9', "208.67.222.222", "8.26.56.26", "76.76.2.0"]
-    for server in dns_servers:
-        resolver = dns.resolver.Resolver()
-        resolver.nameservers = [server]
-        resolver_list.append(resolver)
-    return resolver_list
-
-def naptr_lookup(realm, resolver):
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# One realm per line; blank lines and '#' comments are ignored
+DOMAINS_PATH = os.path.join(DATA_DIR, 'domains.txt')
+# Host and port to report for realms without NAPTR/SRV records, keyed by realm
+FALLBACKS_PATH = os.path.join(DATA_DIR, 'domain_fallbacks.json')
+
+def load_domains(path=DOMAINS_PATH):
     """
-    Perform NAPTR DNS lookup on the given realm using a specified resolver.
+    Load the realms to look up from a text file with one realm per line.
+
+    Names are lowercased and stripped of a trailing dot, duplicates are
+    dropped and invalid host names are logged and skipped.
 
     Args:
-        realm (str): The realm to perform the NAPTR lookup on.
-        resolver (dns.resolver.Resolver): The DNS resolver to use for the lookup.
+        path (str, optional): Path to the domain list.
 
     Returns:
-        str: Replacement value from the NAPTR record if found, otherwise None.
+        list: Distinct domains in file order.
     """
-    try:
-        print(f"Performing NAPTR lookup for {realm} using resolver {resolver.nameservers[0]}")
-        answers = resolver.resolve(realm, 'NAPTR', lifetime=5)
-        for rdata in answers:
-            print(f"Found NAPTR record: {rdata}")
-            # Use bytes literal for comparison
-            if b'aaa+auth:radius.tls.tcp' in rdata.service.lower():
-                return rdata.replacement.to_text().strip('.')
-        print(f"No valid NAPTR record found for {realm}")
-    except Exception as e:
-        print(f"Error during NAPTR lookup for {realm}: {e}")
-    return None
-
-def srv_lookup(host, resolver):
+    domains = {}
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            domain = line.split('#', 1)[0].strip().rstrip('.').lower()
+            if not domain:
+                continue
+            if not validate_host(domain):
+                log.warning("Skipping invalid domain %r in %s", domain, path)
+                continue
+            domains[domain] = None
+    return list(domains)
+
+def load_fallback_records(path=FALLBACKS_PATH):
     """
-    Perform SRV DNS lookup on the given host using a specified resolver.
+    Load the fallback records for domains without NAPTR.
 
     Args:
-        host (str): The hostname to perform the SRV lookup on.
-        resolver (dns.resolver.Resolver): The DNS resolver to use for the lookup.
+        path (str, optional): Path to the JSON file of fallback records.
 
     Returns:
-        tuple: A tuple containing the target host and port if found, otherwise (None, None).
+        dict: {"host": ..., "port": ...} records keyed by domain, empty if the file does not exist.
     """
-    try:
-        print(f"Performing SRV lookup for {host} using resolver {resolver.nameservers[0]}")
-        answers = resolver.resolve(host, 'SRV', lifetime=5)
-        for rdata in sorted(answers, key=lambda r: r.priority):
-            print(f"Found SRV record: {rdata}")
-            return rdata.target.to_text().strip('.'), rdata.port
-        print(f"No valid SRV record found for {host}")
-    except Exception as e:
-        print(f"Error during SRV lookup for {host}: {e}")
-    return None, None
-
-def create_json_dict_for_domains(domains, resolvers, fallback_records):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return {domain.rstrip('.').lower(): record for domain, record in json.load(file).items()}
+
+def create_json_dict_for_domains(domains, engine, fallback_records, concurrency=DEFAULT_CONCURRENCY):
     """
     Perform NAPTR and SRV lookups for given domains and create a JSON dictionary for them.
     If no NAPTR or SRV record is found, use fallback records if available.
+    Only timeouts and SERVFAILs are retried on the next resolver; NXDOMAIN and
+    NODATA answers are final. Up to *concurrency* domains are resolved at once,
+    each distinct domain once, and each distinct SRV name the NAPTR records
+    point at is looked up only once (see LookupEngine.resolve_many_async()).
 
     Args:
         domains (list): List of domains to perform lookups for.
-        resolvers (list): List of DNS resolvers to use for lookups.
+        engine (lookup_engine.LookupEngine): Engine to resolve the domains with.
         fallback_records (dict): Dictionary of fallback records for domains without NAPTR.
+        concurrency (int, optional): Global limit on domains being resolved at once.
 
     Returns:
         dict: JSON dictionary with lookup results.
     """
     domain_results = {}
+    domains = list(dict.fromkeys(domains))
 
     # Progress indicator setup
     with tqdm(total=len(domains), desc="Processing domains") as pbar:
-        for domain in domains:
-            srv_host, srv_port = None, None
-
-            # Rotate through DNS resolvers to balance the load
-            for resolver in resolvers:
-                srv_host = naptr_lookup(domain, resolver)
-                if srv_host:
-                    # Try SRV lookup after NAPTR if a host is found
-                    srv_host, srv_port = srv_lookup(srv_host, resolver)
-                    if srv_host and srv_port:
-                        break
-                # Introduce a short delay between queries to avoid rate limiting
-                time.sleep(0.1)
-
-            if srv_host and srv_port:
-                domain_results[domain] = {"host": srv_host, "port": srv_port}
-            elif domain in fallback_records:
-                domain_results[domain] = {"host": fallback_records[domain]["host"], "port": fallback_records[domain]["port"]}
-                print(f"Using fallback record for {domain}: {fallback_records[domain]}")
-            else:
-                domain_results[domain] = {"host": None, "port": None, "note": "No NAPTR or SRV record found and no fallback available"}
-                print(f"No NAPTR or SRV record or fallback available for {domain}")
-
-            # Update progress bar
-            pbar.update(1)
-
+        results = asyncio.run(engine.resolve_many_async(
+            {domain: domain for domain in domains}, concurrency,
+            on_result=lambda domain, result: pbar.update(1)))
+
+    fallbacks = unresolved = 0
+    for domain in domains:
+        found, srv_host, srv_port, _, endpoints = results[domain]
+
+        if found:
+            domain_results[domain] = {"host": srv_host, "port": srv_port, "endpoints": endpoints}
+        elif domain in fallback_records:
+            domain_results[domain] = {"host": fallback_records[domain]["host"], "port": fallback_records[domain]["port"]}
+            log.debug("Using fallback record for %s: %s", domain, fallback_records[domain])
+            fallbacks += 1
+        else:
+            domain_results[domain] = {"host": None, "port": None, "note": "No NAPTR or SRV record found and no fallback available"}
+            log.debug("No NAPTR or SRV record or fallback available for %s", domain)
+            unresolved += 1
+
+    log.info("Resolved %d of %d domains, %d from fallback records, %d without any record.",
+             len(domains) - fallbacks - unresolved, len(domains), fallbacks, unresolved)
     return domain_results
 
 def save_json_file(data, json_path):
@@ -118,104 +112,46 @@ def save_json_file(data, json_path):
         data (dict): Data to be saved.
         json_path (str): Path to the JSON file.
     """
-    with open(json_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=4)
-    print(f"JSON data saved in {json_path}")
-
-def main():
-    # List of domains to perform lookups for
-    domains = [
-        "wlan.mnc260.mcc310.pub.3gppnetwork.org",
-        "wlan.mnc240.mcc310.pub.3gppnetwork.org",
-        "wlan.mnc310.mcc310.pub.3gppnetwork.org",
-        "wlan.mnc314.mcc330.pub.3gppnetwork.org",
-        "wlan.mnc460.mcc313.pub.3gppnetwork.org",
-        "samsung.openroaming.net",
-        "openroaming.goog",
-        "spectrum.net",
-        "wifi.fi.google.com",
-        "prod.premnet.wefi.com",
-        "globalro.am",
-        "dummy.openroaming.wefi.com",
-        "prod.openroaming.wefi.com",
-        "charter.net",
-        "gmail.com",
-        "aka.xfinitymobile.com",
-        "rr.com",
-        "wba.3af521.net",
-        "sdk.openroaming.net",
-        "xfinitymobile.com",
-        "w-jp2.wi2.cityroam.jp",
-        "openroaming.securewifi.io",
-        "yahoo.com",
-        "profile.guglielmo.biz",
-        "ciscoid.openroaming.net",
-        "test.orportal.org",
-        "icloud.com",
-        "tulane.edu",
-        "apple.openroaming.net",
-        "umich.edu",
-        "google.openroaming.net",
-        "wisc.edu",
-        "clus.openroaming.net",
-        "hotmail.com",
-        "uconnect.utah.edu",
-        "tokyo.wi2.cityroam.jp",
-        "kwikboost.com",
-        "swarthmore.edu",
-        "naturalbornorganizers.com",
-        "outlook.com",
-        "rioog.com",
-        "almhem.net",
-        "mac.com",
-        "castlecegal.com",
-        "delhaize.openroaming.net",
-        "xfinity.com",
-        "w-jp1.wi2.cityroam.jp",
-        "wayru.io",
-        "jwa.bemap.cityroam.jp",
-        "or1.guglielmo.biz",
-        "wayfiwireless.com",
-        "dogwood120.net",
-        "orionwifi.com",
-        "orion.area120.com",
-        "ironwifi.net",
-        "securewifi.purple.ai",
-        "cisco.com",
-        "com.firabarcelona.construmat",
-        "com.firabarcelona.iot",
-        "com.firabarcelona.smartcity",
-        "davidlloyd.openroaming.net",
-        "eu-sdk.openroaming.net",
-        "firabarcelona.padelsummit.com",
-        "firabarcelona.smartcity.com",
-        "idp.openroamingconnect.org",
-        "telcombas.com",
-        "tetrapi.pt",
-        "tonybox.net",
-        "web.de"
-    ]
-
-    # Fallback records for domains without NAPTR
-    fallback_records = {
-        "wlan.mnc260.mcc310.3gppnetwork.org": {"host": "aaa.geo.t-mobile.com", "port": 2083},
-        "wlan.mnc240.mcc310.3gppnetwork.org": {"host": "aaa.geo.t-mobile.com", "port": 2083},
-        "wlan.mnc310.mcc310.3gppnetwork.org": {"host": "aaa.geo.t-mobile.com", "port": 2083},
-        "wlan.mnc314.mcc330.3gppnetwork.org": {"host": ["52.37.147.195", "44.229.62.214", "44.241.107.197"], "port": 2083},
-        "freedomfi.com": {"host": ["52.37.147.195", "44.229.62.214", "44.241.107.197"], "port": 2083},
-        "hellohelium.com": {"host": ["52.37.147.195", "44.229.62.214", "44.241.107.197"], "port": 2083}
-    }
-
-    # Setup DNS resolvers with specified DNS servers
-    resolvers = setup_resolvers()
+    write_json_atomic(data, json_path, indent=4)
+    log.info("JSON data saved in %s", json_path)
+
+def main(qps=DEFAULT_QPS, concurrency=DEFAULT_CONCURRENCY, per_server_limit=DEFAULT_PER_SERVER_LIMIT,
+         domains_path=DOMAINS_PATH, fallbacks_path=FALLBACKS_PATH):
+    # Domains to perform lookups for, and fallback records for domains without NAPTR
+    domains = load_domains(domains_path)
+    fallback_records = load_fallback_records(fallbacks_path)
+    log.info("Loaded %d domains from %s and %d fallback records.", len(domains), domains_path,
+             len(fallback_records))
+
+    # Shared lookup engine over the custom DNS servers
+    engine = LookupEngine(qps=qps, per_server_limit=per_server_limit, metrics=SweepMetrics('domains'))
 
     # Perform lookups and create JSON dictionary
-    domain_results = create_json_dict_for_domains(domains, resolvers, fallback_records)
+    domain_results = create_json_dict_for_domains(domains, engine, fallback_records, concurrency=concurrency)
+    log.info("Lookups: %s", engine.outcome_summary() or 'none',
+             extra={'event': 'summary', 'outcomes': engine.outcome_counts()})
+    engine.close()
+    engine.metrics.finish(entries=len(domains))
+    log.info("Lookup metrics written to %s and %s", *engine.metrics.export())
 
     # Save results to a JSON file
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    json_path = os.path.join(current_dir, 'data', 'domain_lookup_results.json')
+    json_path = os.path.join(DATA_DIR, 'domain_lookup_results.json')
     save_json_file(domain_results, json_path)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Look up NAPTR/SRV records for known OpenRoaming realms.")
+    parser.add_argument('--qps', type=float, default=DEFAULT_QPS,
+                        help="maximum queries per second sent to each DNS server")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of domains resolved at once")
+    parser.add_argument('--per-server-limit', type=int, default=DEFAULT_PER_SERVER_LIMIT,
+                        help="maximum number of concurrent lookups per DNS server")
+    parser.add_argument('--domains', default=DOMAINS_PATH,
+                        help="file with the domains to look up, one per line")
+    parser.add_argument('--fallbacks', default=FALLBACKS_PATH,
+                        help="JSON file with fallback host/port records for domains without NAPTR")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+    main(qps=args.qps, concurrency=args.concurrency, per_server_limit=args.per_server_limit,
+         domains_path=args.domains, fallbacks_path=args.fallbacks)
@@ -0,0 +1,166 @@
+"""
+Bulk enumeration of the pub.3gppnetwork.org namespace.
+
+Rather than guessing one realm per mcc-mnc.com entry, probe the parent
+labels of the realms: every ``mccYYY.pub.3gppnetwork.org`` once, then
+``mncXXX.mccYYY.pub.3gppnetwork.org`` only below the MCCs that exist. A
+name that holds no records itself but has names below it (an empty
+non-terminal) answers NOERROR with no data, while NXDOMAIN means nothing at
+all exists below it (RFC 8020), so one NXDOMAIN prunes a whole MCC or MNC
+subtree. This turns a sweep of the full PLMN space into roughly one query
+per MCC plus the live subtrees.
+
+Usage:
+    python enumerate_plmn.py [--mcc 310 --mcc 311 ...] [--output data/enumerated_plmns.json]
+"""
+
+import argparse
+import asyncio
+
+from checkpoint import save_json_file
+from logconfig import add_logging_arguments, setup_logging_from_args
+from lookup import NXDOMAIN, is_definitive
+from lookup_engine import DEFAULT_CONCURRENCY, DEFAULT_PER_SERVER_LIMIT, LookupEngine
+from ratelimit import DEFAULT_QPS
+from realms import REALM_SUFFIX
+
+
+def mcc_zone(mcc):
+    """
+    Build the parent label of every realm under an MCC.
+
+    Args:
+        mcc (int): Mobile Country Code (3-digit).
+
+    Returns:
+        str: Name such as 'mcc310.pub.3gppnetwork.org'.
+    """
+    return f"mcc{mcc:03d}.{REALM_SUFFIX}"
+
+
+def mnc_zone(mcc, mnc):
+    """
+    Build the parent label of every realm under an MCC-MNC pair.
+
+    Args:
+        mcc (int): Mobile Country Code (3-digit).
+        mnc (int): Mobile Network Code (2 or 3-digit).
+
+    Returns:
+        str: Name such as 'mnc280.mcc310.pub.3gppnetwork.org'.
+    """
+    return f"mnc{mnc:03d}.{mcc_zone(mcc)}"
+
+
+async def probe_names_async(names, engine, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Find out which of *names* exist, concurrently.
+
+    A name exists unless a resolver answers NXDOMAIN for it. Transient
+    failures move on to the next resolver; a name on which every resolver
+    failed is reported as existing, so it is never pruned by mistake.
+
+    Args:
+        names (list): DNS names to probe.
+        engine (lookup_engine.LookupEngine): Engine to send the probes through.
+        concurrency (int, optional): Global limit on names being probed at once.
+
+    Returns:
+        dict: (exists, ttl) tuples keyed by name, where ttl is the negative TTL of an
+        NXDOMAIN answer and None otherwise.
+    """
+    resolvers = engine.async_resolvers
+    server_limits = engine.server_limits()
+    pending = iter(enumerate(names))
+    results = {}
+
+    async def probe(name, offset):
+        for resolver in engine.scores.order(resolvers, offset):
+            async with server_limits[resolver.nameservers[0]]:
+                _, status, ttl = await engine.naptr_async(name, resolver)
+            if is_definitive(status):
+                return status != NXDOMAIN, ttl if status == NXDOMAIN else None
+        return True, None
+
+    async def worker():
+        for index, name in pending:
+            results[name] = await probe(name, index % len(resolvers))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(names))))))
+    return results
+
+
+def find_live_mccs(mccs, engine, concurrency=DEFAULT_CONCURRENCY):
+    """
+    Probe the MCC parent labels and split them into live and pruned ones.
+
+    Args:
+        mccs (iterable): Mobile Country Codes to probe.
+        engine (lookup_engine.LookupEngine): Engine to send the probes through.
+        concurrency (int, optional): Global limit on names being probed at once.
+
+    Returns:
+        tuple: Sorted list of live MCCs, and a dict mapping each pruned MCC to the
+        negative TTL of its NXDOMAIN answer.
+    """
+    mccs = sorted(set(mccs))
+    probed = asyncio.run(probe_names_async([mcc_zone(mcc) for mcc in mccs], engine, concurrency))
+    live, pruned = [], {}
+    for mcc in mccs:
+        exists, ttl = probed[mcc_zone(mcc)]
+        if exists:
+            live.append(mcc)
+        else:
+            pruned[mcc] = ttl
+    return live, pruned
+
+
+def enumerate_plmns(engine, mccs=range(1000), mncs=range(1000), concurrency=DEFAULT_CONCURRENCY):
+    """
+    Enumerate the MCC-MNC subtrees that exist under pub.3gppnetwork.org.
+
+    Args:
+        engine (lookup_engine.LookupEngine): Engine to send the probes through.
+        mccs (iterable, optional): Mobile Country Codes to probe, all 1000 by default.
+        mncs (iterable, optional): Mobile Network Codes to probe under each live MCC.
+        concurrency (int, optional): Global limit on names being probed at once.
+
+    Returns:
+        tuple: Sorted list of live MCCs, and a sorted list of live (mcc, mnc) pairs.
+    """
+    live_mccs, _ = find_live_mccs(mccs, engine, concurrency)
+    candidates = [(mcc, mnc) for mcc in live_mccs for mnc in sorted(set(mncs))]
+    probed = asyncio.run(probe_names_async([mnc_zone(mcc, mnc) for mcc, mnc in candidates], engine,
+                                           concurrency))
+    return live_mccs, [(mcc, mnc) for mcc, mnc in candidates if probed[mnc_zone(mcc, mnc)][0]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enumerate live MCC/MNC subtrees of pub.3gppnetwork.org.")
+    parser.add_argument('--mcc', type=int, action='append',
+                        help="MCC to probe (repeatable); all 000-999 by default")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of names probed at once")
+    parser.add_argument('--per-server-limit', type=int, default=DEFAULT_PER_SERVER_LIMIT,
+                        help="maximum number of concurrent probes per DNS server")
+    parser.add_argument('--qps', type=float, default=DEFAULT_QPS,
+                        help="maximum queries per second sent to each DNS server")
+    parser.add_argument('--output', help="write the live MCCs and MCC-MNC pairs to this JSON file")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+
+    engine = LookupEngine(qps=args.qps, per_server_limit=args.per_server_limit)
+    live_mccs, plmns = enumerate_plmns(engine, args.mcc or range(1000), concurrency=args.concurrency)
+    engine.close()
+    print(f"Live MCCs: {', '.join(f'{mcc:03d}' for mcc in live_mccs) or 'none'}")
+    for mcc, mnc in plmns:
+        print(f"Live PLMN subtree: {mnc_zone(mcc, mnc)}")
+    if args.output:
+        save_json_file({"live_mccs": [f"{mcc:03d}" for mcc in live_mccs],
+                        "plmns": [{"MCC": f"{mcc:03d}", "MNC": f"{mnc:03d}"} for mcc, mnc in plmns]},
+                       args.output)
+
+
+if __name__ == "__main__":
+    main()
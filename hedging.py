@@ -0,0 +1,183 @@
+"""
+Hedged DNS lookups across several resolvers.
+
+Instead of asking resolver 1, waiting for its full lifetime and only then
+moving on to resolver 2, a hedged lookup sends the query to the fastest
+known resolver first. If no answer has arrived once that resolver's latency
+percentile has passed, a backup query is fired at the next fastest resolver,
+and so on. The first successful answer wins and the remaining attempts are
+cancelled. A failed attempt immediately hands over to the next resolver.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import threading
+
+# Number of recent latency samples kept per nameserver
+DEFAULT_WINDOW = 100
+# Latency percentile of the current resolver after which a backup query is sent
+DEFAULT_HEDGE_PERCENTILE = 0.9
+# Hedge delay used until a resolver has enough samples
+DEFAULT_HEDGE_DELAY = 0.25
+# Minimum number of samples before a resolver's own percentile is trusted
+MIN_SAMPLES = 5
+# Bounds on the hedge delay in seconds
+MIN_HEDGE_DELAY = 0.01
+MAX_HEDGE_DELAY = 5.0
+
+
+class LatencyTracker:
+    """
+    Thread-safe record of recent response times per nameserver.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, percentile=DEFAULT_HEDGE_PERCENTILE,
+                 default_delay=DEFAULT_HEDGE_DELAY):
+        """
+        Args:
+            window (int, optional): Number of recent samples kept per server.
+            percentile (float, optional): Percentile used as the hedge threshold.
+            default_delay (float, optional): Hedge delay for servers without enough samples.
+        """
+        self.window = window
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+        self.lock = threading.Lock()
+
+    def record(self, server, seconds):
+        """
+        Record how long *server* took to answer.
+
+        Args:
+            server (str): Nameserver address.
+            seconds (float): Observed latency, or the full lifetime for a timeout.
+        """
+        with self.lock:
+            self.samples[server].append(seconds)
+
+    def latency(self, server, percentile):
+        """
+        Get a latency percentile for *server*.
+
+        Args:
+            server (str): Nameserver address.
+            percentile (float): Percentile between 0 and 1.
+
+        Returns:
+            float: Latency in seconds, or None if fewer than MIN_SAMPLES were recorded.
+        """
+        with self.lock:
+            samples = sorted(self.samples.get(server, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(percentile * len(samples)))]
+
+    def hedge_delay(self, server):
+        """
+        Get how long to wait for *server* before sending a backup query.
+
+        Args:
+            server (str): Nameserver address.
+
+        Returns:
+            float: Delay in seconds.
+        """
+        delay = self.latency(server, self.percentile)
+        if delay is None:
+            delay = self.default_delay
+        return min(MAX_HEDGE_DELAY, max(MIN_HEDGE_DELAY, delay))
+
+
+def hedged_first(attempt, resolvers, tracker):
+    """
+    Run attempt(resolver) across *resolvers* with hedging, in worker threads.
+
+    Threads cannot be interrupted, so losing attempts are abandoned rather
+    than cancelled; they end on their own when their lifetime expires.
+
+    Args:
+        attempt (callable): Called with one resolver, returns a result or None on failure.
+        resolvers (list): Resolvers to race, in the order they should be tried.
+        tracker (LatencyTracker): Latencies used to time the hedges.
+
+    Returns:
+        The first non-None result, or None if every attempt failed.
+    """
+    queue = list(resolvers)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(queue)))
+    pending = set()
+    last = None
+
+    def launch():
+        nonlocal last
+        last = queue.pop(0)
+        pending.add(executor.submit(attempt, last))
+
+    try:
+        if queue:
+            launch()
+        while pending:
+            timeout = tracker.hedge_delay(last.nameservers[0]) if queue else None
+            done, _ = concurrent.futures.wait(pending, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for future in done:
+                pending.discard(future)
+                result = future.result()
+                if result:
+                    return result
+                if queue:
+                    launch()
+        return None
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+async def hedged_first_async(attempt, resolvers, tracker):
+    """
+    Asyncio variant of hedged_first(); losing attempts are cancelled.
+
+    Args:
+        attempt (callable): Coroutine function called with one resolver, returns a result or None on failure.
+        resolvers (list): Resolvers to race, in the order they should be tried.
+        tracker (LatencyTracker): Latencies used to time the hedges.
+
+    Returns:
+        The first non-None result, or None if every attempt failed.
+    """
+    queue = list(resolvers)
+    pending = set()
+    last = None
+
+    def launch():
+        nonlocal last
+        last = queue.pop(0)
+        pending.add(asyncio.ensure_future(attempt(last)))
+
+    try:
+        if queue:
+            launch()
+        while pending:
+            timeout = tracker.hedge_delay(last.nameservers[0]) if queue else None
+            done, _ = await asyncio.wait(pending, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for task in done:
+                pending.discard(task)
+                result = task.result()
+                if result:
+                    return result
+                if queue:
+                    launch()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
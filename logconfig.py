@@ -0,0 +1,96 @@
+"""
+Logging setup shared by the command-line scripts.
+
+Modules log through ``logging.getLogger(__name__)`` with %-style arguments,
+so a message that is filtered out is never formatted. Per-query tracing
+(every NAPTR/SRV query, record and error) is logged at DEBUG and is off by
+default; progress and the end-of-run summary counters are logged at INFO.
+Console output goes through tqdm.write() so it does not tear the progress
+bars. With --log-json, every record is also appended to a JSON Lines file,
+including any structured fields passed with ``extra=``.
+"""
+
+import json
+import logging
+import sys
+
+from tqdm import tqdm
+
+CONSOLE_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+# Attributes every LogRecord has; anything else was passed with extra=
+RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class TqdmHandler(logging.Handler):
+    """
+    Console handler that writes above any active tqdm progress bar.
+    """
+
+    def emit(self, record):
+        try:
+            tqdm.write(self.format(record), file=sys.stderr)
+        except Exception:
+            self.handleError(record)
+
+
+class JSONLinesHandler(logging.FileHandler):
+    """
+    File handler that writes one JSON object per record.
+    """
+
+    def format(self, record):
+        event = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        event.update({key: value for key, value in vars(record).items() if key not in RESERVED_ATTRS})
+        return json.dumps(event, default=str)
+
+
+def setup_logging(level='INFO', trace=False, json_path=None):
+    """
+    Configure the root logger for a command-line run.
+
+    Args:
+        level (str, optional): Console log level, e.g. 'INFO' or 'WARNING'.
+        trace (bool, optional): Log every DNS query at DEBUG level.
+        json_path (str, optional): Also append every record to this JSON Lines file.
+    """
+    level = logging.DEBUG if trace else getattr(logging, level.upper())
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.setLevel(level)
+
+    console = TqdmHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    root.addHandler(console)
+
+    if json_path:
+        root.addHandler(JSONLinesHandler(json_path, encoding='utf-8'))
+
+
+def add_logging_arguments(parser):
+    """
+    Add the --log-level, --trace and --log-json options to an argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): Parser of a command-line script.
+    """
+    parser.add_argument('--log-level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                        help="console log level")
+    parser.add_argument('--trace', action='store_true',
+                        help="log every DNS query, record and error (DEBUG level)")
+    parser.add_argument('--log-json', metavar='PATH',
+                        help="also append every log record to this JSON Lines file")
+
+
+def setup_logging_from_args(args):
+    """
+    Configure logging from the options added by add_logging_arguments().
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments.
+    """
+    setup_logging(level=args.log_level, trace=args.trace, json_path=args.log_json)
@@ -0,0 +1,95 @@
+"""
+Classification of DNS lookup outcomes.
+
+Every NAPTR/SRV lookup reports one of the statuses below. SUCCESS, NXDOMAIN
+and NODATA are definitive: any recursive resolver would return the same
+thing, so there is no point in asking the next one. TIMEOUT, SERVFAIL and
+ERROR are transient and are retried on another resolver.
+
+REFERRAL is an empty answer without the AA flag that points at the
+nameservers of a zone further down (NS records, no SOA, in the authority
+section). Only servers that do not recurse, such as the authoritative
+servers of pub.3gppnetwork.org (see authoritative.py), send one. It is not
+definitive, since the servers that hold the name were never asked, but it
+is a healthy response and does not count against the server.
+"""
+
+import dns.exception
+import dns.flags
+import dns.rdatatype
+import dns.resolver
+
+SUCCESS = 'success'
+NXDOMAIN = 'nxdomain'
+NODATA = 'nodata'
+TIMEOUT = 'timeout'
+SERVFAIL = 'servfail'
+ERROR = 'error'
+REFERRAL = 'referral'
+
+DEFINITIVE_STATUSES = (SUCCESS, NXDOMAIN, NODATA)
+# Statuses of responses that say nothing bad about the server that sent them
+HEALTHY_STATUSES = DEFINITIVE_STATUSES + (REFERRAL,)
+
+
+def is_referral(response):
+    """
+    Check whether an empty NOERROR response is a referral rather than a NODATA answer.
+
+    Args:
+        response (dns.message.Message): DNS response without answer records.
+
+    Returns:
+        bool: True if the response is not authoritative and delegates to other nameservers.
+    """
+    if response is None or response.flags & dns.flags.AA:
+        return False
+    authority_types = {rrset.rdtype for rrset in response.authority}
+    return dns.rdatatype.NS in authority_types and dns.rdatatype.SOA not in authority_types
+
+
+def classify_exception(exc):
+    """
+    Map an exception raised by resolver.resolve() to a lookup status.
+
+    Args:
+        exc (Exception): Exception raised by the lookup.
+
+    Returns:
+        str: One of NXDOMAIN, NODATA, REFERRAL, TIMEOUT, SERVFAIL or ERROR.
+    """
+    if isinstance(exc, dns.resolver.NXDOMAIN):
+        return NXDOMAIN
+    if isinstance(exc, dns.resolver.NoAnswer):
+        return REFERRAL if is_referral(exc.kwargs.get('response')) else NODATA
+    if isinstance(exc, dns.exception.Timeout):
+        return TIMEOUT
+    if isinstance(exc, dns.resolver.NoNameservers):
+        return SERVFAIL
+    return ERROR
+
+
+def is_definitive(status):
+    """
+    Check whether a lookup status settles the question for every resolver.
+
+    Args:
+        status (str): Lookup status.
+
+    Returns:
+        bool: True for SUCCESS, NXDOMAIN and NODATA.
+    """
+    return status in DEFINITIVE_STATUSES
+
+
+def is_healthy(status):
+    """
+    Check whether a lookup status comes from a server that answered properly.
+
+    Args:
+        status (str): Lookup status.
+
+    Returns:
+        bool: True for the definitive statuses and REFERRAL.
+    """
+    return status in HEALTHY_STATUSES
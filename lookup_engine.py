@@ -0,0 +1,762 @@
+"""
+Shared NAPTR/SRV/A/AAAA lookup engine for main.py, domains.py, test.py and enumerate_plmn.py.
+
+A LookupEngine owns everything a lookup needs: the resolver pool (sync and
+asyncio resolvers for the same servers), the persistent answer cache from
+dns_cache, the per-nameserver rate limiter, the resolver latency tracker
+used for hedging, the retry policy (only transient failures move on to
+another resolver, see lookup.py) and the query metrics (see metrics.py) and the
+adaptive resolver scores that decide which server is asked first (see
+scoring.py), and, optionally, the pipelined TCP/TLS connections the asyncio
+lookups are sent over instead of UDP (see transport.py). Every
+script builds one engine and routes all queries through it, so a change to
+any of these applies everywhere at once.
+"""
+
+import asyncio
+import ipaddress
+import logging
+import re
+import time
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+
+from dns_cache import cached_answer, get_default_cache, negative_ttl
+from hedging import LatencyTracker, hedged_first, hedged_first_async
+from lookup import NODATA, REFERRAL, SUCCESS, classify_exception, is_definitive, is_healthy
+from metrics import SweepMetrics
+from scoring import DEFAULT_SCORES_PATH, ResolverScores
+from ratelimit import DEFAULT_QPS, setup_rate_limiter
+from transport import ConnectionPool
+
+log = logging.getLogger(__name__)
+
+# Public recursive resolvers the lookups are spread over
+DNS_SERVERS = ['1.1.1.1', '8.8.8.8', '9.9.9.9', "208.67.222.222", "8.26.56.26", "76.76.2.0"]
+# Upper bound on realms being resolved at once across the whole sweep
+DEFAULT_CONCURRENCY = 64
+# Upper bound on queries in flight to any single DNS server
+DEFAULT_PER_SERVER_LIMIT = 16
+# Seconds a single query may take, retries included
+DEFAULT_LIFETIME = 5
+# Minimum time an unsupported PLMN is trusted before it is re-queried in an
+# incremental sweep; each entry adds a stable per-PLMN jitter of up to the same
+# amount so re-checks are spread over the following weeks instead of bunching up
+DEFAULT_NEGATIVE_TTL_FLOOR = 42 * 24 * 3600
+# NAPTR service field of an OpenRoaming RadSec realm
+RADSEC_SERVICE = b'aaa+auth:radius.tls.tcp'
+# A valid host: letters, digits and '-._' only (\w is str.isalnum() plus '_')
+HOST_PATTERN = re.compile(r'[\w.-]*')
+# Any character a valid host may not contain, apart from the newline joining a batch
+INVALID_HOST_CHARACTER = re.compile(r'[^\w.\n-]')
+
+
+def validate_host(host):
+    """
+    Validate host format.
+
+    Args:
+        host (str): Hostname to be validated.
+
+    Returns:
+        bool: True if the host format is valid, False otherwise.
+    """
+    return HOST_PATTERN.fullmatch(host) is not None
+
+
+def validate_hosts(hosts):
+    """
+    Validate the format of a whole batch of hosts at once.
+
+    The batch is joined into one string and scanned with a single search;
+    only a batch that contains an invalid host is checked host by host.
+
+    Args:
+        hosts (list): Hostnames to be validated.
+
+    Returns:
+        list: One boolean per host, True if its format is valid.
+    """
+    joined = '\n'.join(hosts)
+    if joined.count('\n') == len(hosts) - 1 and not INVALID_HOST_CHARACTER.search(joined):
+        return [True] * len(hosts)
+    return [validate_host(host) for host in hosts]
+
+
+def naptr_records(answers):
+    """
+    Pick the RadSec records out of a NAPTR answer.
+
+    Args:
+        answers (dns.resolver.Answer): NAPTR answer.
+
+    Returns:
+        list: (order, preference, replacement) tuples of the records whose service is
+        RADSEC_SERVICE, sorted by order and then preference (RFC 3403).
+    """
+    return sorted({(rdata.order, rdata.preference, rdata.replacement.to_text().strip('.'))
+                   for rdata in answers if RADSEC_SERVICE in rdata.service.lower()})
+
+
+def srv_records(answers):
+    """
+    Pick the usable targets out of an SRV answer.
+
+    Args:
+        answers (dns.resolver.Answer): SRV answer.
+
+    Returns:
+        list: (priority, weight, port, target) tuples with a valid target host, sorted by
+        priority and then by descending weight (RFC 2782).
+    """
+    records = list({(rdata.priority, rdata.weight, rdata.port, rdata.target.to_text().strip('.'))
+                    for rdata in answers})
+    valid = validate_hosts([record[3] for record in records])
+    return sorted((record for record, ok in zip(records, valid) if ok),
+                  key=lambda record: (record[0], -record[1], record[3], record[2]))
+
+
+def address_records(answers):
+    """
+    Args:
+        answers (dns.resolver.Answer): A or AAAA answer.
+
+    Returns:
+        list: The addresses, in numeric order.
+    """
+    return sorted({rdata.address for rdata in answers}, key=ipaddress.ip_address)
+
+
+# How the records of each looked-up type are picked out of an answer
+RECORD_PARSERS = {'NAPTR': naptr_records, 'SRV': srv_records, 'A': address_records, 'AAAA': address_records}
+ADDRESS_TYPES = ('A', 'AAAA')
+
+
+def setup_resolvers(servers=DNS_SERVERS, port=53, cache=None):
+    """
+    Setup DNS resolvers with custom DNS servers, rotating through them.
+    All resolvers share one answer cache, the persistent one from dns_cache by default.
+
+    Args:
+        servers (list, optional): Nameserver addresses, one resolver each.
+        port (int, optional): Port the nameservers listen on.
+        cache (dns.resolver.CacheBase, optional): Answer cache to use instead of the persistent one.
+
+    Returns:
+        list: List of configured DNS resolvers.
+    """
+    if cache is None:
+        cache = get_default_cache()
+    resolver_list = []
+    for server in servers:
+        resolver = dns.resolver.Resolver()
+        resolver.nameservers = [server]
+        resolver.port = port
+        resolver.cache = cache
+        resolver_list.append(resolver)
+    return resolver_list
+
+
+def setup_async_resolvers(resolvers):
+    """
+    Setup asyncio DNS resolvers for the same servers as *resolvers*.
+
+    Args:
+        resolvers (list): Resolvers as returned by setup_resolvers().
+
+    Returns:
+        list: List of configured dns.asyncresolver.Resolver objects.
+    """
+    resolver_list = []
+    for resolver in resolvers:
+        async_resolver = dns.asyncresolver.Resolver()
+        async_resolver.nameservers = resolver.nameservers
+        async_resolver.port = resolver.port
+        async_resolver.cache = resolver.cache
+        resolver_list.append(async_resolver)
+    return resolver_list
+
+
+class LookupEngine:
+    """
+    Resolver pool, cache, rate limiter, retry policy, metrics and scores shared by every lookup.
+    """
+
+    def __init__(self, servers=DNS_SERVERS, port=53, qps=DEFAULT_QPS,
+                 per_server_limit=DEFAULT_PER_SERVER_LIMIT, hedge=True, lifetime=DEFAULT_LIFETIME,
+                 metrics=None, scores=None, srv_engine=None, transport='udp', transport_port=None,
+                 cache=None):
+        """
+        Args:
+            servers (list, optional): Nameserver addresses to spread lookups over.
+            port (int, optional): Port the nameservers listen on.
+            qps (float, optional): Ceiling on queries per second per nameserver.
+            per_server_limit (int, optional): Limit on concurrent asyncio lookups per nameserver.
+            hedge (bool, optional): Race resolvers instead of trying them one after the other.
+            lifetime (float, optional): Seconds a single query may take.
+            metrics (metrics.SweepMetrics, optional): Where to record every query, a new one by default.
+            scores (scoring.ResolverScores, optional): Resolver scores, by default the ones saved
+                by the previous run.
+            srv_engine (LookupEngine, optional): Engine that resolves the SRV step of resolve(),
+                for servers that only answer the NAPTR names (see authoritative.py).
+            transport (str, optional): 'udp', or 'tcp'/'tls' to pipeline the asyncio lookups over
+                one persistent connection per nameserver (see transport.py). The synchronous
+                lookups always use UDP.
+            transport_port (int, optional): Port for the 'tcp'/'tls' connections, by default
+                *port* for 'tcp' and 853 for 'tls'.
+            cache (dns.resolver.CacheBase, optional): Answer cache, by default the persistent
+                one from dns_cache.
+        """
+        self.resolvers = setup_resolvers(servers, port, cache)
+        self.async_resolvers = setup_async_resolvers(self.resolvers)
+        self.limiter = setup_rate_limiter(self.resolvers, qps=qps)
+        self.tracker = LatencyTracker() if hedge else None
+        self.per_server_limit = per_server_limit
+        self.lifetime = lifetime
+        self.metrics = metrics or SweepMetrics()
+        self.scores = scores or ResolverScores(DEFAULT_SCORES_PATH)
+        self.srv_engine = srv_engine
+        self.pool = ConnectionPool(transport, transport_port) if transport != 'udp' else None
+        self._loop = None
+        self._server_limits = {}
+
+    def server_limits(self):
+        """
+        Return the per-nameserver semaphores for the running event loop.
+
+        asyncio primitives belong to one event loop, so a fresh set is created
+        whenever the engine is used from a new asyncio.run().
+
+        Returns:
+            dict: asyncio.Semaphore per nameserver address.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._server_limits = {resolver.nameservers[0]: asyncio.Semaphore(self.per_server_limit)
+                                   for resolver in self.async_resolvers}
+        return self._server_limits
+
+    def close(self):
+        """Save the resolver scores for the next run."""
+        if self.pool:
+            log.debug("Opened %d %s connections", self.pool.connections_opened(), self.pool.transport)
+        self.scores.save()
+        if self.srv_engine:
+            self.srv_engine.close()
+
+    def outcome_counts(self):
+        """
+        Count the lookups made so far.
+
+        Returns:
+            dict: Counts keyed by record type, then by status.
+        """
+        return self.metrics.outcome_counts()
+
+    def outcome_summary(self):
+        """
+        Summarise the lookups made so far.
+
+        Returns:
+            str: Counts per record type and status, e.g. 'NAPTR nxdomain=2510, NAPTR success=11',
+            followed by the lookups answered from the cache, e.g. 'cached NAPTR nxdomain=2400'.
+        """
+        return ', '.join([f"{rdtype} {status}={count}"
+                          for rdtype, counts in self.outcome_counts().items()
+                          for status, count in counts.items()]
+                         + [f"cached {rdtype} {status}={count}"
+                            for rdtype, counts in self.metrics.cache_hit_counts().items()
+                            for status, count in counts.items()])
+
+    def _resolve_async(self, resolver, name, rdtype):
+        if self.pool:
+            return self.pool.resolve(resolver, name, rdtype, self.lifetime)
+        return resolver.resolve(name, rdtype, lifetime=self.lifetime)
+
+    def _failed(self, name, rdtype, server, exc, elapsed):
+        self.limiter.record_exception(server, exc)
+        status = classify_exception(exc)
+        self.metrics.observe(server, rdtype, status, elapsed)
+        self.scores.record(server, elapsed, not is_healthy(status))
+        log.debug("Error during %s lookup for %s: %s", rdtype, name, exc,
+                  extra={'event': 'query', 'qname': name, 'rdtype': rdtype, 'server': server,
+                         'status': status})
+        return None, status, negative_ttl(exc)
+
+    def _answered(self, name, rdtype, server, answers, elapsed):
+        records = RECORD_PARSERS[rdtype](answers)
+        for rdata in answers:
+            log.debug("Found %s record: %s", rdtype, rdata)
+        if not records:
+            log.debug("No valid %s record found for %s", rdtype, name)
+        status = SUCCESS if records else NODATA
+        self.limiter.record(server, False)
+        self.metrics.observe(server, rdtype, status, elapsed)
+        self.scores.record(server, elapsed, False)
+        return records, status, answers.rrset.ttl
+
+    def _cached(self, name, rdtype, resolver):
+        """Answer a lookup from the resolver's cache, or return None if it is not cached."""
+        try:
+            answers = cached_answer(resolver.cache, name, rdtype)
+        except dns.exception.DNSException as e:
+            result = None, classify_exception(e), negative_ttl(e)
+        else:
+            if answers is None:
+                return None
+            records = RECORD_PARSERS[rdtype](answers)
+            result = records, SUCCESS if records else NODATA, answers.rrset.ttl
+        # Not a query: no rate-limit token, no latency sample and no score update
+        self.metrics.observe_cache_hit(rdtype, result[1])
+        log.debug("Cached %s answer for %s: %s", rdtype, name, result[1],
+                  extra={'event': 'cache_hit', 'qname': name, 'rdtype': rdtype, 'status': result[1]})
+        return result
+
+    def lookup(self, name, rdtype, resolver):
+        """
+        Perform one DNS lookup using a specified resolver.
+
+        The answer cache is checked first. A cached answer is returned without
+        waiting for the rate limiter, and is counted apart from the queries
+        (see metrics.py) rather than fed into the metrics and resolver scores.
+
+        Args:
+            name (str): Name to look up.
+            rdtype (str): 'NAPTR', 'SRV', 'A' or 'AAAA'.
+            resolver (dns.resolver.Resolver): One of the engine's resolvers.
+
+        Returns:
+            tuple: The usable records (see naptr_records(), srv_records() and
+            address_records()), or None on error, the lookup status (see lookup.py),
+            and the TTL (positive or negative) of the answer, or None if no answer was received.
+        """
+        cached = self._cached(name, rdtype, resolver)
+        if cached:
+            return cached
+        server = resolver.nameservers[0]
+        log.debug("Performing %s lookup for %s using resolver %s", rdtype, name, server)
+        self.limiter.acquire(server)
+        start = time.monotonic()
+        try:
+            answers = resolver.resolve(name, rdtype, lifetime=self.lifetime)
+        except Exception as e:
+            return self._failed(name, rdtype, server, e, time.monotonic() - start)
+        return self._answered(name, rdtype, server, answers, time.monotonic() - start)
+
+    async def lookup_async(self, name, rdtype, resolver):
+        """
+        Asyncio variant of lookup().
+
+        Args:
+            name (str): Name to look up.
+            rdtype (str): 'NAPTR', 'SRV', 'A' or 'AAAA'.
+            resolver (dns.asyncresolver.Resolver): One of the engine's asyncio resolvers.
+
+        Returns:
+            tuple: Records, lookup status and TTL, as for lookup().
+        """
+        cached = self._cached(name, rdtype, resolver)
+        if cached:
+            return cached
+        server = resolver.nameservers[0]
+        log.debug("Performing %s lookup for %s using resolver %s", rdtype, name, server)
+        await self.limiter.acquire_async(server)
+        start = time.monotonic()
+        try:
+            answers = await self._resolve_async(resolver, name, rdtype)
+        except asyncio.CancelledError:
+            # Lost a hedged race: the server took at least this long, but did not answer
+            self.scores.record_cancelled(server, time.monotonic() - start)
+            raise
+        except Exception as e:
+            return self._failed(name, rdtype, server, e, time.monotonic() - start)
+        return self._answered(name, rdtype, server, answers, time.monotonic() - start)
+
+    def naptr(self, realm, resolver):
+        """
+        Perform NAPTR DNS lookup on the given realm using a specified resolver.
+
+        Args:
+            realm (str): The realm to perform the NAPTR lookup on.
+            resolver (dns.resolver.Resolver): One of the engine's resolvers.
+
+        Returns:
+            tuple: The RadSec NAPTR records as returned by naptr_records(), or None on error,
+            the lookup status and the TTL, as for lookup().
+        """
+        return self.lookup(realm, 'NAPTR', resolver)
+
+    async def naptr_async(self, realm, resolver):
+        """
+        Asyncio variant of naptr().
+
+        Args:
+            realm (str): The realm to perform the NAPTR lookup on.
+            resolver (dns.asyncresolver.Resolver): One of the engine's asyncio resolvers.
+
+        Returns:
+            tuple: NAPTR records, lookup status and TTL, as for naptr().
+        """
+        return await self.lookup_async(realm, 'NAPTR', resolver)
+
+    def resolve_records(self, name, rdtype):
+        """
+        Look up a record on the servers in score order, until one answers definitively.
+
+        Args:
+            name (str): Name to look up.
+            rdtype (str): 'SRV', 'A' or 'AAAA'.
+
+        Returns:
+            tuple: Records, lookup status and TTL, as for lookup(); (None, None, None)
+            without servers.
+        """
+        result = None, None, None
+        for resolver in self.scores.order(self.resolvers):
+            result = self.lookup(name, rdtype, resolver)
+            if is_definitive(result[1]):
+                break
+        return result
+
+    async def resolve_records_async(self, name, rdtype, offset=0):
+        """
+        Asyncio variant of resolve_records().
+
+        Args:
+            name (str): Name to look up.
+            rdtype (str): 'SRV', 'A' or 'AAAA'.
+            offset (int, optional): Rotation of the equally good servers, see scoring.ResolverScores.order().
+
+        Returns:
+            tuple: Records, lookup status and TTL, as for lookup().
+        """
+        server_limits = self.server_limits()
+        result = None, None, None
+        for resolver in self.scores.order(self.async_resolvers, offset):
+            async with server_limits[resolver.nameservers[0]]:
+                result = await self.lookup_async(name, rdtype, resolver)
+            if is_definitive(result[1]):
+                break
+        return result
+
+    def resolve_srv(self, host):
+        """
+        Look up the SRV records of *host*, see resolve_records().
+
+        Returns:
+            tuple: SRV records as returned by srv_records(), lookup status and TTL.
+        """
+        return self.resolve_records(host, 'SRV')
+
+    async def resolve_srv_async(self, host, offset=0):
+        """
+        Asyncio variant of resolve_srv().
+
+        Returns:
+            tuple: SRV records, lookup status and TTL.
+        """
+        return await self.resolve_records_async(host, 'SRV', offset)
+
+    def resolve_addresses(self, host):
+        """
+        Look up the IPv4 and IPv6 addresses of *host*.
+
+        Returns:
+            tuple: Sorted lists of IPv4 and IPv6 addresses, empty where the lookup failed.
+        """
+        return tuple(self.resolve_records(host, rdtype)[0] or [] for rdtype in ADDRESS_TYPES)
+
+    async def resolve_addresses_async(self, host, offset=0):
+        """
+        Asyncio variant of resolve_addresses(); the A and AAAA lookups run concurrently.
+
+        Returns:
+            tuple: Sorted lists of IPv4 and IPv6 addresses, empty where the lookup failed.
+        """
+        results = await asyncio.gather(*(self.resolve_records_async(host, rdtype, offset)
+                                         for rdtype in ADDRESS_TYPES))
+        return tuple(result[0] or [] for result in results)
+
+    def resolve_naptr(self, realm):
+        """
+        First stage of resolve(): look up a realm's NAPTR records.
+
+        Resolvers are tried in score order, healthiest first. Without hedging
+        they are tried one after the other. With it, a backup resolver is asked
+        once the current one is slower than its usual latency percentile, and
+        the first definitive answer wins. Only transient failures (timeouts,
+        SERVFAIL) move on to another resolver; an NXDOMAIN or NODATA answer is
+        the same from every resolver and ends the lookup.
+
+        Non-recursive servers (see authoritative.py) answer a realm delegated
+        to other nameservers with a referral. The other servers of the zone
+        would refer the same way, so the realm is handed to *srv_engine*,
+        which follows the delegation.
+
+        Args:
+            realm (str): Realm to resolve, e.g. 'wlan.mnc280.mcc310.pub.3gppnetwork.org'.
+
+        Returns:
+            tuple: NAPTR records, lookup status and TTL, as for naptr(); (None, None, None)
+            if no resolver answered definitively.
+        """
+        def attempt(resolver):
+            start = time.monotonic()
+            result = self.naptr(realm, resolver)
+            if self.tracker:
+                self.tracker.record(resolver.nameservers[0], time.monotonic() - start)
+            # Transient: ask another resolver
+            return result if is_definitive(result[1]) or result[1] == REFERRAL else None
+
+        ordered = self.scores.order(self.resolvers)
+        if self.tracker:
+            result = hedged_first(attempt, ordered, self.tracker)
+        else:
+            result = None
+            for resolver in ordered:
+                result = attempt(resolver)
+                if result:
+                    break  # Stop as soon as we get a definitive answer
+
+        if result and result[1] == REFERRAL:
+            log.debug("%s is delegated further down, asking the recursive resolvers.", realm)
+            return self.srv_engine.resolve_naptr(realm) if self.srv_engine else (None, None, None)
+        return result or (None, None, None)
+
+    async def resolve_naptr_async(self, realm, offset=0):
+        """
+        Asyncio variant of resolve_naptr().
+
+        *offset* rotates the equally good servers at the top of the score
+        order, so that concurrent realms start on different servers instead of
+        all queueing on the first one. With hedging, losing attempts are
+        cancelled; the latency the hedge delay is based on includes the time
+        spent waiting for the server's semaphore from server_limits() and its
+        rate limiter.
+
+        Args:
+            realm (str): Realm to resolve.
+            offset (int, optional): Rotation of the equally good servers, see scoring.ResolverScores.order().
+
+        Returns:
+            tuple: NAPTR records, lookup status and TTL, as for resolve_naptr().
+        """
+        server_limits = self.server_limits()
+        ordered = self.scores.order(self.async_resolvers, offset)
+
+        async def attempt(resolver):
+            start = time.monotonic()
+            async with server_limits[resolver.nameservers[0]]:
+                result = await self.naptr_async(realm, resolver)
+            if self.tracker:
+                self.tracker.record(resolver.nameservers[0], time.monotonic() - start)
+            # Transient: ask another resolver
+            return result if is_definitive(result[1]) or result[1] == REFERRAL else None
+
+        if self.tracker:
+            result = await hedged_first_async(attempt, ordered, self.tracker)
+        else:
+            result = None
+            for resolver in ordered:
+                result = await attempt(resolver)
+                if result:
+                    break
+
+        if result and result[1] == REFERRAL:
+            log.debug("%s is delegated further down, asking the recursive resolvers.", realm)
+            if self.srv_engine:
+                return await self.srv_engine.resolve_naptr_async(realm, offset)
+            return None, None, None
+        return result or (None, None, None)
+
+    @property
+    def srv_resolver(self):
+        """LookupEngine: Engine that resolves the SRV and address stages, see *srv_engine*."""
+        return self.srv_engine or self
+
+    def _combine(self, realm, naptr_result, srv_results, address_results):
+        """Merge the NAPTR, SRV and address stages of a realm into a resolve() result."""
+        naptrs, status, ttl = naptr_result
+        if not naptrs:
+            return False, None, None, (ttl or 0) if is_definitive(status) else 0, []
+        endpoints = []
+        ttls = [ttl]
+        transient = False
+        for order, preference, service in naptrs:
+            targets, status, srv_ttl = srv_results[service]
+            transient = transient or not is_definitive(status)
+            if srv_ttl is not None:
+                ttls.append(srv_ttl)
+            if not targets:
+                continue
+            endpoint = {'service': service, 'order': order, 'preference': preference, 'targets': []}
+            for priority, weight, port, target in targets:
+                ipv4, ipv6 = address_results[target]
+                endpoint['targets'].append({'host': target, 'port': port, 'priority': priority,
+                                            'weight': weight, 'ipv4': ipv4, 'ipv6': ipv6})
+            endpoints.append(endpoint)
+        if endpoints:
+            primary = endpoints[0]['targets'][0]
+            log.debug("Successful lookup: %s -> %s:%s", realm, primary['host'], primary['port'])
+            return True, primary['host'], primary['port'], min(ttls), endpoints
+        # A transient SRV failure leaves the realm unresolved rather than unsupported
+        return False, None, None, 0 if transient else min(ttls), []
+
+    def resolve(self, realm):
+        """
+        Resolve a realm to its RadSec servers by NAPTR, SRV and A/AAAA lookups.
+
+        See resolve_naptr() for the NAPTR stage and resolve_records() for the
+        others. To resolve many realms, resolve_many() looks up each SRV name
+        and each server address only once.
+
+        Args:
+            realm (str): Realm to resolve, e.g. 'wlan.mnc280.mcc310.pub.3gppnetwork.org'.
+
+        Returns:
+            tuple: A boolean indicating success, the host and port of the preferred server,
+            how long in seconds the result may be trusted (0 if no resolver gave a usable
+            answer), and the list of endpoints, see resolve_many().
+        """
+        return self.resolve_many({realm: realm})[realm]
+
+    async def resolve_async(self, realm, offset=0):
+        """
+        Asyncio variant of resolve().
+
+        Args:
+            realm (str): Realm to resolve.
+            offset (int, optional): Rotation of the equally good servers, see scoring.ResolverScores.order().
+
+        Returns:
+            tuple: Success, host, port, TTL and endpoints, as for resolve().
+        """
+        naptr_result = await self.resolve_naptr_async(realm, offset)
+        services = _services({realm: naptr_result})
+        srv_results = dict(zip(services, await asyncio.gather(
+            *(self.srv_resolver.resolve_srv_async(service, offset) for service in services))))
+        targets = _targets(srv_results)
+        address_results = dict(zip(targets, await asyncio.gather(
+            *(self.srv_resolver.resolve_addresses_async(target, offset) for target in targets))))
+        return self._combine(realm, naptr_result, srv_results, address_results)
+
+    def resolve_many(self, realms, on_result=None):
+        """
+        Resolve many realms in stages, looking up each SRV name and each server only once.
+
+        Many realms' NAPTR records point at the same SRV owner (a hosted
+        identity provider serving several carriers). The NAPTR records of every
+        realm are looked up first, then each distinct SRV owner among them
+        once, then the addresses of each distinct SRV target once, and the
+        results are shared by all the realms pointing at them.
+
+        A realm's endpoints list its RadSec NAPTR records by order and
+        preference, each as a dict with the SRV owner ('service'), 'order',
+        'preference' and its 'targets'. The targets are sorted by priority and
+        then by descending weight, each as a dict with 'host', 'port',
+        'priority', 'weight' and its 'ipv4' and 'ipv6' addresses. Clients
+        should pick among the targets of equal priority by weight (RFC 2782).
+        The host and port of the result are those of the first target.
+
+        Args:
+            realms (dict): Realms to resolve, keyed by any caller-side key.
+            on_result (callable, optional): Called as on_result(key, result) as each realm
+                completes; realms without a NAPTR hit complete in the first stage.
+
+        Returns:
+            dict: Success, host, port, TTL and endpoints tuples, as for resolve(), keyed
+            like *realms*.
+        """
+        results = {}
+        hits = {}
+        for key, realm in realms.items():
+            naptr_result = self.resolve_naptr(realm)
+            if naptr_result[0]:
+                hits[key] = naptr_result
+                continue
+            results[key] = self._combine(realm, naptr_result, {}, {})
+            if on_result:
+                on_result(key, results[key])
+        srv_results = {service: self.srv_resolver.resolve_srv(service) for service in _services(hits)}
+        address_results = {target: self.srv_resolver.resolve_addresses(target)
+                           for target in _targets(srv_results)}
+        results.update(self._fan_out({key: realms[key] for key in hits}, hits, srv_results,
+                                     address_results, on_result))
+        return results
+
+    async def resolve_many_async(self, realms, concurrency, on_result=None):
+        """
+        Asyncio variant of resolve_many().
+
+        Each stage runs *concurrency* workers; the realms without a NAPTR hit,
+        usually nearly all of them, are reported to *on_result* as soon as
+        their NAPTR lookup completes. *realms* may also be a lazy iterable of
+        (key, realm) pairs, e.g. from realms.iter_realms(), which is consumed
+        only as fast as the workers take realms from it.
+
+        Args:
+            realms (dict or iterable): Realms to resolve, keyed by any caller-side key.
+            concurrency (int): Global limit on names being resolved at once.
+            on_result (callable, optional): Called as on_result(key, result) as each realm completes.
+
+        Returns:
+            dict: Success, host, port, TTL and endpoints tuples, as for resolve(), keyed
+            like *realms*.
+        """
+        results = {}
+        hits = {}
+        hit_realms = {}
+
+        async def run(items, resolve_item):
+            pending = iter(enumerate(items))
+            resolved = {}
+
+            async def worker():
+                for index, item in pending:
+                    result = await resolve_item(item, index)
+                    if result is not None:
+                        resolved[item] = result
+
+            workers = min(concurrency, len(items)) if hasattr(items, '__len__') else concurrency
+            await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+            return resolved
+
+        async def resolve_naptr(item, index):
+            key, realm = item
+            naptr_result = await self.resolve_naptr_async(realm, offset=index)
+            if naptr_result[0]:
+                hits[key] = naptr_result
+                hit_realms[key] = realm
+                return
+            results[key] = self._combine(realm, naptr_result, {}, {})
+            if on_result:
+                on_result(key, results[key])
+
+        await run(list(realms.items()) if isinstance(realms, dict) else realms, resolve_naptr)
+        srv_results = await run(_services(hits), self.srv_resolver.resolve_srv_async)
+        address_results = await run(_targets(srv_results), self.srv_resolver.resolve_addresses_async)
+        results.update(self._fan_out(hit_realms, hits, srv_results, address_results, on_result))
+        return results
+
+    def _fan_out(self, realms, naptr_results, srv_results, address_results, on_result):
+        log.debug("Resolved %d distinct SRV names and %d servers for %d NAPTR hits",
+                  len(srv_results), len(address_results), len(naptr_results))
+        results = {}
+        for key, realm in realms.items():
+            results[key] = self._combine(realm, naptr_results[key], srv_results, address_results)
+            if on_result:
+                on_result(key, results[key])
+        return results
+
+
+def _services(naptr_results):
+    """Distinct SRV owner names the NAPTR records of several realms point at."""
+    return sorted({service for records, _, _ in naptr_results.values() for _, _, service in records or ()})
+
+
+def _targets(srv_results):
+    """Distinct SRV targets among several SRV lookups."""
+    return sorted({target for records, _, _ in srv_results.values() for _, _, _, target in records or ()})
@@ -1,49 +1,31 @@
-from mccmnc import find_matches, print_matches, update
-import json
+from mccmnc import find_matches, print_matches
+import argparse
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
 import os
-import dns.resolver
-from tqdm import tqdm
-import mccmnc  # Import the mccmnc module to find its installation path
 import time
-
-def get_mccmnc_json_path():
-    """
-    Dynamically locate the path to the mccmnc.json file based on where the mccmnc module is installed.
-
-    Returns:
-        str: Path to the mccmnc.json file.
-    """
-    mccmnc_dir = os.path.dirname(mccmnc.__file__)
-    json_path = os.path.join(mccmnc_dir, 'mccmnc.json')
-    return json_path
-
-def load_json_file(json_path):
-    """
-    Load data from the specified JSON file.
-
-    Args:
-        json_path (str): Path to the JSON file.
-
-    Returns:
-        dict: Loaded JSON data.
-    """
-    if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    else:
-        return {}
-
-def save_json_file(data, json_path):
-    """
-    Save data to the specified JSON file.
-
-    Args:
-        data (dict): Data to be saved.
-        json_path (str): Path to the JSON file.
-    """
-    with open(json_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=4)
-    print(f"JSON data updated in {json_path}")
+from tqdm import tqdm
+from authoritative import authoritative_engine
+from changes import record_changes
+from checkpoint import ResultJournal, write_json_atomic
+from discover import discover_plmns
+from enumerate_plmn import find_live_mccs
+from logconfig import add_logging_arguments, setup_logging_from_args
+from lookup_engine import DEFAULT_CONCURRENCY, DEFAULT_NEGATIVE_TTL_FLOOR, DEFAULT_PER_SERVER_LIMIT, LookupEngine
+from mccmnc_feed import MCC_MNC_URL, fetch_entries, load_bundle
+from metrics import SweepMetrics
+from plmn_store import load_plmn_data, save_plmn_data
+from ratelimit import DEFAULT_QPS
+from realms import build_realms
+from shard import merge_shards, shard_entries, shard_path
+from transport import TRANSPORTS
+
+log = logging.getLogger(__name__)
+
+# Fields that come from the mcc-mnc.com feed, as opposed to our lookup results
+MCCMNC_FIELDS = ('MCC', 'MNC', 'ISO', 'COUNTRY', 'CC', 'NETWORK')
 
 def construct_realm_url(mcc, mnc, nid=None, service_id=None, use_pub=False):
     """
@@ -60,179 +42,389 @@ def construct_realm_url(mcc, mnc, nid=None, service_id=None, use_pub=False):
     Returns:
         str: Constructed realm URL.
     """
-    realm_suffix = "pub.3gppnetwork.org" if use_pub else "3gppnetwork.org"
-    mnc_str = f"{mnc:03d}"
-    mcc_str = f"{mcc:03d}"
+    return build_realms([mcc], [mnc], nid, service_id, use_pub)[0]
 
-    if nid:
-        realm = f"wlan.nid{nid}.mnc{mnc_str}.mcc{mcc_str}.{realm_suffix}"
-    else:
-        realm = f"wlan.mnc{mnc_str}.mcc{mcc_str}.{realm_suffix}"
+def check_realm_existence(mcc, mnc, engine):
+    """
+    Check if the realm exists by performing NAPTR and SRV lookups.
 
-    if service_id:
-        realm = f"{service_id}.{realm}"
+    Args:
+        mcc (int): Mobile Country Code (3-digit).
+        mnc (int): Mobile Network Code (2 or 3-digit).
+        engine (lookup_engine.LookupEngine): Engine to resolve the realm with.
 
-    return realm
+    Returns:
+        tuple: A tuple containing a boolean indicating success, the host, and the port.
+    """
+    realm_exists, host, port, _, _ = engine.resolve(construct_realm_url(mcc, mnc, use_pub=True))
+    return realm_exists, host, port
 
-def validate_host(host):
+async def check_realm_existence_async(mcc, mnc, engine, offset=0):
     """
-    Validate host format.
+    Asyncio variant of check_realm_existence().
 
     Args:
-        host (str): Hostname to be validated.
+        mcc (int): Mobile Country Code (3-digit).
+        mnc (int): Mobile Network Code (2 or 3-digit).
+        engine (lookup_engine.LookupEngine): Engine to resolve the realm with.
+        offset (int, optional): Index of the resolver to try first.
 
     Returns:
-        bool: True if the host format is valid, False otherwise.
+        tuple: A tuple containing a boolean indicating success, the host, the port, how
+        long in seconds the result may be trusted (0 if no resolver gave a usable answer),
+        and every endpoint of the realm (see LookupEngine.resolve_many()).
     """
-    return all(c.isalnum() or c in '-._' for c in host)
+    return await engine.resolve_async(construct_realm_url(mcc, mnc, use_pub=True), offset=offset)
 
-def setup_resolvers():
+async def sweep_mcc_mnc_async(entries, engine, concurrency=DEFAULT_CONCURRENCY, on_result=None):
     """
-    Setup DNS resolvers with custom DNS servers, rotating through them.
+    Check realm existence for many MCC-MNC entries concurrently.
+
+    At most *concurrency* realms are in flight at once; the per-nameserver
+    limits, rate limiting and hedging come from *engine*. The NAPTR records of
+    all realms are looked up first, then each distinct SRV name they point at
+    once (see LookupEngine.resolve_many_async()), so carriers sharing an
+    identity provider cost one SRV lookup between them.
+
+    Args:
+        entries (dict): MCC-MNC entries keyed by PLMN ID, as loaded from mccmnc.json.
+        engine (lookup_engine.LookupEngine): Engine to resolve the realms with.
+        concurrency (int, optional): Global limit on realms being resolved at once.
+        on_result (callable, optional): Called as on_result(key, value, result) as each entry completes.
 
     Returns:
-        list: List of configured DNS resolvers.
+        dict: (lookup_success, host, port, ttl, endpoints) tuples keyed by PLMN ID.
     """
-    resolver_list = []
-    dns_servers = ['1.1.1.1', '8.8.8.8', '9.9.9.9', "208.67.222.222", "8.26.56.26", "76.76.2.0"]
-    for server in dns_servers:
-        resolver = dns.resolver.Resolver()
-        resolver.nameservers = [server]
-        resolver_list.append(resolver)
-    return resolver_list
+    realms = dict(zip(entries, build_realms([int(value['MCC']) for value in entries.values()],
+                                            [int(value['MNC']) for value in entries.values()], use_pub=True)))
+
+    def finished(key, result):
+        if on_result:
+            on_result(key, entries[key], result)
 
-def naptr_lookup(realm, resolver):
+    return await engine.resolve_many_async(realms, concurrency, on_result=finished)
+
+def needs_lookup(key, value, previous, now, negative_ttl_floor=DEFAULT_NEGATIVE_TTL_FLOOR):
     """
-    Perform NAPTR DNS lookup on the given realm using a specified resolver.
+    Decide whether an MCC-MNC entry has to be re-queried in an incremental sweep.
+
+    An entry is re-queried if it is new or changed in the mccmnc feed, if it
+    was supported last time, if the last lookup got no usable answer, or if its
+    last result has expired. Unsupported entries are trusted for at least
+    *negative_ttl_floor* seconds plus a stable per-PLMN jitter, even if the
+    negative TTL from DNS is shorter.
 
     Args:
-        realm (str): The realm to perform the NAPTR lookup on.
-        resolver (dns.resolver.Resolver): The DNS resolver to use for the lookup.
+        key (str): PLMN ID of the entry.
+        value (dict): Entry from the mccmnc feed.
+        previous (dict): Entry from the last sweep in data/mccmnc.json, or None.
+        now (int): Current time as a Unix timestamp.
+        negative_ttl_floor (int, optional): Minimum lifetime of a negative result in seconds.
 
     Returns:
-        str: Replacement value from the NAPTR record if found, otherwise None.
+        bool: True if the entry must be looked up again.
     """
-    try:
-        print(f"Performing NAPTR lookup for {realm} using resolver {resolver.nameservers[0]}")
-        answers = resolver.resolve(realm, 'NAPTR', lifetime=5)
-        for rdata in answers:
-            print(f"Found NAPTR record: {rdata}")
-            # Use bytes literal for comparison
-            if b'aaa+auth:radius.tls.tcp' in rdata.service.lower():
-                return rdata.replacement.to_text().strip('.')
-        print(f"No valid NAPTR record found for {realm}")
-    except Exception as e:
-        print(f"Error during NAPTR lookup for {realm}: {e}")
-    return None
-
-def srv_lookup(host, resolver):
+    if not previous or 'last_checked' not in previous:
+        return True
+    if any(previous.get(field) != value.get(field) for field in MCCMNC_FIELDS):
+        return True
+    if previous.get('lookup_success') or not previous.get('ttl'):
+        return True
+    lifetime = previous['ttl']
+    if negative_ttl_floor:
+        jitter = int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % negative_ttl_floor
+        lifetime = max(lifetime, negative_ttl_floor + jitter)
+    return now >= previous['last_checked'] + lifetime
+
+def load_mccmnc_entries(local_store_path, local_json_path, bundle=None):
     """
-    Perform SRV DNS lookup on the given host using a specified resolver.
+    Fetch the mcc-mnc.com list and load its entries, falling back to
+    the feed fields of the local results if the fetch fails.
+
+    The list is only ingested again if it changed since the last run (see mccmnc_feed.py).
 
     Args:
-        host (str): The hostname to perform the SRV lookup on.
-        resolver (dns.resolver.Resolver): The DNS resolver to use for the lookup.
+        local_store_path (str): Path to the local columnar store.
+        local_json_path (str): Path to the local data/mccmnc.json.
+        bundle (str, optional): Saved mcc-mnc.com JS bundle to ingest instead of fetching it.
 
     Returns:
-        tuple: A tuple containing the target host and port if found, otherwise (None, None).
+        dict: MCC-MNC entries keyed by PLMN ID, empty if no data is available.
     """
+    # Attempt to fetch the current list; fall back to existing data/mccmnc.json on failure
     try:
-        print(f"Performing SRV lookup for {host} using resolver {resolver.nameservers[0]}")
-        answers = resolver.resolve(host, 'SRV', lifetime=5)
-        for rdata in sorted(answers, key=lambda r: r.priority):
-            print(f"Found SRV record: {rdata}")
-            if validate_host(rdata.target.to_text().strip('.')):
-                return rdata.target.to_text().strip('.'), rdata.port
-        print(f"No valid SRV record found for {host}")
+        original_data = load_bundle(bundle) if bundle else fetch_entries()
+        log.info("Loaded %d entries from %s.", len(original_data), bundle or MCC_MNC_URL)
     except Exception as e:
-        print(f"Error during SRV lookup for {host}: {e}")
-    return None, None
-
-def check_realm_existence(mcc, mnc, resolvers):
+        log.warning("Fetching the mcc-mnc.com list failed (%s). Falling back to local data/mccmnc.json.", e)
+        original_data = load_plmn_data(local_store_path, local_json_path)
+        if not original_data:
+            return {}
+        # Strip any previous lookup results so we re-process cleanly
+        original_data = {k: {fk: fv for fk, fv in v.items() if fk in MCCMNC_FIELDS}
+                         for k, v in original_data.items()}
+        log.info("Loaded %d entries from local data/mccmnc.json fallback.", len(original_data))
+    return original_data
+
+def get_all_active_mcc_mnc(concurrency=DEFAULT_CONCURRENCY, per_server_limit=DEFAULT_PER_SERVER_LIMIT,
+                           qps=DEFAULT_QPS, full=False, negative_ttl_floor=DEFAULT_NEGATIVE_TTL_FLOOR,
+                           hedge=True, enumerate_mccs=False, shard=None, shards=1, entries=None,
+                           authoritative=False, authoritative_servers=None, authoritative_port=53,
+                           transport='udp', transport_port=None, discover=False, mccmnc_bundle=None):
     """
-    Check if the realm exists by performing NAPTR and SRV lookups.
+    Update the database, load existing data, and check realm existence
+    for each MCC-MNC combination with a progress indicator, updating only new or changed data.
 
-    Args:
-        mcc (int): Mobile Country Code (3-digit).
-        mnc (int): Mobile Network Code (2 or 3-digit).
-        resolvers (list): List of DNS resolvers to use for lookups.
+    The mcc-mnc.com list is fetched directly, or read from the saved JS bundle
+    *mccmnc_bundle*, and handed to the sweep without going through the mccmnc
+    package's JSON file (see mccmnc_feed.py).
 
-    Returns:
-        tuple: A tuple containing a boolean indicating success, the host, and the port.
-    """
-    # Construct initial realm URL for the .pub domain
-    realm_url_pub = construct_realm_url(mcc, mnc, use_pub=True)
+    Unless *full* is set, only entries selected by needs_lookup() are queried;
+    every other entry keeps its previous result. With *enumerate_mccs*, the
+    mccYYY.pub.3gppnetwork.org label of every MCC in the queue is probed first
+    and entries under an MCC that does not exist are recorded as unsupported
+    without a lookup of their own (see enumerate_plmn.py).
 
-    # Rotate through DNS resolvers to balance the load
-    for resolver in resolvers:
-        srv_host = naptr_lookup(realm_url_pub, resolver)
-        if srv_host:
-            host, port = srv_lookup(srv_host, resolver)
-            if host and port:
-                print(f"Successful lookup: {realm_url_pub} -> {host}:{port} using resolver {resolver.nameservers[0]}")
-                return True, host, port  # Stop as soon as we find a valid result
+    Every finished entry is journaled to data/mccmnc.journal.jsonl as it
+    completes. If the run is interrupted, the next one resumes from the
+    journal instead of starting over (see checkpoint.py).
 
-        # Introduce a short delay between queries to avoid rate limiting
-        time.sleep(0.1)
+    With *shards* above 1, only the MCCs that fall into *shard* are swept and
+    the results are written to a per-shard file under data/shards/ instead of
+    the published files; shard.py merges the shard files afterwards.
 
-    return False, None, None
+    With *authoritative*, the NAPTR queries go straight to the authoritative
+    servers of pub.3gppnetwork.org instead of the public recursive resolvers
+    (see authoritative.py).
 
-def get_all_active_mcc_mnc():
-    """
-    Update the database, load existing data, and check realm existence
-    for each MCC-MNC combination with a progress indicator, updating only new or changed data.
+    With *transport* 'tcp' or 'tls', the queries are pipelined over one
+    persistent connection per DNS server instead of separate UDP exchanges
+    (see transport.py).
+
+    Once published, the carriers that gained or lost support or moved to
+    another RadSec host or port are appended to data/changes.jsonl (see
+    changes.py).
+
+    With *discover*, the realms of every MNC under each existing MCC that is
+    not in the mcc-mnc.com list are probed afterwards with the same engine,
+    and hits go to data/discovered_plmns.json (see discover.py).
+
+    Args:
+        concurrency (int, optional): Global limit on realms being resolved at once.
+        per_server_limit (int, optional): Limit on concurrent lookups per nameserver.
+        qps (float, optional): Ceiling on queries per second per nameserver.
+        full (bool, optional): Re-query every entry regardless of when it was last checked.
+        negative_ttl_floor (int, optional): Minimum lifetime of a negative result in seconds.
+        hedge (bool, optional): Use hedged lookups instead of serial failover.
+        enumerate_mccs (bool, optional): Prune entries whose whole MCC subtree returns NXDOMAIN.
+        shard (int, optional): Index of the shard to sweep, from 0 to shards - 1.
+        shards (int, optional): Number of shards the MCC space is split into.
+        entries (dict, optional): MCC-MNC entries to sweep instead of updating the database.
+        authoritative (bool, optional): Query the authoritative servers directly.
+        authoritative_servers (list, optional): Authoritative server addresses to use instead
+            of discovering them, e.g. a local stand-in.
+        authoritative_port (int, optional): Port the authoritative servers listen on.
+        transport (str, optional): 'udp', 'tcp' or 'tls' (DNS over TLS).
+        transport_port (int, optional): Port for 'tcp'/'tls' connections, if not the default.
+        discover (bool, optional): Also run the discovery sweep for PLMNs missing from the list.
+        mccmnc_bundle (str, optional): Saved mcc-mnc.com JS bundle to read the list from.
     """
     current_dir = os.path.dirname(os.path.abspath(__file__))
     local_json_path = os.path.join(current_dir, 'data', 'mccmnc.json')
+    local_store_path = os.path.join(current_dir, 'data', 'mccmnc.bin')
+    local_journal_path = os.path.join(current_dir, 'data', 'mccmnc.journal.jsonl')
 
-    # Attempt to update the local database; fall back to existing data/mccmnc.json on failure
-    try:
-        update()
-        original_json_path = get_mccmnc_json_path()
-        original_data = load_json_file(original_json_path)
-        if not original_data:
-            raise ValueError("mccmnc package returned empty data after update()")
-        print(f"Loaded {len(original_data)} entries from mccmnc package.")
-    except (SystemExit, Exception) as e:
-        print(f"Warning: mccmnc.update() failed ({e}). Falling back to local data/mccmnc.json.")
-        original_data = load_json_file(local_json_path)
-        if not original_data:
-            print("Error: No MCC-MNC data available. Exiting.")
-            return
-        # Strip any previous lookup results so we re-process cleanly
-        original_data = {k: {fk: fv for fk, fv in v.items()
-                              if fk in ('MCC', 'MNC', 'ISO', 'COUNTRY', 'CC', 'NETWORK')}
-                         for k, v in original_data.items()}
-        print(f"Loaded {len(original_data)} entries from local data/mccmnc.json fallback.")
+    original_data = entries if entries is not None else load_mccmnc_entries(local_store_path,
+                                                                            local_json_path, mccmnc_bundle)
+    if not original_data:
+        log.error("No MCC-MNC data available. Exiting.")
+        return
+
+    if shards > 1:
+        original_data = shard_entries(original_data, shard, shards)
+        local_journal_path = shard_path(shard, shards, current_dir, suffix='.journal.jsonl')
+        log.info("Shard %d of %d: %d entries.", shard + 1, shards, len(original_data))
 
     # Load existing local results (to preserve any prior lookup data)
-    local_data = load_json_file(local_json_path)
+    local_data = load_plmn_data(local_store_path, local_json_path)
+
+    # Pick up the results an interrupted run had already journaled
+    journal = ResultJournal(local_journal_path)
+    resumed = journal.load()
+    if resumed:
+        local_data.update(resumed)
+        log.info("Resuming from checkpoint: %d entries already looked up.", len(resumed))
+
+    # Only re-query entries that are new, changed, supported or expired
+    if full:
+        pending = original_data
+    else:
+        now = int(time.time())
+        pending = {key: value for key, value in original_data.items()
+                   if needs_lookup(key, value, local_data.get(key), now, negative_ttl_floor)}
+        log.info("Incremental sweep: %d of %d entries need a lookup.", len(pending), len(original_data))
+    pending = {key: value for key, value in pending.items() if key not in resumed}
+
+    run_name = f"main.shard-{shard}-of-{shards}" if shards > 1 else 'main'
+    engine_args = dict(qps=qps, per_server_limit=per_server_limit, hedge=hedge, metrics=SweepMetrics(run_name),
+                       transport=transport, transport_port=transport_port)
+    if authoritative or authoritative_servers:
+        engine = authoritative_engine(authoritative_servers, authoritative_port, **engine_args)
+    else:
+        engine = LookupEngine(**engine_args)
+
+    # Entries looked up by this run or the one it resumes, the only ones that can have changed
+    swept = set(resumed)
 
-    # Setup DNS resolvers with specified DNS servers
-    resolvers = setup_resolvers()
-    
     # Progress indicator setup
-    total = len(original_data)
-    with tqdm(total=total, desc="Processing MCC-MNC combinations") as pbar:
-        for key, value in original_data.items():
+    total = len(pending)
+    with tqdm(total=total, desc="Processing MCC-MNC combinations") as pbar, journal:
+        def record_result(key, value, result):
+            swept.add(key)
             mcc = int(value['MCC'])
             mnc = int(value['MNC'])
-
-            # Always perform the lookup to ensure latest results
-            realm_exists, host, port = check_realm_existence(mcc, mnc, resolvers)
+            realm_exists, host, port, ttl, endpoints = result
             local_data[key] = value  # Update entry with MCC and MNC details
             local_data[key]['lookup_success'] = realm_exists
+            local_data[key]['last_checked'] = int(time.time())
+            local_data[key]['ttl'] = ttl
 
             if realm_exists:
                 local_data[key]['host'] = host
                 local_data[key]['port'] = port
-                print(f"Success: {construct_realm_url(mcc, mnc, use_pub=True)} -> {host}:{port}")
+                local_data[key]['endpoints'] = endpoints
+                log.info("Success: %s -> %s:%s", construct_realm_url(mcc, mnc, use_pub=True), host, port)
+
+            # Checkpoint the result before moving on, so a crash does not lose it
+            journal.append(key, local_data[key])
 
             # Update progress bar
             pbar.update(1)
 
-    # Save updated local data back to the local JSON file
-    save_json_file(local_data, local_json_path)
+        if enumerate_mccs:
+            # Never prune an MCC that had a supported realm, in case its servers
+            # wrongly answer NXDOMAIN for empty non-terminals
+            supported_mccs = {int(v['MCC']) for v in local_data.values() if v.get('lookup_success')}
+            _, pruned_mccs = find_live_mccs({int(v['MCC']) for v in pending.values()}, engine,
+                                            concurrency=concurrency)
+            pruned_mccs = {mcc: ttl for mcc, ttl in pruned_mccs.items() if mcc not in supported_mccs}
+            log.info("%d MCC subtrees do not exist under pub.3gppnetwork.org.", len(pruned_mccs))
+            for key, value in list(pending.items()):
+                if int(value['MCC']) in pruned_mccs:
+                    record_result(key, value, (False, None, None, pruned_mccs[int(value['MCC'])] or 0, []))
+            pending = {key: value for key, value in pending.items()
+                       if int(value['MCC']) not in pruned_mccs}
+
+        asyncio.run(sweep_mcc_mnc_async(pending, engine, concurrency=concurrency,
+                                        on_result=record_result))
+
+    if discover and shards == 1:
+        discover_plmns(engine, original_data, concurrency=concurrency, negative_ttl_floor=negative_ttl_floor)
+    log.info("Lookups: %s", engine.outcome_summary() or 'none',
+             extra={'event': 'summary', 'outcomes': engine.outcome_counts()})
+    engine.close()
+    engine.metrics.finish(entries=total)
+    log.info("Sweep metrics written to %s and %s", *engine.metrics.export())
+
+    if shards > 1:
+        # Leave the published files to the merge step
+        shard_file = shard_path(shard, shards, current_dir)
+        write_json_atomic({key: local_data[key] for key in original_data if key in local_data},
+                          shard_file, indent=4)
+        log.info("Shard results written to %s", shard_file)
+    else:
+        # Compact the results into the columnar store and the published JSON, both
+        # replaced atomically
+        save_plmn_data(local_data, local_store_path, local_json_path)
+        # Append what changed since the previous run to data/changes.jsonl
+        record_changes(local_data, swept)
+    # Drop the journal the results now supersede
+    journal.remove()
+
+def run_shards(workers, qps=DEFAULT_QPS, mccmnc_bundle=None, **options):
+    """
+    Sweep every shard in its own process and merge the results.
+
+    The mcc-mnc.com database is updated once up front and handed to every
+    worker. *qps* is the total ceiling per nameserver and is split evenly
+    between the workers, since they all query the same resolvers.
+
+    Args:
+        workers (int): Number of shards and worker processes.
+        qps (float, optional): Ceiling on queries per second per nameserver, across all workers.
+        mccmnc_bundle (str, optional): Saved mcc-mnc.com JS bundle to read the MCC-MNC list from.
+        **options: Further arguments for get_all_active_mcc_mnc().
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    entries = load_mccmnc_entries(os.path.join(base_dir, 'data', 'mccmnc.bin'),
+                                  os.path.join(base_dir, 'data', 'mccmnc.json'), mccmnc_bundle)
+    if not entries:
+        log.error("No MCC-MNC data available. Exiting.")
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(get_all_active_mcc_mnc, shard=shard, shards=workers, entries=entries,
+                                   qps=qps / workers, **options)
+                   for shard in range(workers)]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+    merge_shards(workers, base_dir)
 
 if __name__ == "__main__":
-    get_all_active_mcc_mnc()
+    parser = argparse.ArgumentParser(description="Check OpenRoaming realm support for every MCC-MNC combination.")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="maximum number of realms resolved at once")
+    parser.add_argument('--per-server-limit', type=int, default=DEFAULT_PER_SERVER_LIMIT,
+                        help="maximum number of concurrent lookups per DNS server")
+    parser.add_argument('--qps', type=float, default=DEFAULT_QPS,
+                        help="maximum queries per second sent to each DNS server")
+    parser.add_argument('--full', action='store_true',
+                        help="re-query every MCC-MNC entry instead of only new, supported or expired ones")
+    parser.add_argument('--negative-ttl-floor', type=int, default=DEFAULT_NEGATIVE_TTL_FLOOR,
+                        help="minimum seconds an unsupported entry is trusted before it is re-queried")
+    parser.add_argument('--no-hedge', dest='hedge', action='store_false',
+                        help="try resolvers one after the other instead of racing them")
+    parser.add_argument('--enumerate', dest='enumerate_mccs', action='store_true',
+                        help="probe each MCC subtree once and skip entries under MCCs that do not exist")
+    parser.add_argument('--shard', type=int, default=0,
+                        help="index of the MCC shard to sweep (0-based), used with --shards")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="split the sweep into this many MCC shards and sweep only --shard")
+    parser.add_argument('--workers', type=int,
+                        help="sweep this many MCC shards in worker processes and merge the results")
+    parser.add_argument('--authoritative', action='store_true',
+                        help="send NAPTR queries straight to the authoritative servers of pub.3gppnetwork.org")
+    parser.add_argument('--authoritative-server', dest='authoritative_servers', action='append',
+                        help="authoritative server address to use instead of discovering them (repeatable)")
+    parser.add_argument('--authoritative-port', type=int, default=53,
+                        help="port the authoritative servers listen on")
+    parser.add_argument('--transport', choices=TRANSPORTS, default='udp',
+                        help="send queries over UDP, or pipeline them over persistent TCP or TLS connections")
+    parser.add_argument('--transport-port', type=int,
+                        help="port for --transport tcp/tls (default: 53 for tcp, 853 for tls)")
+    parser.add_argument('--discover', action='store_true',
+                        help="also probe every MNC under each existing MCC for realms missing from the "
+                             "mcc-mnc.com list (see discover.py)")
+    parser.add_argument('--mccmnc-bundle', metavar='PATH',
+                        help="read the MCC-MNC list from a saved mcc-mnc.com JS bundle instead of fetching it")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+    if not 0 <= args.shard < args.shards:
+        parser.error("--shard must be between 0 and --shards - 1")
+    if args.discover and (args.shards > 1 or args.workers):
+        parser.error("--discover cannot be combined with --shards or --workers")
+    if args.workers and args.shards > 1:
+        parser.error("--workers cannot be combined with --shards")
+    options = dict(concurrency=args.concurrency, per_server_limit=args.per_server_limit,
+                   full=args.full, negative_ttl_floor=args.negative_ttl_floor,
+                   hedge=args.hedge, enumerate_mccs=args.enumerate_mccs, authoritative=args.authoritative,
+                   authoritative_servers=args.authoritative_servers,
+                   authoritative_port=args.authoritative_port, transport=args.transport,
+                   transport_port=args.transport_port, mccmnc_bundle=args.mccmnc_bundle)
+    if args.workers:
+        run_shards(args.workers, qps=args.qps, **options)
+    else:
+        get_all_active_mcc_mnc(qps=args.qps, shard=args.shard, shards=args.shards, discover=args.discover,
+                               **options)
@@ -0,0 +1,267 @@
+"""
+Streaming, conditional ingestion of the mcc-mnc.com MCC-MNC list.
+
+mcc-mnc.com is a single-page app. Its MCC-MNC table is embedded in the JS
+bundle as objects like
+{mcc:"289",mnc:"67",iso:"ab",country:"Abkhazia",countryCode:"794",network:"Aquafon"}.
+The update() that patch_mccmnc.py installs into the mccmnc package downloads
+the whole bundle, decodes it, scans it with one big regular expression and
+rewrites the package's JSON file, which main.py then parses again.
+
+Here the bundle is read in chunks and BundleTokenizer turns the bytes into
+records as they arrive, so nothing is decoded or scanned twice. The entries
+go straight to the sweep without the JSON round trip. Both the homepage and
+the bundle are fetched conditionally, with the ETag and Last-Modified of
+the previous run. A bundle that comes back unchanged, either as 304 Not
+Modified or with the same SHA-256 as last time, is not ingested again, and
+the previous entries are reused. Validators, hash and entries are kept in
+.cache/mccmnc_feed.json, next to the DNS answer cache.
+
+A saved bundle can be ingested with load_bundle() without network access:
+    python mccmnc_feed.py --bundle saved-bundle.js [--output entries.json]
+    python main.py --mccmnc-bundle saved-bundle.js
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+from urllib.error import HTTPError
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+from checkpoint import write_json_atomic
+from logconfig import add_logging_arguments, setup_logging_from_args
+
+log = logging.getLogger(__name__)
+
+MCC_MNC_URL = 'https://www.mcc-mnc.com/'
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'mccmnc_feed.json')
+# Path of the JS bundle in the homepage HTML
+BUNDLE_PATTERN = re.compile(r'/assets/[a-zA-Z0-9_.-]+\.js')
+# One MCC-MNC object of the bundle's data array
+RECORD_PATTERN = re.compile(rb'\{mcc:"([^"]*)",mnc:"([^"]*)",iso:"([^"]*)",country:"([^"]*)"'
+                            rb',countryCode:"([^"]*)",network:"([^"]*)"\}')
+RECORD_START = b'{mcc:"'
+# Longest unfinished record carried over to the next chunk; anything longer is not a record
+MAX_RECORD_LENGTH = 4096
+# Bytes read from the bundle at a time
+CHUNK_SIZE = 64 * 1024
+# Seconds allowed for each HTTP request
+FETCH_TIMEOUT = 30
+
+
+def record_entry(match):
+    """
+    Turn one matched MCC-MNC object into an entry.
+
+    Args:
+        match (re.Match): Match of RECORD_PATTERN.
+
+    Returns:
+        tuple: PLMN ID (MCC followed by MNC) and the entry, with the fields of MCCMNC_FIELDS in main.py.
+    """
+    mcc, mnc, iso, country, country_code, network = (field.decode('utf-8', 'replace') for field in match.groups())
+    return mcc + mnc, {
+        'MCC': mcc,
+        'MNC': mnc,
+        'ISO': iso,
+        'COUNTRY': country,
+        'CC': country_code,
+        'NETWORK': network.strip() if network else 'unknown',
+    }
+
+
+class BundleTokenizer:
+    """
+    Incremental scanner that finds the MCC-MNC records in a JS bundle fed to it chunk by chunk.
+    """
+
+    def __init__(self):
+        self.tail = b''
+        self.records = 0
+
+    def feed(self, chunk):
+        """
+        Scan the next chunk of the bundle.
+
+        A record split across chunks is kept back and returned with the chunk
+        that completes it.
+
+        Args:
+            chunk (bytes): Next bytes of the bundle.
+
+        Returns:
+            list: (PLMN ID, entry) tuples of the records completed by this chunk.
+        """
+        data = self.tail + chunk
+        records = []
+        end = 0
+        for match in RECORD_PATTERN.finditer(data):
+            records.append(record_entry(match))
+            end = match.end()
+        start = data.rfind(RECORD_START, end)
+        if start == -1:
+            # The chunk may end in the middle of RECORD_START itself
+            start = max(end, len(data) - len(RECORD_START) + 1)
+        elif len(data) - start > MAX_RECORD_LENGTH:
+            start = len(data)
+        self.tail = data[start:]
+        self.records += len(records)
+        return records
+
+
+def read_bundle(stream):
+    """
+    Ingest a JS bundle from a binary stream.
+
+    Args:
+        stream: Binary file object or HTTP response.
+
+    Returns:
+        tuple: Entries keyed by PLMN ID, and the SHA-256 hex digest of the bundle.
+
+    Raises:
+        ValueError: The bundle holds no MCC-MNC records.
+    """
+    tokenizer = BundleTokenizer()
+    digest = hashlib.sha256()
+    entries = {}
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        entries.update(tokenizer.feed(chunk))
+    if not entries:
+        raise ValueError("Could not find MCC-MNC data in the JS bundle")
+    log.debug("Found %d MCC-MNC records, %d distinct PLMNs.", tokenizer.records, len(entries))
+    return entries, digest.hexdigest()
+
+
+def load_bundle(path):
+    """
+    Ingest a saved JS bundle.
+
+    Args:
+        path (str): Location of the bundle.
+
+    Returns:
+        dict: Entries keyed by PLMN ID.
+
+    Raises:
+        ValueError: The bundle holds no MCC-MNC records.
+    """
+    with open(path, 'rb') as file:
+        entries, _ = read_bundle(file)
+    return entries
+
+
+def _open(url, validators):
+    """
+    Request *url*, conditionally if *validators* holds an ETag or Last-Modified.
+
+    Returns:
+        http.client.HTTPResponse: The response, or None if the server answered 304 Not Modified.
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    try:
+        return urlopen(Request(url, headers=headers), timeout=FETCH_TIMEOUT)
+    except HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+
+def _validators(response):
+    return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+
+def fetch_entries(url=MCC_MNC_URL, state_path=DEFAULT_STATE_PATH, force=False):
+    """
+    Fetch the MCC-MNC list from mcc-mnc.com, skipping the work if it has not changed.
+
+    Args:
+        url (str, optional): Homepage of mcc-mnc.com.
+        state_path (str, optional): Where the validators, hash and entries of the last fetch are kept.
+        force (bool, optional): Fetch and ingest everything unconditionally.
+
+    Returns:
+        dict: Entries keyed by PLMN ID.
+
+    Raises:
+        OSError: The site could not be reached.
+        ValueError: The homepage links no JS bundle, or the bundle holds no MCC-MNC records.
+    """
+    state = {}
+    if not force and os.path.exists(state_path):
+        try:
+            with open(state_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable %s: %s", state_path, e)
+    if not state.get('entries'):
+        state = {}
+
+    response = _open(url, state.get('page', {}))
+    if response is None:
+        log.info("%s not modified since the last fetch.", url)
+        page, bundle_url = state['page'], state['bundle_url']
+    else:
+        with response:
+            html = response.read().decode('utf-8')
+            page = _validators(response)
+        match = BUNDLE_PATTERN.search(html)
+        if not match:
+            raise ValueError(f"Could not find the JS bundle URL on {url}")
+        bundle_url = urljoin(url, match.group(0))
+
+    # A different bundle name means different content; the old validators do not apply to it
+    bundle = state.get('bundle', {}) if bundle_url == state.get('bundle_url') else {}
+    response = _open(bundle_url, bundle)
+    if response is None:
+        log.info("JS bundle %s not modified, reusing %d entries.", bundle_url, len(state['entries']))
+        entries = state['entries']
+    else:
+        log.info("Fetching JS bundle from %s", bundle_url)
+        with response:
+            entries, sha256 = read_bundle(response)
+            bundle = dict(_validators(response), sha256=sha256)
+        if sha256 == state.get('bundle', {}).get('sha256'):
+            log.info("JS bundle %s unchanged, reusing %d entries.", bundle_url, len(state['entries']))
+            entries = state['entries']
+        else:
+            log.info("Found %d MCC-MNC entries in JS bundle.", len(entries))
+
+    new_state = {'page': page, 'bundle_url': bundle_url, 'bundle': bundle, 'entries': entries}
+    if new_state != state:
+        os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+        write_json_atomic(new_state, state_path)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest the mcc-mnc.com MCC-MNC list.")
+    parser.add_argument('--bundle', help="saved JS bundle to ingest instead of fetching mcc-mnc.com")
+    parser.add_argument('--url', default=MCC_MNC_URL, help="homepage to fetch the JS bundle from")
+    parser.add_argument('--force', action='store_true', help="fetch and ingest even if nothing changed")
+    parser.add_argument('--output', help="write the entries as JSON to this file")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+
+    entries = load_bundle(args.bundle) if args.bundle else fetch_entries(args.url, force=args.force)
+    log.info("%d MCC-MNC entries.", len(entries))
+    if args.output:
+        write_json_atomic(entries, args.output, indent=4, sort_keys=True)
+        log.info("Entries written to %s", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Lookup and sweep metrics.
+
+Every NAPTR/SRV query made through a LookupEngine is observed here with its
+nameserver, record type, outcome status (see lookup.py) and latency. The
+latencies go into fixed-bucket histograms per nameserver and record type,
+so a run can be summarised without keeping every sample. Lookups answered
+from the DNS answer cache never reach a nameserver; they are only counted,
+per record type and status, apart from the queries. At the end of a
+run the metrics are exported under data/metrics/ twice: as a Prometheus
+textfile (for node_exporter's textfile collector or any other scraper) and
+as a JSON summary with percentiles per resolver that is easy to diff
+between weekly runs.
+"""
+
+import bisect
+import collections
+import os
+import threading
+import time
+
+from checkpoint import write_json_atomic, write_text_atomic
+
+METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'metrics')
+# Upper bounds of the latency buckets in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Percentiles reported in the JSON summary
+SUMMARY_PERCENTILES = (0.5, 0.9, 0.99)
+METRIC_PREFIX = 'openroaming'
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            buckets (tuple, optional): Sorted upper bounds of the buckets in seconds.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        """
+        Add one sample.
+
+        Args:
+            seconds (float): Observed latency.
+        """
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Return the cumulative bucket counts, as Prometheus exposes them.
+
+        Returns:
+            list: (upper bound, count) tuples, the last one with an upper bound of '+Inf'.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def percentile(self, pct):
+        """
+        Estimate a percentile by linear interpolation inside its bucket.
+
+        Args:
+            pct (float): Percentile between 0 and 1.
+
+        Returns:
+            float: Estimated latency in seconds, or None without samples.
+        """
+        if not self.count:
+            return None
+        rank = pct * self.count
+        lower, seen = 0.0, 0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.buckets[-1]
+
+
+class SweepMetrics:
+    """
+    Thread-safe latency histograms and outcome counters for one run.
+    """
+
+    def __init__(self, name='sweep'):
+        """
+        Args:
+            name (str, optional): Name of the run, used for the export file names.
+        """
+        self.name = name
+        self.latencies = collections.defaultdict(Histogram)
+        self.outcomes = collections.Counter()
+        self.cache_hits = collections.Counter()
+        self.started = time.time()
+        self.start_clock = time.monotonic()
+        self.wall_time = None
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def observe(self, server, rdtype, status, seconds):
+        """
+        Record one query.
+
+        Args:
+            server (str): Nameserver address.
+            rdtype (str): Record type, e.g. 'NAPTR'.
+            status (str): Lookup status, see lookup.py.
+            seconds (float): Time the query took.
+        """
+        with self.lock:
+            self.latencies[(server, rdtype)].observe(seconds)
+            self.outcomes[(server, rdtype, status)] += 1
+
+    def observe_cache_hit(self, rdtype, status):
+        """
+        Record one lookup answered from the DNS answer cache.
+
+        Args:
+            rdtype (str): Record type, e.g. 'NAPTR'.
+            status (str): Lookup status, see lookup.py.
+        """
+        with self.lock:
+            self.cache_hits[(rdtype, status)] += 1
+
+    def finish(self, entries=None):
+        """
+        Stop the wall clock of the run.
+
+        Args:
+            entries (int, optional): Number of realms or domains the run resolved.
+        """
+        self.wall_time = time.monotonic() - self.start_clock
+        self.entries = entries
+
+    def outcome_counts(self):
+        """
+        Count queries per record type and status, across nameservers.
+
+        Returns:
+            dict: Counts keyed by record type, then by status.
+        """
+        counts = collections.defaultdict(collections.Counter)
+        with self.lock:
+            for (_, rdtype, status), count in self.outcomes.items():
+                counts[rdtype][status] += count
+        return {rdtype: dict(sorted(counts[rdtype].items())) for rdtype in sorted(counts)}
+
+    def cache_hit_counts(self):
+        """
+        Count the lookups answered from the DNS answer cache per record type and status.
+
+        Returns:
+            dict: Counts keyed by record type, then by status.
+        """
+        counts = collections.defaultdict(dict)
+        with self.lock:
+            for (rdtype, status), count in sorted(self.cache_hits.items()):
+                counts[rdtype][status] = count
+        return dict(counts)
+
+    def queries(self):
+        """
+        Returns:
+            int: Number of queries observed so far.
+        """
+        with self.lock:
+            return sum(self.outcomes.values())
+
+    def summary(self):
+        """
+        Summarise the run for the JSON export.
+
+        Returns:
+            dict: Run totals, cache hits and, per nameserver, query counts per status and
+            latency percentiles per record type.
+        """
+        wall_time = self.wall_time if self.wall_time is not None else time.monotonic() - self.start_clock
+        queries = self.queries()
+        nameservers = {}
+        with self.lock:
+            for (server, rdtype, status), count in sorted(self.outcomes.items()):
+                server_summary = nameservers.setdefault(server, {'queries': 0, 'outcomes': {}, 'latency': {}})
+                server_summary['queries'] += count
+                server_summary['outcomes'][status] = server_summary['outcomes'].get(status, 0) + count
+            for (server, rdtype), histogram in sorted(self.latencies.items()):
+                latency = {f"p{round(pct * 100)}": histogram.percentile(pct) for pct in SUMMARY_PERCENTILES}
+                latency['mean'] = histogram.sum / histogram.count
+                nameservers[server]['latency'][rdtype] = {key: round(value, 4) for key, value in latency.items()}
+        return {
+            'name': self.name,
+            'started': int(self.started),
+            'wall_time_seconds': round(wall_time, 3),
+            'entries': self.entries,
+            'queries': queries,
+            'queries_per_second': round(queries / wall_time, 2) if wall_time else None,
+            'outcomes': self.outcome_counts(),
+            'cache_hits': self.cache_hit_counts(),
+            'nameservers': nameservers,
+        }
+
+    def prometheus(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: Textfile contents.
+        """
+        run = f'run="{self.name}"'
+        lines = [
+            f"# HELP {METRIC_PREFIX}_dns_query_duration_seconds DNS query latency per nameserver and record type.",
+            f"# TYPE {METRIC_PREFIX}_dns_query_duration_seconds histogram",
+        ]
+        with self.lock:
+            for (server, rdtype), histogram in sorted(self.latencies.items()):
+                labels = f'{run},nameserver="{server}",rrtype="{rdtype}"'
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{METRIC_PREFIX}_dns_query_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"{METRIC_PREFIX}_dns_query_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"{METRIC_PREFIX}_dns_query_duration_seconds_count{{{labels}}} {histogram.count}")
+            lines += [
+                f"# HELP {METRIC_PREFIX}_dns_queries_total DNS queries per nameserver, record type and outcome.",
+                f"# TYPE {METRIC_PREFIX}_dns_queries_total counter",
+            ]
+            for (server, rdtype, status), count in sorted(self.outcomes.items()):
+                lines.append(f'{METRIC_PREFIX}_dns_queries_total{{{run},nameserver="{server}",rrtype="{rdtype}",'
+                             f'status="{status}"}} {count}')
+            lines += [
+                f"# HELP {METRIC_PREFIX}_dns_cache_hits_total Lookups answered from the DNS answer cache.",
+                f"# TYPE {METRIC_PREFIX}_dns_cache_hits_total counter",
+            ]
+            for (rdtype, status), count in sorted(self.cache_hits.items()):
+                lines.append(f'{METRIC_PREFIX}_dns_cache_hits_total{{{run},rrtype="{rdtype}",status="{status}"}} {count}')
+        summary = self.summary()
+        for metric, value, help_text in (
+                ('sweep_duration_seconds', summary['wall_time_seconds'], "Wall time of the run."),
+                ('sweep_entries', summary['entries'], "Realms or domains resolved by the run."),
+                ('sweep_queries_per_second', summary['queries_per_second'], "Average DNS queries per second."),
+                ('sweep_last_run_timestamp_seconds', summary['started'], "Start time of the run.")):
+            if value is not None:
+                lines += [f"# HELP {METRIC_PREFIX}_{metric} {help_text}",
+                          f"# TYPE {METRIC_PREFIX}_{metric} gauge",
+                          f"{METRIC_PREFIX}_{metric}{{{run}}} {value}"]
+        return '\n'.join(lines) + '\n'
+
+    def export(self, directory=METRICS_DIR):
+        """
+        Write the Prometheus textfile and the JSON summary, both atomically.
+
+        Args:
+            directory (str, optional): Output directory, data/metrics/ by default.
+
+        Returns:
+            tuple: Paths of the textfile and the JSON summary.
+        """
+        os.makedirs(directory, exist_ok=True)
+        prom_path = os.path.join(directory, f"{self.name}.prom")
+        json_path = os.path.join(directory, f"{self.name}.json")
+        write_text_atomic(self.prometheus(), prom_path)
+        write_json_atomic(self.summary(), json_path, indent=4)
+        return prom_path, json_path
@@ -4,6 +4,8 @@ current mcc-mnc.com website, which is now a React SPA.
 The original update() used BeautifulSoup to scrape an HTML <table> that no
 longer exists in the static HTML. The patched version fetches the JS bundle
 and extracts MCC-MNC data from the embedded JS array.
+main.py does not need the patch: it reads the same bundle itself, streaming
+and only when it changed (see mccmnc_feed.py).
 
 Run this script once after `pip install mccmnc` to apply the patch:
     python patch_mccmnc.py
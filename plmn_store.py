@@ -0,0 +1,498 @@
+"""
+Compact columnar store for the PLMN sweep results.
+
+data/mccmnc.json is a 500 KB dict-of-dicts that has to be parsed in full by
+everything that reads it. data/mccmnc.bin holds the same entries as columns:
+
+    - MCC/MNC as 16-bit integer arrays for numeric filtering,
+    - every text field (PLMN ID, MCC, MNC, ISO, COUNTRY, CC, NETWORK, host)
+      as a 32-bit index into one interned string table,
+    - lookup_success as a bitset, plus an index of the supported rows,
+    - port, last_checked and ttl as 32-bit integer arrays.
+
+PLMNStore memory-maps the file and decodes rows on demand, so listing the
+supported carriers costs O(hits) rather than a parse of the whole file.
+Fields the schema does not know about are kept as a per-row JSON blob, so
+export_json() reproduces the published JSON without loss. The blob is
+interned like any other string, so the endpoint lists of carriers sharing
+an identity provider are stored once.
+
+data/mccmnc.json stays the source of truth; the store is a local, derived
+copy and is not committed. It records the SHA-256 of the JSON file it
+matches, and the store is only read while that JSON file is unchanged. A
+hand edit to the JSON, or a JSON written by another tool, makes the store
+stale: the JSON is read instead, and the next save rebuilds the store.
+
+Usage:
+    python plmn_store.py build   # data/mccmnc.json -> data/mccmnc.bin
+    python plmn_store.py export  # data/mccmnc.bin -> data/mccmnc.json
+"""
+
+import argparse
+import array
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from checkpoint import write_text_atomic
+from logconfig import add_logging_arguments, setup_logging_from_args
+
+log = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_STORE_PATH = os.path.join(DATA_DIR, 'mccmnc.bin')
+DEFAULT_JSON_PATH = os.path.join(DATA_DIR, 'mccmnc.json')
+
+MAGIC = b'PLMN'
+VERSION = 2
+HEADER = struct.Struct('<4sHHI')
+COLUMN = struct.Struct('<16scxxxII')
+
+# Sentinels for the 32-bit columns
+ABSENT = 0xFFFFFFFF
+NULL = 0xFFFFFFFE
+# Sentinel for MCC/MNC values that are not plain numbers
+NOT_NUMERIC = 0xFFFF
+# JSON digest of a store that does not match any JSON file yet
+NO_DIGEST = bytes(hashlib.sha256().digest_size)
+
+# Text fields from the mcc-mnc.com feed, in the order they are exported
+STRING_FIELDS = ('CC', 'COUNTRY', 'ISO', 'MCC', 'MNC', 'NETWORK')
+# Integer fields written by the sweep, in the order they are exported
+INT_FIELDS = ('last_checked', 'ttl')
+
+
+class _StringTable:
+    """Interns strings while a store is being written."""
+
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def add(self, value):
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return self.index[value]
+
+    def columns(self):
+        blob = bytearray()
+        offsets = array.array('I', [0])
+        for value in self.strings:
+            blob += value.encode('utf-8')
+            offsets.append(len(blob))
+        return bytes(blob), offsets
+
+
+def _encode_string(table, entry, field, extras):
+    if field not in entry:
+        return ABSENT
+    value = entry[field]
+    if value is None:
+        return NULL
+    if isinstance(value, str):
+        return table.add(value)
+    extras[field] = value
+    return ABSENT
+
+
+def _encode_int(entry, field, extras):
+    if field not in entry:
+        return ABSENT
+    value = entry[field]
+    if value is None:
+        return NULL
+    if type(value) is int and 0 <= value < NULL:
+        return value
+    extras[field] = value
+    return ABSENT
+
+
+def _numeric(value):
+    if isinstance(value, str) and value.isdigit() and int(value) < NOT_NUMERIC:
+        return int(value)
+    return NOT_NUMERIC
+
+
+def json_digest(path):
+    """
+    Args:
+        path (str): Location of a JSON file.
+
+    Returns:
+        bytes: SHA-256 digest of the file, or None if it does not exist.
+    """
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).digest()
+    except FileNotFoundError:
+        return None
+
+
+def write_store(data, path=DEFAULT_STORE_PATH, digest=None):
+    """
+    Write PLMN entries to a columnar store, replacing the file atomically.
+
+    Args:
+        data (dict): Entries keyed by PLMN ID, as in data/mccmnc.json.
+        path (str, optional): Location of the store.
+        digest (bytes, optional): SHA-256 digest of the JSON file holding the same entries,
+            see json_digest(); stamp_store() can record it later.
+    """
+    table = _StringTable()
+    count = len(data)
+    columns = {
+        'key': array.array('I'),
+        'mcc': array.array('H'),
+        'mnc': array.array('H'),
+        'host': array.array('I'),
+        'port': array.array('I'),
+        'extras': array.array('I'),
+        'supidx': array.array('I'),
+    }
+    for field in STRING_FIELDS + INT_FIELDS:
+        columns[field] = array.array('I')
+    success = bytearray((count + 7) // 8)
+    success_set = bytearray((count + 7) // 8)
+
+    for row, (key, entry) in enumerate(data.items()):
+        extras = {}
+        columns['key'].append(table.add(key))
+        columns['mcc'].append(_numeric(entry.get('MCC')))
+        columns['mnc'].append(_numeric(entry.get('MNC')))
+        for field in STRING_FIELDS:
+            columns[field].append(_encode_string(table, entry, field, extras))
+        for field in INT_FIELDS:
+            columns[field].append(_encode_int(entry, field, extras))
+        columns['host'].append(_encode_string(table, entry, 'host', extras))
+        columns['port'].append(_encode_int(entry, 'port', extras))
+        if 'lookup_success' in entry:
+            if isinstance(entry['lookup_success'], bool):
+                success_set[row >> 3] |= 1 << (row & 7)
+                if entry['lookup_success']:
+                    success[row >> 3] |= 1 << (row & 7)
+                    columns['supidx'].append(row)
+            else:
+                extras['lookup_success'] = entry['lookup_success']
+        known = STRING_FIELDS + INT_FIELDS + ('host', 'port', 'lookup_success')
+        extras.update({field: value for field, value in entry.items() if field not in known})
+        columns['extras'].append(table.add(json.dumps(extras)) if extras else ABSENT)
+
+    strings, offsets = table.columns()
+    blobs = []
+    for name, column in columns.items():
+        blobs.append((name, column.typecode, column))
+    blobs.append(('success', 'B', success))
+    blobs.append(('succset', 'B', success_set))
+    blobs.append(('stroffs', 'I', offsets))
+    blobs.append(('strings', 'B', strings))
+    blobs.append(('jsondig', 'B', digest or NO_DIGEST))
+
+    offset = HEADER.size + COLUMN.size * len(blobs)
+    directory, payload = [], bytearray()
+    for name, typecode, column in blobs:
+        if isinstance(column, array.array):
+            if sys.byteorder != 'little':
+                column = array.array(column.typecode, column)
+                column.byteswap()
+            raw = column.tobytes()
+        else:
+            raw = bytes(column)
+        directory.append(COLUMN.pack(name.encode('ascii'), typecode.encode('ascii'),
+                                     offset + len(payload), len(raw)))
+        payload += raw
+        payload += b'\0' * (-len(payload) % 8)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(blobs), count))
+        file.write(b''.join(directory))
+        file.write(payload)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def stamp_store(path, digest):
+    """
+    Record the digest of the JSON file a store matches, in place.
+
+    Args:
+        path (str): Location of the store.
+        digest (bytes): SHA-256 digest from json_digest().
+    """
+    with open(path, 'r+b') as file:
+        magic, version, ncolumns, _ = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} PLMN store")
+        for _ in range(ncolumns):
+            name, _, offset, length = COLUMN.unpack(file.read(COLUMN.size))
+            if name.rstrip(b'\0') == b'jsondig' and length == len(digest):
+                file.seek(offset)
+                file.write(digest)
+                file.flush()
+                os.fsync(file.fileno())
+                return
+    raise ValueError(f"{path} has no JSON digest column")
+
+
+def is_current(store_path=DEFAULT_STORE_PATH, json_path=DEFAULT_JSON_PATH):
+    """
+    Check whether a store holds the same entries as the JSON file.
+
+    Args:
+        store_path (str, optional): Location of the store.
+        json_path (str, optional): Location of the JSON file.
+
+    Returns:
+        bool: True if the store exists and was built from or exported to the JSON file as it is now.
+    """
+    if not os.path.exists(store_path):
+        return False
+    try:
+        with PLMNStore(store_path) as store:
+            digest = store.json_digest()
+    except ValueError:
+        return False  # Written by another version
+    return digest != NO_DIGEST and digest == json_digest(json_path)
+
+
+class PLMNStore:
+    """
+    Memory-mapped reader for a store written by write_store().
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        """
+        Args:
+            path (str, optional): Location of the store.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, ncolumns, self.count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.mm.close()
+            raise ValueError(f"{path} is not a version {VERSION} PLMN store")
+        self.columns = {}
+        for i in range(ncolumns):
+            name, typecode, offset, length = COLUMN.unpack_from(self.mm, HEADER.size + COLUMN.size * i)
+            view = memoryview(self.mm)[offset:offset + length]
+            typecode = typecode.decode('ascii')
+            if typecode != 'B':
+                if sys.byteorder == 'little':
+                    view = view.cast(typecode)
+                else:
+                    swapped = array.array(typecode, bytes(view))
+                    swapped.byteswap()
+                    view = memoryview(swapped)
+            self.columns[name.rstrip(b'\0').decode('ascii')] = view
+        self.strings_cache = {}
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the memory map."""
+        for view in self.columns.values():
+            view.release()
+        self.columns = {}
+        self.mm.close()
+
+    def string(self, index):
+        """
+        Decode one entry of the string table.
+
+        Args:
+            index (int): Index into the string table.
+
+        Returns:
+            str: The interned string.
+        """
+        if index not in self.strings_cache:
+            offsets = self.columns['stroffs']
+            raw = self.columns['strings'][offsets[index]:offsets[index + 1]]
+            self.strings_cache[index] = bytes(raw).decode('utf-8')
+        return self.strings_cache[index]
+
+    def json_digest(self):
+        """
+        Returns:
+            bytes: SHA-256 digest of the JSON file the store matches, NO_DIGEST if none.
+        """
+        return bytes(self.columns['jsondig'])
+
+    def key(self, row):
+        """
+        Args:
+            row (int): Row number.
+
+        Returns:
+            str: PLMN ID of the row.
+        """
+        return self.string(self.columns['key'][row])
+
+    def is_supported(self, row):
+        """
+        Args:
+            row (int): Row number.
+
+        Returns:
+            bool: Value of lookup_success for the row.
+        """
+        return bool(self.columns['success'][row >> 3] >> (row & 7) & 1)
+
+    def entry(self, row):
+        """
+        Decode one row back into its JSON form.
+
+        Args:
+            row (int): Row number.
+
+        Returns:
+            dict: Entry with the same fields and values as in data/mccmnc.json.
+        """
+        columns = self.columns
+        entry = {}
+        for field in STRING_FIELDS:
+            value = columns[field][row]
+            if value != ABSENT:
+                entry[field] = None if value == NULL else self.string(value)
+        if columns['succset'][row >> 3] >> (row & 7) & 1:
+            entry['lookup_success'] = self.is_supported(row)
+        for field in INT_FIELDS:
+            value = columns[field][row]
+            if value != ABSENT:
+                entry[field] = None if value == NULL else value
+        host = columns['host'][row]
+        if host != ABSENT:
+            entry['host'] = None if host == NULL else self.string(host)
+        port = columns['port'][row]
+        if port != ABSENT:
+            entry['port'] = None if port == NULL else port
+        extras = columns['extras'][row]
+        if extras != ABSENT:
+            entry.update(json.loads(self.string(extras)))
+        return entry
+
+    def items(self):
+        """
+        Iterate over every row.
+
+        Yields:
+            tuple: (PLMN ID, entry) pairs in stored order.
+        """
+        for row in range(self.count):
+            yield self.key(row), self.entry(row)
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: All entries keyed by PLMN ID, as in data/mccmnc.json.
+        """
+        return dict(self.items())
+
+    def supported(self):
+        """
+        List the supported entries using the supported-row index.
+
+        Returns:
+            list: (PLMN ID, entry) pairs for rows with lookup_success set.
+        """
+        return [(self.key(row), self.entry(row)) for row in self.columns['supidx']]
+
+    def rows_for_mcc(self, mcc):
+        """
+        Find the rows of one Mobile Country Code.
+
+        Args:
+            mcc (int): Mobile Country Code.
+
+        Returns:
+            list: Row numbers whose MCC equals *mcc*.
+        """
+        return [row for row, value in enumerate(self.columns['mcc']) if value == mcc]
+
+
+def export_json(store_path=DEFAULT_STORE_PATH, json_path=DEFAULT_JSON_PATH):
+    """
+    Export a store to the published JSON format, and record in the store that it matches.
+
+    Args:
+        store_path (str, optional): Location of the store.
+        json_path (str, optional): Location of the JSON file to write.
+    """
+    with PLMNStore(store_path) as store:
+        data = store.to_dict()
+    text = json.dumps(data, indent=4)
+    write_text_atomic(text, json_path)
+    stamp_store(store_path, hashlib.sha256(text.encode('utf-8')).digest())
+    log.info("JSON data exported to %s", json_path)
+
+
+def load_plmn_data(store_path=DEFAULT_STORE_PATH, json_path=DEFAULT_JSON_PATH):
+    """
+    Load all PLMN entries, from the store if it matches the JSON file and from JSON otherwise.
+
+    Args:
+        store_path (str, optional): Location of the store.
+        json_path (str, optional): Location of the JSON file.
+
+    Returns:
+        dict: Entries keyed by PLMN ID, empty if the JSON file does not exist.
+    """
+    if is_current(store_path, json_path):
+        with PLMNStore(store_path) as store:
+            return store.to_dict()
+    if not os.path.exists(json_path):
+        return {}
+    if os.path.exists(store_path):
+        log.info("%s does not match %s, reading the JSON file.", store_path, json_path)
+    with open(json_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_plmn_data(data, store_path=DEFAULT_STORE_PATH, json_path=DEFAULT_JSON_PATH):
+    """
+    Write PLMN entries to the store and export the published JSON from it.
+
+    Args:
+        data (dict): Entries keyed by PLMN ID.
+        store_path (str, optional): Location of the store.
+        json_path (str, optional): Location of the JSON file.
+    """
+    write_store(data, store_path)
+    export_json(store_path, json_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between data/mccmnc.json and the columnar store.")
+    parser.add_argument('command', choices=('build', 'export'),
+                        help="build the store from JSON, or export JSON from the store")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="location of the columnar store")
+    parser.add_argument('--json', default=DEFAULT_JSON_PATH, help="location of the JSON file")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+
+    if args.command == 'build':
+        with open(args.json, 'rb') as file:
+            raw = file.read()
+        write_store(json.loads(raw), args.store, hashlib.sha256(raw).digest())
+        log.info("Columnar store written to %s", args.store)
+    else:
+        export_json(args.store, args.json)
+
+
+if __name__ == "__main__":
+    main()
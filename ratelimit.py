@@ -0,0 +1,211 @@
+"""
+Per-nameserver rate limiting for the DNS lookups in main.py and domains.py.
+
+Every upstream DNS server gets its own token bucket, refilled at that
+server's current QPS. The rate starts at the configured ceiling, is halved
+whenever the recent share of timeouts/SERVFAILs from that server crosses a
+threshold, and climbs back towards the ceiling one small step per healthy
+answer (additive increase, multiplicative decrease). Lookups therefore run
+as fast as each upstream allows, and no faster.
+"""
+
+import asyncio
+import collections
+import threading
+import time
+
+from lookup import SERVFAIL, TIMEOUT, classify_exception
+
+# Ceiling on queries per second sent to any single DNS server
+DEFAULT_QPS = 20.0
+# Floor the adaptive backoff will not go below
+DEFAULT_MIN_QPS = 1.0
+# Share of failed queries in the recent window that triggers a backoff
+DEFAULT_ERROR_THRESHOLD = 0.25
+# Number of recent queries per server the error share is computed over
+DEFAULT_WINDOW = 20
+
+
+def is_upstream_error(exc):
+    """
+    Decide whether a lookup exception means the upstream server is struggling.
+
+    Timeouts and SERVFAIL/REFUSED (surfaced by dnspython as NoNameservers) count
+    against the server. NXDOMAIN and empty answers are healthy responses.
+
+    Args:
+        exc (Exception): Exception raised by resolver.resolve().
+
+    Returns:
+        bool: True if the exception should count towards backing off.
+    """
+    return classify_exception(exc) in (TIMEOUT, SERVFAIL)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that hands out reservations.
+
+    Each acquire takes one token immediately, letting the balance go negative,
+    and waits until the refill would have covered it. Concurrent callers thus
+    get evenly spaced slots instead of all waking at once.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float, optional): Maximum burst size, defaults to one second of tokens.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """
+        Change the refill rate, keeping the tokens accrued so far.
+
+        Args:
+            rate (float): New number of tokens added per second.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """
+        Take one token and return how long the caller must wait before using it.
+
+        Returns:
+            float: Delay in seconds, 0 if a token was available.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Wait in the event loop until a token is available."""
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by nameserver address, with adaptive backoff.
+    """
+
+    def __init__(self, servers=(), qps=DEFAULT_QPS, min_qps=DEFAULT_MIN_QPS,
+                 error_threshold=DEFAULT_ERROR_THRESHOLD, window=DEFAULT_WINDOW):
+        """
+        Args:
+            servers (iterable, optional): Nameserver addresses to create buckets for up front.
+            qps (float, optional): Ceiling on queries per second per server.
+            min_qps (float, optional): Floor for the adaptive backoff.
+            error_threshold (float, optional): Failure share in the window that halves the rate.
+            window (int, optional): Number of recent outcomes tracked per server.
+        """
+        self.qps = float(qps)
+        self.min_qps = min(float(min_qps), self.qps)
+        self.error_threshold = error_threshold
+        self.window = window
+        self.buckets = {}
+        self.outcomes = {}
+        self.lock = threading.Lock()
+        for server in servers:
+            self.bucket(server)
+
+    def bucket(self, server):
+        """
+        Return the token bucket for *server*, creating it on first use.
+
+        Args:
+            server (str): Nameserver address.
+
+        Returns:
+            TokenBucket: The server's bucket.
+        """
+        with self.lock:
+            if server not in self.buckets:
+                self.buckets[server] = TokenBucket(self.qps)
+                self.outcomes[server] = collections.deque(maxlen=self.window)
+            return self.buckets[server]
+
+    def acquire(self, server):
+        """
+        Block until a query may be sent to *server*.
+
+        Args:
+            server (str): Nameserver address.
+        """
+        self.bucket(server).acquire()
+
+    async def acquire_async(self, server):
+        """
+        Wait in the event loop until a query may be sent to *server*.
+
+        Args:
+            server (str): Nameserver address.
+        """
+        await self.bucket(server).acquire_async()
+
+    def record(self, server, failed):
+        """
+        Record the outcome of a query and adapt the server's rate.
+
+        Args:
+            server (str): Nameserver address.
+            failed (bool): True for a timeout or SERVFAIL, False for any real answer.
+        """
+        bucket = self.bucket(server)
+        with self.lock:
+            outcomes = self.outcomes[server]
+            outcomes.append(failed)
+            rate = bucket.rate
+            if failed and len(outcomes) >= self.window // 2 and \
+                    sum(outcomes) / len(outcomes) >= self.error_threshold:
+                rate = max(self.min_qps, rate / 2)
+                outcomes.clear()
+            elif not failed:
+                rate = min(self.qps, rate + self.qps / self.window)
+        if rate != bucket.rate:
+            bucket.set_rate(rate)
+
+    def record_exception(self, server, exc):
+        """
+        Record a failed query, counting it against the server only if it was an upstream error.
+
+        Args:
+            server (str): Nameserver address.
+            exc (Exception): Exception raised by the lookup.
+        """
+        self.record(server, is_upstream_error(exc))
+
+
+def setup_rate_limiter(resolvers, qps=DEFAULT_QPS):
+    """
+    Create a rate limiter with one token bucket for each resolver's nameserver.
+
+    Args:
+        resolvers (list): Resolvers as returned by setup_resolvers().
+        qps (float, optional): Ceiling on queries per second per server.
+
+    Returns:
+        RateLimiter: Limiter covering every nameserver in *resolvers*.
+    """
+    return RateLimiter([resolver.nameservers[0] for resolver in resolvers], qps=qps)
@@ -0,0 +1,126 @@
+"""
+Bulk generation of the 3GPP realm names the sweeps look up.
+
+A realm is 'wlan.mncXXX.mccYYY.3gppnetwork.org' (or the pub. variant), with
+an optional 'nid<NID>' label for Stand-alone Non-Public Networks and an
+optional service ID in front. Probing the full MCC x MNC space means up to
+a million of them, times every nid/service_id variant. Formatting each one
+from scratch costs more than the rest of the pipeline before the resolver,
+so build_realms() formats every 'mncXXX' and 'mccYYY' label once and builds
+whole batches by joining the precomputed pieces, and validate_hosts()
+checks each batch with a single precompiled regular expression. iter_realms()
+does both batch by batch, lazily, so the resolver can start on the first
+batch before the later ones exist.
+
+REALM_SUFFIX, the zone the public realms live in, is defined here for the
+other sweep scripts to share.
+"""
+
+import itertools
+import logging
+
+from lookup_engine import validate_hosts
+
+log = logging.getLogger(__name__)
+
+# Zone of the public realms
+REALM_SUFFIX = "pub.3gppnetwork.org"
+# Realms built and validated at a time by iter_realms()
+DEFAULT_BATCH_SIZE = 1000
+
+
+class _Labels(dict):
+    """Precomputed 'mncXXX'/'mccYYY' labels, formatted on demand for unusual values."""
+
+    def __init__(self, prefix):
+        super().__init__((value, f"{prefix}{value:03d}") for value in range(1000))
+        self.prefix = prefix
+
+    def __missing__(self, value):
+        return f"{self.prefix}{value:03d}"
+
+
+MNC_LABELS = _Labels('mnc')
+MCC_LABELS = _Labels('mcc')
+
+
+def realm_affixes(nid=None, service_id=None, use_pub=False):
+    """
+    Build the parts of a realm around its MNC and MCC labels.
+
+    Args:
+        nid (str, optional): NID identifying a Stand-alone Non-Public Network (SNPN).
+        service_id (str, optional): Service ID that describes the service or operation.
+        use_pub (bool, optional): Whether to use 'pub.3gppnetwork.org' instead of '3gppnetwork.org'.
+
+    Returns:
+        tuple: Prefix up to the MNC label, e.g. 'wlan.', and suffix after the MCC label,
+        e.g. '.pub.3gppnetwork.org'.
+    """
+    prefix = f"{service_id}.wlan." if service_id else "wlan."
+    if nid:
+        prefix += f"nid{nid}."
+    return prefix, f".{REALM_SUFFIX}" if use_pub else ".3gppnetwork.org"
+
+
+def build_realms(mccs, mncs, nid=None, service_id=None, use_pub=False):
+    """
+    Build the realms of many MCC-MNC pairs at once.
+
+    Args:
+        mccs (sequence): Mobile Country Codes (ints).
+        mncs (sequence): Mobile Network Codes (ints), paired with *mccs* by position.
+        nid (str, optional): NID identifying a Stand-alone Non-Public Network (SNPN).
+        service_id (str, optional): Service ID that describes the service or operation.
+        use_pub (bool, optional): Whether to use 'pub.3gppnetwork.org' instead of '3gppnetwork.org'.
+
+    Returns:
+        list: Realm of each pair, the same names construct_realm_url() in main.py builds.
+    """
+    prefix, suffix = realm_affixes(nid, service_id, use_pub)
+    return [f"{prefix}{MNC_LABELS[mnc]}.{MCC_LABELS[mcc]}{suffix}" for mcc, mnc in zip(mccs, mncs)]
+
+
+def candidate_pairs(mccs=range(1000), mncs=range(1000)):
+    """
+    Lazily enumerate MCC-MNC candidates.
+
+    Args:
+        mccs (iterable, optional): Mobile Country Codes, all 1000 by default.
+        mncs (iterable, optional): Mobile Network Codes tried under each MCC, all 1000 by default.
+
+    Returns:
+        iterator: (mcc, mnc) tuples, MCC by MCC.
+    """
+    return itertools.product(mccs, sorted(set(mncs)))
+
+
+def iter_realms(pairs, nid=None, service_id=None, use_pub=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Lazily build and validate realms for a stream of MCC-MNC pairs, batch by batch.
+
+    Realms that are not valid host names, e.g. because of characters in
+    *nid* or *service_id*, are logged and skipped.
+
+    Args:
+        pairs (iterable): (mcc, mnc) tuples, e.g. from candidate_pairs().
+        nid (str, optional): NID identifying a Stand-alone Non-Public Network (SNPN).
+        service_id (str, optional): Service ID that describes the service or operation.
+        use_pub (bool, optional): Whether to use 'pub.3gppnetwork.org' instead of '3gppnetwork.org'.
+        batch_size (int, optional): Pairs taken from *pairs* at a time.
+
+    Yields:
+        tuple: ((mcc, mnc), realm) pairs, ready for LookupEngine.resolve_many_async().
+    """
+    pairs = iter(pairs)
+    while True:
+        batch = list(itertools.islice(pairs, batch_size))
+        if not batch:
+            return
+        realms = build_realms([mcc for mcc, _ in batch], [mnc for _, mnc in batch], nid, service_id, use_pub)
+        for pair, realm, valid in zip(batch, realms, validate_hosts(realms)):
+            if valid:
+                yield pair, realm
+            else:
+                log.warning("Skipping invalid realm %s", realm)
+
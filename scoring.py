@@ -0,0 +1,226 @@
+"""
+Adaptive scoring of the upstream DNS servers.
+
+Each server keeps an exponentially weighted moving average (EWMA) of its
+latency and of its transient failure rate (timeouts, SERVFAIL). Its score
+is the expected cost of asking it: the average latency plus the failure
+rate times the cost of a failed attempt. Lookups try servers in score
+order, so the healthiest upstream is always asked first.
+
+A server that keeps failing is ejected: it moves to the back of the order,
+where it is only asked once every other server has failed. When the
+ejection expires, the next lookup sends it one probe. A good answer
+reinstates it, and another failure ejects it again for twice as long. A
+probe cancelled by a hedged lookup does neither; it is sent again later.
+
+Scores are saved next to the DNS answer cache at the end of a run and
+loaded by the next one, so a server that was slow or filtering from the
+CI runner's network starts at the back straight away.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from checkpoint import write_json_atomic
+from dns_cache import DEFAULT_CACHE_PATH
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SCORES_PATH = os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), 'resolver_scores.json')
+# Weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.1
+# Cost in seconds charged for a failed attempt, roughly one query lifetime
+DEFAULT_FAILURE_COST = 5.0
+# A server is ejected after this many failures in a row...
+EJECT_CONSECUTIVE_FAILURES = 5
+# ...or once its failure rate reaches this share after enough samples
+EJECT_ERROR_RATE = 0.5
+EJECT_MIN_SAMPLES = 10
+# First ejection period in seconds, doubled on every ejection in a row
+EJECT_SECONDS = 30
+MAX_EJECT_SECONDS = 600
+# Servers scoring within this factor of the best one share the load
+FAST_TIER_FACTOR = 2.0
+
+
+def new_score():
+    """
+    Returns:
+        dict: The statistics of a server that has not been measured yet.
+    """
+    return {'latency': None, 'error_rate': 0.0, 'samples': 0, 'failures': 0,
+            'ejections': 0, 'ejected_until': None, 'probe_sent': None}
+
+
+class ResolverScores:
+    """
+    Thread-safe EWMA latency and failure rate per nameserver, with ejection.
+    """
+
+    def __init__(self, path=None, alpha=EWMA_ALPHA, failure_cost=DEFAULT_FAILURE_COST):
+        """
+        Args:
+            path (str, optional): File the scores are loaded from and saved to.
+            alpha (float, optional): Weight of the newest sample in the moving averages.
+            failure_cost (float, optional): Seconds charged for a failed attempt.
+        """
+        self.path = path
+        self.alpha = alpha
+        self.failure_cost = failure_cost
+        self.servers = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for server, score in json.load(file).items():
+                    self.servers[server] = dict(new_score(), **score)
+
+    def _entry(self, server):
+        if server not in self.servers:
+            self.servers[server] = new_score()
+        return self.servers[server]
+
+    def record(self, server, seconds, failed):
+        """
+        Record the outcome of one query and eject or reinstate the server.
+
+        Args:
+            server (str): Nameserver address.
+            seconds (float): Time the query took.
+            failed (bool): True for a transient failure (timeout, SERVFAIL, other error).
+        """
+        now = time.time()
+        with self.lock:
+            entry = self._entry(server)
+            entry['samples'] += 1
+            entry['error_rate'] += self.alpha * (float(failed) - entry['error_rate'])
+            if not failed:
+                entry['latency'] = seconds if entry['latency'] is None else \
+                    entry['latency'] + self.alpha * (seconds - entry['latency'])
+                entry['failures'] = 0
+                if entry['probe_sent'] is not None or entry['ejected_until'] is None:
+                    entry['ejections'] = 0
+                    entry['ejected_until'] = None
+                    entry['probe_sent'] = None
+                return
+            entry['failures'] += 1
+            probing = entry['probe_sent'] is not None
+            if probing or entry['failures'] >= EJECT_CONSECUTIVE_FAILURES or \
+                    (entry['samples'] >= EJECT_MIN_SAMPLES and entry['error_rate'] >= EJECT_ERROR_RATE):
+                if entry['ejected_until'] is None or probing:
+                    entry['ejections'] += 1
+                    period = min(MAX_EJECT_SECONDS, EJECT_SECONDS * 2 ** (entry['ejections'] - 1))
+                    entry['ejected_until'] = now + period
+                    log.warning("Ejecting resolver %s for %d s (failure rate %.0f%%, %d failures in a row)",
+                                server, period, entry['error_rate'] * 100, entry['failures'])
+                entry['probe_sent'] = None
+
+    def record_cancelled(self, server, seconds):
+        """
+        Record a query that was cancelled before it completed, e.g. the loser of a hedged race.
+
+        Only the latency average takes the sample, as a lower bound of the
+        server's latency. The query neither succeeded nor failed, so the failure
+        count and rate, the ejection state and any probe in flight are left
+        alone; an unanswered probe is sent again once it is overdue.
+
+        Args:
+            server (str): Nameserver address.
+            seconds (float): Time the query had been running.
+        """
+        with self.lock:
+            entry = self._entry(server)
+            entry['latency'] = seconds if entry['latency'] is None else \
+                entry['latency'] + self.alpha * (seconds - entry['latency'])
+
+    def score(self, server):
+        """
+        Get the expected cost of asking *server*.
+
+        Args:
+            server (str): Nameserver address.
+
+        Returns:
+            float: Average latency plus failure rate times the failure cost, in seconds;
+            0 for a server that has not been asked yet, so it is measured early.
+        """
+        with self.lock:
+            entry = self.servers.get(server)
+            if not entry:
+                return 0.0
+            return (entry['latency'] or 0.0) + entry['error_rate'] * self.failure_cost
+
+    def _state(self, server, now):
+        """Return 'healthy', 'probe' (ejection expired, no probe in flight) or 'ejected'."""
+        entry = self.servers.get(server)
+        if not entry or entry['ejected_until'] is None:
+            return 'healthy'
+        if now < entry['ejected_until']:
+            return 'ejected'
+        if entry['probe_sent'] is None or now - entry['probe_sent'] > 2 * self.failure_cost:
+            return 'probe'
+        return 'ejected'
+
+    def order(self, resolvers, offset=0):
+        """
+        Sort resolvers into the order their servers should be asked.
+
+        A server due for re-probing comes first (for this one lookup only), then
+        healthy servers by score, then ejected ones. Healthy servers scoring
+        within FAST_TIER_FACTOR of the best one take turns in first place by
+        *offset*, so concurrent lookups spread over equally good servers.
+
+        Args:
+            resolvers (list): Resolvers with a single nameserver each.
+            offset (int, optional): Rotation applied to the fastest tier.
+
+        Returns:
+            list: The resolvers in the order they should be tried.
+        """
+        now = time.time()
+        probe, healthy, ejected = [], [], []
+        with self.lock:
+            for resolver in resolvers:
+                server = resolver.nameservers[0]
+                state = self._state(server, now)
+                if state == 'probe' and not probe:
+                    self._entry(server)['probe_sent'] = now
+                    probe.append(resolver)
+                elif state == 'healthy':
+                    healthy.append(resolver)
+                else:
+                    ejected.append(resolver)
+        scores = {resolver.nameservers[0]: self.score(resolver.nameservers[0]) for resolver in healthy}
+        healthy.sort(key=lambda resolver: scores[resolver.nameservers[0]])
+        if healthy:
+            best = scores[healthy[0].nameservers[0]]
+            tier = [resolver for resolver in healthy if scores[resolver.nameservers[0]] <= best * FAST_TIER_FACTOR]
+            shift = offset % len(tier)
+            healthy = tier[shift:] + tier[:shift] + healthy[len(tier):]
+        return probe + healthy + ejected
+
+    def ejected(self):
+        """
+        Returns:
+            list: Nameservers currently ejected.
+        """
+        now = time.time()
+        with self.lock:
+            return sorted(server for server in self.servers if self._state(server, now) != 'healthy')
+
+    def save(self, path=None):
+        """
+        Save the scores for the next run.
+
+        Args:
+            path (str, optional): Destination, the file the scores were loaded from by default.
+        """
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self.lock:
+            servers = {server: dict(entry, probe_sent=None) for server, entry in self.servers.items()}
+        write_json_atomic(servers, path, indent=4)
@@ -0,0 +1,137 @@
+"""
+Sharded PLMN sweep across several processes or CI jobs.
+
+The PLMN keyspace is partitioned by MCC: an entry belongs to shard
+``MCC % shards``, so every shard owns whole MCC subtrees (which keeps the
+--enumerate pruning per shard) and the split is the same on every machine.
+Each shard is swept by ``main.py --shard I --shards N``, which writes its
+results to data/shards/mccmnc.shard-I-of-N.json instead of the published
+files, and ``merge`` folds the shard files back into data/mccmnc.bin and
+data/mccmnc.json. ``main.py --workers N`` does both on one machine, with a
+worker process per shard.
+
+Usage:
+    # N worker processes on one machine, merged at the end
+    python main.py --workers 4
+
+    # N CI matrix jobs, each uploading data/shards/ as an artifact
+    python main.py --shard ${{ matrix.shard }} --shards 4
+    # ... then one job that downloads the artifacts and runs
+    python shard.py merge --shards 4
+"""
+
+import argparse
+import logging
+import os
+
+from changes import record_changes
+from checkpoint import load_json_file
+from logconfig import add_logging_arguments, setup_logging_from_args
+from plmn_store import load_plmn_data, save_plmn_data
+
+log = logging.getLogger(__name__)
+
+# Where sharded sweeps keep their per-shard results, relative to the repository
+SHARD_DIR = os.path.join('data', 'shards')
+
+
+def shard_of(mcc, shards):
+    """
+    Pick the shard an MCC belongs to.
+
+    Args:
+        mcc (str or int): Mobile Country Code.
+        shards (int): Number of shards.
+
+    Returns:
+        int: Shard index from 0 to shards - 1.
+    """
+    return int(mcc) % shards
+
+
+def shard_entries(entries, shard, shards):
+    """
+    Select the entries that belong to one shard.
+
+    Args:
+        entries (dict): MCC-MNC entries keyed by PLMN ID.
+        shard (int): Shard index.
+        shards (int): Number of shards.
+
+    Returns:
+        dict: The subset of *entries* whose MCC falls into *shard*.
+    """
+    return {key: value for key, value in entries.items() if shard_of(value['MCC'], shards) == shard}
+
+
+def shard_path(shard, shards, base_dir, suffix='.json'):
+    """
+    Build the path of a shard's result file, creating data/shards/ if needed.
+
+    Args:
+        shard (int): Shard index.
+        shards (int): Number of shards.
+        base_dir (str): Repository directory.
+        suffix (str, optional): File suffix, e.g. '.journal.jsonl' for the shard's journal.
+
+    Returns:
+        str: Path such as 'data/shards/mccmnc.shard-0-of-4.json'.
+    """
+    directory = os.path.join(base_dir, SHARD_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"mccmnc.shard-{shard}-of-{shards}{suffix}")
+
+def merge_shards(shards, base_dir):
+    """
+    Fold the shard result files into the columnar store and the published JSON.
+
+    Entries of a missing shard keep their previous results. What changed is
+    appended to the change feed, as after an unsharded sweep (see changes.py).
+
+    Args:
+        shards (int): Number of shards the sweep was split into.
+        base_dir (str): Repository directory.
+
+    Returns:
+        int: Number of shard files merged.
+    """
+    local_json_path = os.path.join(base_dir, 'data', 'mccmnc.json')
+    local_store_path = os.path.join(base_dir, 'data', 'mccmnc.bin')
+    local_data = load_plmn_data(local_store_path, local_json_path)
+
+    merged = []
+    swept = set()
+    for shard in range(shards):
+        path = shard_path(shard, shards, base_dir)
+        if not os.path.exists(path):
+            log.warning("%s is missing, keeping the previous results of shard %d.", path, shard)
+            continue
+        shard_data = load_json_file(path)
+        local_data.update(shard_data)
+        swept.update(shard_data)
+        merged.append(path)
+        log.info("Merged %d entries from %s", len(shard_data), path)
+
+    if merged:
+        save_plmn_data(local_data, local_store_path, local_json_path)
+        record_changes(local_data, swept, os.path.join(base_dir, 'data', 'change_index.json'),
+                       os.path.join(base_dir, 'data', 'changes.jsonl'))
+        for path in merged:
+            os.remove(path)
+    return len(merged)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the results of a sharded PLMN sweep.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    merge_parser = subparsers.add_parser('merge', help="merge shard result files into data/mccmnc.json")
+    merge_parser.add_argument('--shards', type=int, required=True,
+                              help="number of shards the sweep was split into")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+    merge_shards(args.shards, os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Referral handling of the authoritative NAPTR engine, against local mock nameservers.
+
+Usage:
+    python -m unittest test_authoritative
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+import dns.flags
+import dns.message
+import dns.name
+import dns.resolver
+import dns.rrset
+
+from bench import MockNameserver, SyntheticZone
+from dns_cache import PersistentCache
+from lookup import NODATA, REFERRAL, SUCCESS, classify_exception
+from lookup_engine import LookupEngine
+from scoring import ResolverScores
+
+REALM = 'wlan.mnc280.mcc310.pub.3gppnetwork.org'
+
+
+class ReferralZone(SyntheticZone):
+    """
+    Parent zone that delegates every realm to other nameservers instead of answering for it.
+    """
+
+    def answer(self, request):
+        response = dns.message.make_response(request)
+        qname = request.question[0].name
+        zone = dns.name.Name(qname.labels[-4:])
+        response.authority.append(dns.rrset.from_text(zone, 3600, 'IN', 'NS', f"ns1.{zone}"))
+        return response
+
+
+class ReferralTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = PersistentCache(os.path.join(self.directory.name, 'dns_cache.sqlite'))
+        self.parent = MockNameserver(ReferralZone())
+        self.recursive = MockNameserver(SyntheticZone(hit_ratio=1.0))
+        parent_port = self.parent.start()
+        recursive_port = self.recursive.start()
+        engine_args = dict(hedge=False, cache=self.cache, scores=ResolverScores())
+        recursive = LookupEngine(servers=['127.0.0.1'], port=recursive_port, **engine_args)
+        self.engine = LookupEngine(servers=['127.0.0.1'], port=parent_port, srv_engine=recursive, **engine_args)
+
+    def tearDown(self):
+        self.engine.close()
+        self.parent.stop()
+        self.recursive.stop()
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_classify_referral(self):
+        request = dns.message.make_query(REALM, 'NAPTR')
+        referral = ReferralZone().answer(request)
+        self.assertEqual(classify_exception(dns.resolver.NoAnswer(response=referral)), REFERRAL)
+        referral.flags |= dns.flags.AA
+        self.assertEqual(classify_exception(dns.resolver.NoAnswer(response=referral)), NODATA)
+
+    def test_referral_falls_back_to_recursive(self):
+        naptrs, status, _ = self.engine.resolve_naptr(REALM)
+        self.assertTrue(naptrs)
+        self.assertEqual(status, SUCCESS)
+        found, host, port, _, _ = self.engine.resolve(REALM)
+        self.assertTrue(found)
+        self.assertTrue(host.endswith('radsec.example'))
+        self.assertEqual(port, 2083)
+        self.assertGreater(self.recursive.zone.queries, 0)
+
+    def test_referral_falls_back_to_recursive_async(self):
+        found, host, port, _, _ = asyncio.run(self.engine.resolve_async(REALM))
+        self.assertTrue(found)
+        self.assertEqual(port, 2083)
+
+    def test_referral_without_recursive_engine(self):
+        self.engine.srv_engine = None
+        self.assertEqual(self.engine.resolve_naptr(REALM), (None, None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Ejection and re-probing of resolvers in hedged lookups, against local mock nameservers.
+
+Usage:
+    python -m unittest test_scoring
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from bench import MockNameserver, SyntheticZone
+from dns_cache import PersistentCache
+from lookup import SUCCESS
+from lookup_engine import LookupEngine
+from scoring import EJECT_CONSECUTIVE_FAILURES, ResolverScores
+
+REALM = 'wlan.mnc280.mcc310.pub.3gppnetwork.org'
+HEALTHY = '127.0.0.1'
+BLACKHOLED = '127.0.0.2'
+
+
+class HedgedProbeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = PersistentCache(os.path.join(self.directory.name, 'dns_cache.sqlite'))
+        self.healthy = MockNameserver(SyntheticZone(hit_ratio=1.0), HEALTHY)
+        port = self.healthy.start()
+        self.blackholed = MockNameserver(SyntheticZone(hit_ratio=1.0, loss_ratio=1.0), BLACKHOLED, port)
+        self.blackholed.start()
+        self.scores = ResolverScores()
+        self.engine = LookupEngine(servers=[HEALTHY, BLACKHOLED], port=port, lifetime=2.0,
+                                   cache=self.cache, scores=self.scores)
+
+    def tearDown(self):
+        self.engine.close()
+        self.healthy.stop()
+        self.blackholed.stop()
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_cancelled_probe_keeps_server_ejected(self):
+        # Ejected once, and the ejection has just run out: the next lookup probes it first
+        entry = self.scores._entry(BLACKHOLED)
+        entry.update(failures=EJECT_CONSECUTIVE_FAILURES, ejections=1, ejected_until=time.time() - 1)
+
+        naptrs, status, _ = asyncio.run(self.engine.resolve_naptr_async(REALM))
+
+        self.assertTrue(naptrs)
+        self.assertEqual(status, SUCCESS)
+        self.assertGreater(self.blackholed.zone.dropped, 0)
+        entry = self.scores.servers[BLACKHOLED]
+        self.assertEqual(entry['ejections'], 1)
+        self.assertEqual(entry['failures'], EJECT_CONSECUTIVE_FAILURES)
+        self.assertIsNotNone(entry['probe_sent'])
+        self.assertEqual(self.scores.ejected(), [BLACKHOLED])
+
+    def test_cancelled_attempt_is_a_latency_sample(self):
+        self.scores.record_cancelled(BLACKHOLED, 0.5)
+        entry = self.scores.servers[BLACKHOLED]
+        self.assertEqual(entry['latency'], 0.5)
+        self.assertEqual(entry['samples'], 0)
+        self.assertEqual(entry['error_rate'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
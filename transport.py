@@ -0,0 +1,288 @@
+"""
+Pipelined DNS over persistent TCP and TLS connections (RFC 7766, RFC 7858).
+
+By default every lookup is a separate UDP exchange: a lost datagram costs a
+full retransmit timeout, and a truncated answer opens a fresh TCP connection
+for a single query. With the 'tcp' or 'tls' transport, the asyncio lookups
+instead share one long-lived connection per upstream. Many queries are
+written to it back to back without waiting for the previous answer, and
+the answers, which may arrive in any order, are matched to their queries
+by message ID. The TCP (and TLS) handshake is paid once per upstream per
+sweep, not once per query, and a lost segment is retransmitted by TCP
+within milliseconds instead of after a query timeout.
+
+The resolvers' persistent answer cache is consulted and filled exactly as
+dnspython does for UDP lookups, so the transport makes no difference to
+cached results. A connection that the server closes or that breaks is
+reopened on the next query; queries that were in flight on it are retried
+once on the new connection (RFC 7766 section 6.2.1). Connections belong to
+the event loop that opened them and are closed when asyncio.run() cancels
+their reader task at the end of the sweep.
+"""
+
+import asyncio
+import logging
+import random
+import ssl
+import struct
+
+import dns.exception
+import dns.message
+import dns.name
+import dns.query
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+
+from dns_cache import cached_answer
+
+log = logging.getLogger(__name__)
+
+# Transports a LookupEngine can use for its asyncio lookups
+TRANSPORTS = ('udp', 'tcp', 'tls')
+# Port DNS over TLS listens on (RFC 7858)
+DOT_PORT = 853
+# Seconds allowed for opening a connection, TLS handshake included
+CONNECT_TIMEOUT = 5.0
+
+
+class PipelinedConnection:
+    """
+    One persistent TCP or TLS connection to a nameserver, shared by many concurrent queries.
+    """
+
+    def __init__(self, host, port, ssl_context=None):
+        """
+        Args:
+            host (str): Nameserver address.
+            port (int): Port the nameserver listens on.
+            ssl_context (ssl.SSLContext, optional): Wrap the connection in TLS (DNS over TLS).
+        """
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.writer = None
+        self.reader_task = None
+        self.pending = {}
+        self.connect_lock = asyncio.Lock()
+        self.connections_opened = 0
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def _connect(self):
+        async with self.connect_lock:
+            if self.connected:
+                return
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl_context,
+                                        server_hostname=self.host if self.ssl_context else None),
+                CONNECT_TIMEOUT)
+            self.writer = writer
+            self.reader_task = asyncio.ensure_future(self._read_responses(reader, writer))
+            self.connections_opened += 1
+            log.debug("Opened %s connection to %s:%d", 'TLS' if self.ssl_context else 'TCP',
+                      self.host, self.port)
+
+    async def _read_responses(self, reader, writer):
+        """Hand every response on the connection to the query waiting for its message ID."""
+        error = None
+        try:
+            while True:
+                length, = struct.unpack('!H', await reader.readexactly(2))
+                wire = await reader.readexactly(length)
+                if length < 2:
+                    continue
+                future = self.pending.pop(struct.unpack('!H', wire[:2])[0], None)
+                if future and not future.done():
+                    future.set_result(wire)
+        except (asyncio.IncompleteReadError, OSError) as e:
+            error = e
+        finally:
+            writer.close()
+            if self.writer is writer:
+                self.writer = None
+            # The server closed the connection (idle timeout, query limit) or it broke
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionResetError(
+                        f"connection to {self.host}:{self.port} closed: {error or 'shut down'}"))
+            log.debug("Closed connection to %s:%d with %d queries in flight",
+                      self.host, self.port, len(pending))
+
+    def _message_id(self):
+        while True:
+            message_id = random.randint(0, 0xffff)
+            if message_id not in self.pending:
+                return message_id
+
+    async def query(self, request, timeout):
+        """
+        Send one query over the connection and wait for its response.
+
+        Args:
+            request (dns.message.Message): Query; its message ID is replaced by a free one.
+            timeout (float): Seconds to wait for the response, connecting included.
+
+        Returns:
+            dns.message.Message: The response.
+
+        Raises:
+            dns.exception.Timeout: No response in time.
+            OSError: The connection could not be opened or was closed twice in a row.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        for retry in (False, True):
+            try:
+                return await asyncio.wait_for(self._exchange(request), deadline - loop.time())
+            except asyncio.TimeoutError:
+                raise dns.exception.Timeout(timeout=timeout) from None
+            except ConnectionResetError:
+                # Closed under the query; RFC 7766 6.2.1 says to retry it on a new connection
+                if retry or deadline <= loop.time():
+                    raise
+
+    async def _exchange(self, request):
+        if not self.connected:
+            await self._connect()
+        request.id = self._message_id()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request.id] = future
+        try:
+            wire = request.to_wire()
+            self.writer.write(struct.pack('!H', len(wire)) + wire)
+            await self.writer.drain()
+            response = dns.message.from_wire(await future)
+        finally:
+            # A cancelled (hedged) or timed-out query gives its ID back
+            if self.pending.get(request.id) is future:
+                del self.pending[request.id]
+            if not future.done():
+                future.cancel()
+            elif not future.cancelled():
+                # The connection may have failed while the query was still being written
+                future.exception()
+        if not request.is_response(response):
+            raise dns.query.BadResponse
+        return response
+
+    async def close(self):
+        """Close the connection; queries still in flight fail."""
+        if self.reader_task:
+            self.reader_task.cancel()
+            await asyncio.gather(self.reader_task, return_exceptions=True)
+
+
+class ConnectionPool:
+    """
+    Persistent pipelined connections, one per nameserver, for the running event loop.
+    """
+
+    def __init__(self, transport='tcp', port=None):
+        """
+        Args:
+            transport (str, optional): 'tcp' or 'tls'.
+            port (int, optional): Port to connect to, by default the resolver's port for 'tcp'
+                and DOT_PORT for 'tls'.
+        """
+        if transport not in ('tcp', 'tls'):
+            raise ValueError(f"Unsupported pipelined transport: {transport}")
+        self.transport = transport
+        self.port = port
+        self.ssl_context = ssl.create_default_context() if transport == 'tls' else None
+        self._loop = None
+        self.connections = {}
+
+    def connection(self, resolver):
+        """
+        Return the connection to *resolver*'s nameserver, creating it for a new event loop.
+
+        Args:
+            resolver (dns.asyncresolver.Resolver): Resolver with a single nameserver.
+
+        Returns:
+            PipelinedConnection: Shared connection to that nameserver.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self.connections = {}
+        server = resolver.nameservers[0]
+        if server not in self.connections:
+            port = self.port or (DOT_PORT if self.transport == 'tls' else resolver.port)
+            self.connections[server] = PipelinedConnection(server, port, self.ssl_context)
+        return self.connections[server]
+
+    def connections_opened(self):
+        """
+        Returns:
+            int: Connections opened in the current event loop, reconnections included.
+        """
+        return sum(connection.connections_opened for connection in self.connections.values())
+
+    async def close(self):
+        """Close every connection of the current event loop."""
+        await asyncio.gather(*(connection.close() for connection in self.connections.values()))
+
+    async def resolve(self, resolver, name, rdtype, lifetime):
+        """
+        Resolve *name* over the pipelined connection to *resolver*'s nameserver.
+
+        Behaves like ``resolver.resolve(name, rdtype, lifetime=lifetime)``: the
+        resolver's cache is consulted first and filled with the answer, including
+        NXDOMAIN and NODATA answers, and the same exceptions are raised.
+
+        Args:
+            resolver (dns.asyncresolver.Resolver): Resolver with a single nameserver.
+            name (str): Name to look up.
+            rdtype (str): Record type, e.g. 'NAPTR'.
+            lifetime (float): Seconds the query may take.
+
+        Returns:
+            dns.resolver.Answer: The answer.
+
+        Raises:
+            dns.resolver.NXDOMAIN: The name does not exist.
+            dns.resolver.NoAnswer: The name has no records of that type.
+            dns.resolver.NoNameservers: The server answered SERVFAIL, REFUSED or garbage.
+            dns.exception.Timeout: No answer in time.
+        """
+        qname = dns.name.from_text(name)
+        rdtype = dns.rdatatype.from_text(rdtype)
+        rdclass = dns.rdataclass.IN
+        cache = resolver.cache
+        answer = cached_answer(cache, qname, rdtype)
+        if answer is not None:
+            return answer
+
+        request = dns.message.make_query(qname, rdtype, rdclass)
+        request.use_edns(resolver.edns, resolver.ednsflags, resolver.payload, options=resolver.ednsoptions)
+        if resolver.flags is not None:
+            request.flags = resolver.flags
+        connection = self.connection(resolver)
+        try:
+            response = await connection.query(request, lifetime)
+        except (OSError, EOFError, dns.exception.FormError, dns.query.BadResponse) as e:
+            raise dns.resolver.NoNameservers(
+                request=request, errors=[(connection.host, True, connection.port, e, None)]) from None
+
+        rcode = response.rcode()
+        if rcode == dns.rcode.NXDOMAIN:
+            if cache:
+                cache.put((qname, dns.rdatatype.ANY, rdclass),
+                          dns.resolver.Answer(qname, dns.rdatatype.ANY, rdclass, response))
+            raise dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+        if rcode != dns.rcode.NOERROR:
+            raise dns.resolver.NoNameservers(
+                request=request, errors=[(connection.host, True, connection.port,
+                                          dns.rcode.to_text(rcode), response)])
+        answer = dns.resolver.Answer(qname, rdtype, rdclass, response, connection.host, connection.port)
+        if cache:
+            cache.put((qname, rdtype, rdclass), answer)
+        if answer.rrset is None:
+            raise dns.resolver.NoAnswer(response=response)
+        return answer
@@ -1,84 +1,149 @@
+"""
+Render the OpenRoaming support tables into README.md, and optionally into CSV and JSON summaries.
+
+Only the supported entries are read, straight from the columnar store's
+supported-row index when it matches data/mccmnc.json (see plmn_store.py),
+plus the domain lookup results. A hash of the data going into the tables is
+kept in a comment inside the README's tables section. When the next run computes the
+same hash, it skips rendering and leaves every file untouched, so sweeps
+that only refresh last_checked/ttl values no longer rewrite the README. All
+outputs are rendered from the same pass over the data and are written
+atomically.
+
+Usage:
+    python update_readme_stats.py [--csv data/supported.csv] [--json data/summary.json] [--force]
+"""
+
+import argparse
+import csv
+import hashlib
+import io
 import json
+import logging
 import os
+import re
+
 from tabulate import tabulate
 
-# Paths to the JSON data and README file
-json_file_path = 'data/mccmnc.json'
-domain_lookup_json_path = 'data/domain_lookup_results.json'  # New JSON file for domains lookup results
-readme_file_path = 'README.md'
-
-# Load data from the mccmnc.json file
-with open(json_file_path, 'r') as file:
-    data = json.load(file)
-
-# Initialize counters and lists
-total_count = 0
-supported_count = 0
-unsupported_count = 0
-supported_list = []
-
-# Process data to calculate support stats and build the supported list
-for plmnid, details in data.items():
-    total_count += 1
-    if details.get('lookup_success'):
-        supported_count += 1
-        supported_list.append([details['NETWORK'], details['COUNTRY'], details['MCC'], details['MNC'], details['host'], details['port']])
+from checkpoint import write_json_atomic, write_text_atomic
+from logconfig import add_logging_arguments, setup_logging_from_args
+from plmn_store import DATA_DIR, DEFAULT_JSON_PATH, DEFAULT_STORE_PATH, PLMNStore, is_current
+
+log = logging.getLogger(__name__)
+
+DOMAIN_LOOKUP_JSON_PATH = os.path.join(DATA_DIR, 'domain_lookup_results.json')
+README_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'README.md')
+START_MARKER = '<!-- Tables Start -->'
+END_MARKER = '<!-- Tables End -->'
+HASH_COMMENT = re.compile(r'<!-- Input hash: ([0-9a-f]+) -->')
+CARRIER_HEADERS = ["Network", "Country", "MCC", "MNC", "Host", "Port"]
+DOMAIN_HEADERS = ["Domain", "Host", "Port"]
+
+
+def load_supported(store_path=DEFAULT_STORE_PATH, json_path=DEFAULT_JSON_PATH):
+    """
+    Load the supported carriers, straight from the columnar store's index when it is current.
+
+    Args:
+        store_path (str, optional): Location of the columnar store.
+        json_path (str, optional): Location of data/mccmnc.json, used without a current store.
+
+    Returns:
+        tuple: Total number of entries, and the supported carriers as table rows.
+    """
+    if is_current(store_path, json_path):
+        with PLMNStore(store_path) as store:
+            total_count = len(store)
+            supported_entries = [details for plmnid, details in store.supported()]
     else:
-        unsupported_count += 1
-
-# Calculate support percentages
-supported_percent = (supported_count / total_count) * 100 if total_count > 0 else 0
-unsupported_percent = (unsupported_count / total_count) * 100 if total_count > 0 else 0
-
-# Create the tables
-support_table = [
-    ["OpenRoaming Supported", f"{supported_percent:.2f}%"],
-    ["OpenRoaming Unsupported", f"{unsupported_percent:.2f}%"]
-]
-
-supported_table = supported_list
-
-# Generate markdown tables using tabulate
-support_table_md = tabulate(support_table, headers=["Status", "Percentage"], tablefmt="github")
-supported_table_md = tabulate(supported_table, headers=["Network", "Country", "MCC", "MNC", "Host", "Port"], tablefmt="github")
-
-# Load data from the domain_lookup_results.json file (New section)
-current_dir = os.path.dirname(os.path.abspath(__file__))  # Get current directory path
-domain_lookup_json_path = os.path.join(current_dir, 'data', 'domain_lookup_results.json')
-
-# Load domain lookup data
-with open(domain_lookup_json_path, 'r') as domain_file:
-    domain_lookup_data = json.load(domain_file)
-
-# Process the domain lookup data to create a table, excluding domains with null host or port,
-# and duplicating rows if host contains multiple entries.
-domain_results_list = []
-for domain, details in domain_lookup_data.items():
-    host = details.get('host')
-    port = details.get('port')
-
-    # Only add domains to the list if host and port are not None
-    if host and port:
-        # If host is a list, create a row for each host entry
-        if isinstance(host, list):
-            for individual_host in host:
-                domain_results_list.append([domain, individual_host, port])
-        else:
-            # If host is a single value, just add it as usual
-            domain_results_list.append([domain, host, port])
-
-# Sort the domain_results_list alphabetically by the 'Domain' column (first column)
-domain_results_list.sort(key=lambda x: x[0])
-
-# Generate markdown table for domain lookup results after sorting
-domain_lookup_md = tabulate(domain_results_list, headers=["Domain", "Host", "Port"], tablefmt="github")
-
-# Read the README file
-with open(readme_file_path, 'r') as file:
-    readme_content = file.read()
-
-# Prepare the updated content with tables
-tables_section = f"""
+        with open(json_path, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        total_count = len(data)
+        supported_entries = [details for details in data.values() if details.get('lookup_success')]
+    rows = [[details['NETWORK'], details['COUNTRY'], details['MCC'], details['MNC'], details['host'], details['port']]
+            for details in supported_entries]
+    return total_count, rows
+
+
+def load_domain_rows(path=DOMAIN_LOOKUP_JSON_PATH):
+    """
+    Load the domain lookup results as table rows.
+
+    Domains without a host or port are left out, and a domain whose host is
+    a list gets one row per host.
+
+    Args:
+        path (str, optional): Location of data/domain_lookup_results.json.
+
+    Returns:
+        list: [domain, host, port] rows sorted by domain.
+    """
+    if not os.path.exists(path):
+        log.warning("%s not found, the realm lookup table will be empty.", path)
+        return []
+    with open(path, 'r', encoding='utf-8') as domain_file:
+        domain_lookup_data = json.load(domain_file)
+
+    rows = []
+    for domain, details in domain_lookup_data.items():
+        host = details.get('host')
+        port = details.get('port')
+        if host and port:
+            for individual_host in host if isinstance(host, list) else [host]:
+                rows.append([domain, individual_host, port])
+    rows.sort(key=lambda row: row[0])
+    return rows
+
+
+def build_report(store_path=DEFAULT_STORE_PATH, json_path=DEFAULT_JSON_PATH,
+                 domain_path=DOMAIN_LOOKUP_JSON_PATH):
+    """
+    Collect everything the outputs are rendered from.
+
+    Args:
+        store_path (str, optional): Location of the columnar store.
+        json_path (str, optional): Location of data/mccmnc.json.
+        domain_path (str, optional): Location of data/domain_lookup_results.json.
+
+    Returns:
+        dict: Entry counts, support percentages, carrier and domain rows, and the hash of all of them.
+    """
+    total_count, carriers = load_supported(store_path, json_path)
+    domains = load_domain_rows(domain_path)
+    supported_count = len(carriers)
+    report = {
+        'total': total_count,
+        'supported': supported_count,
+        'unsupported': total_count - supported_count,
+        'supported_percent': (supported_count / total_count) * 100 if total_count > 0 else 0,
+        'unsupported_percent': ((total_count - supported_count) / total_count) * 100 if total_count > 0 else 0,
+        'carriers': carriers,
+        'domains': domains,
+    }
+    content = json.dumps(report, sort_keys=True, ensure_ascii=False)
+    report['input_hash'] = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+    return report
+
+
+def render_tables(report):
+    """
+    Render the README's tables section.
+
+    Args:
+        report (dict): Report from build_report().
+
+    Returns:
+        str: Markdown between the start and end markers, starting with the input hash comment.
+    """
+    support_table = [
+        ["OpenRoaming Supported", f"{report['supported_percent']:.2f}%"],
+        ["OpenRoaming Unsupported", f"{report['unsupported_percent']:.2f}%"]
+    ]
+    support_table_md = tabulate(support_table, headers=["Status", "Percentage"], tablefmt="github")
+    supported_table_md = tabulate(report['carriers'], headers=CARRIER_HEADERS, tablefmt="github")
+    domain_lookup_md = tabulate(report['domains'], headers=DOMAIN_HEADERS, tablefmt="github")
+    return f"""
+<!-- Input hash: {report['input_hash']} -->
 ## OpenRoaming Support Status
 
 {support_table_md}
@@ -96,13 +161,104 @@ A few realms we've identified from public certificates, public documentation, an
 {domain_lookup_md}
 """
 
-# Replace the content between the comments
-start_marker = '<!-- Tables Start -->'
-end_marker = '<!-- Tables End -->'
-updated_content = readme_content.split(start_marker)[0] + start_marker + tables_section + end_marker + readme_content.split(end_marker)[1]
 
-# Write the updated content back to the README file
-with open(readme_file_path, 'w') as file:
-    file.write(updated_content)
+def render_csv(report):
+    """
+    Args:
+        report (dict): Report from build_report().
+
+    Returns:
+        str: The supported carriers as CSV, with a header row.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(CARRIER_HEADERS)
+    writer.writerows(report['carriers'])
+    return output.getvalue()
+
+
+def render_summary(report):
+    """
+    Args:
+        report (dict): Report from build_report().
+
+    Returns:
+        dict: JSON summary with the counts, percentages, carriers and domains.
+    """
+    return {
+        'input_hash': report['input_hash'],
+        'total': report['total'],
+        'supported': report['supported'],
+        'unsupported': report['unsupported'],
+        'supported_percent': round(report['supported_percent'], 2),
+        'carriers': [dict(zip(CARRIER_HEADERS, row)) for row in report['carriers']],
+        'domains': [dict(zip(DOMAIN_HEADERS, row)) for row in report['domains']],
+    }
+
+
+def rendered_hash(readme_content):
+    """
+    Args:
+        readme_content (str): Contents of README.md.
+
+    Returns:
+        str: Input hash the README's tables were last rendered from, or None.
+    """
+    section = readme_content.partition(START_MARKER)[2].partition(END_MARKER)[0]
+    match = HASH_COMMENT.search(section)
+    return match.group(1) if match else None
+
+
+def update_readme_stats(readme_path=README_PATH, csv_path=None, summary_path=None, force=False, **paths):
+    """
+    Render the support tables into the README and any extra outputs, unless the data has not changed.
+
+    Args:
+        readme_path (str, optional): Location of README.md.
+        csv_path (str, optional): Also write the supported carriers as CSV to this file.
+        summary_path (str, optional): Also write a JSON summary to this file.
+        force (bool, optional): Render even if the input hash has not changed.
+        **paths: store_path, json_path or domain_path for build_report().
+
+    Returns:
+        bool: True if the outputs were rendered, False if they were already up to date.
+    """
+    report = build_report(**paths)
+    with open(readme_path, 'r', encoding='utf-8') as file:
+        readme_content = file.read()
+    if START_MARKER not in readme_content or END_MARKER not in readme_content:
+        raise ValueError(f"{readme_path} lacks the {START_MARKER} and {END_MARKER} markers")
+
+    extra_paths = [path for path in (csv_path, summary_path) if path]
+    if (not force and rendered_hash(readme_content) == report['input_hash']
+            and all(os.path.exists(path) for path in extra_paths)):
+        log.info("README.md tables are up to date (input hash %s), nothing to render.", report['input_hash'])
+        return False
+
+    # Replace the content between the markers
+    updated_content = (readme_content.split(START_MARKER)[0] + START_MARKER + render_tables(report)
+                       + END_MARKER + readme_content.split(END_MARKER)[1])
+    write_text_atomic(updated_content, readme_path)
+    if csv_path:
+        write_text_atomic(render_csv(report), csv_path)
+    if summary_path:
+        write_json_atomic(render_summary(report), summary_path, indent=4, ensure_ascii=False)
+    log.info("README.md has been updated with the latest OpenRoaming support tables and domain lookup results "
+             "(%d of %d entries supported).", report['supported'], report['total'])
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the OpenRoaming support tables into README.md.")
+    parser.add_argument('--readme', default=README_PATH, help="README file with the table markers")
+    parser.add_argument('--csv', dest='csv_path', metavar='PATH', help="also write the supported carriers as CSV")
+    parser.add_argument('--json', dest='summary_path', metavar='PATH', help="also write a JSON summary")
+    parser.add_argument('--force', action='store_true', help="render even if the data has not changed")
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging_from_args(args)
+    update_readme_stats(args.readme, args.csv_path, args.summary_path, force=args.force)
+
 
-print("README.md has been updated with the latest OpenRoaming support tables and domain lookup results.")
+if __name__ == "__main__":
+    main()